@@ -3,11 +3,21 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
+import signal
 from dotenv import load_dotenv
 import logging
 
 # 環境変数読み込み（.env対応）
+# utils の各モジュールは読み込み時に設定を読むので、それより先に行う
 load_dotenv()
+
+from utils.database import Database
+from utils.http_client import registry as http_clients
+from utils.message_pipeline import MessagePipeline
+from utils.scheduler import Scheduler
+from utils.broadcast import Broadcaster
+from utils import fortune
+
 TOKEN = os.getenv("DISCORD_TOKEN")
 if not TOKEN:
     raise ValueError("DISCORD_TOKEN environment variable is not set.")
@@ -26,16 +36,34 @@ intents.guilds = True
 bot = commands.Bot(command_prefix="o/", intents=intents)
 tree = bot.tree
 
+# 全Cogで共有するDBプール
+bot.database = Database()
+# on_messageを1か所で処理するパイプライン（各Cogがステージを登録する）
+bot.message_pipeline = MessagePipeline(bot)
+# 外部API（経済・ショップ・VoiceVox）へのkeep-alive付きHTTPセッション
+bot.http_clients = http_clients
+# 投票の締め切り・リマインダー・日次処理などのタイマー（期限の近いものだけを待つ）
+bot.scheduler = Scheduler()
+# 全ユーザー・全サーバーへのお知らせなどの一斉送信（DBに進捗を残して再起動後も続きから）
+bot.broadcaster = Broadcaster(bot)
+
 # 起動時イベント
 @bot.event
 async def on_ready():
     print(f"[起動完了] Logged in as {bot.user} (ID: {bot.user.id})")
+    # 途中で止まった一斉送信を再開
+    await bot.broadcaster.resume()
     try:
         synced = await tree.sync(guild=discord.Object(id=GUILD_ID)) if GUILD_ID else await tree.sync()
         print(f"[Slashコマンド同期] {len(synced)} commands synced.")
     except Exception as e:
         print(f"[同期エラー] {e}")
 
+# メッセージはパイプライン経由で各Cogへ
+@bot.listen("on_message")
+async def dispatch_message(message: discord.Message):
+    await bot.message_pipeline.dispatch(message)
+
 # サーバーのカスタム設定を自動削除する
 
 @bot.event
@@ -81,9 +109,33 @@ async def load_cogs():
 
 # メイン
 async def main():
+    # docker stop（SIGTERM）でも Ctrl+C と同じ終了処理を通す
+    shutdown_tasks = set()
+
+    def on_sigterm():
+        print("[終了] SIGTERM を受け取りました。")
+        shutdown_tasks.add(asyncio.create_task(bot.close()))
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, on_sigterm)
+    except NotImplementedError:
+        # Windows では使えない
+        pass
     async with bot:
-        await load_cogs()
-        await bot.start(TOKEN)
+        await bot.database.connect()
+        try:
+            # 今日の運勢はDBに保存（/work・冒険・おみくじで共有）
+            await fortune.store.init(bot.database.for_cog("Fortune"))
+            await bot.broadcaster.init(bot.database.for_cog("Broadcast"))
+            await load_cogs()
+            await bot.start(TOKEN)
+        finally:
+            # 先にCogを外す（cog_unload での書き出しは、DBやHTTPセッションがまだ使えるうちに行う）
+            await bot.close()
+            bot.scheduler.close()
+            bot.broadcaster.close()
+            await bot.http_clients.close()
+            await bot.database.close()
 
 # 実行
 if __name__ == "__main__":
@@ -1,18 +1,41 @@
+import os
+import asyncio
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 
+# 部屋が空になってから削除するまでの猶予（秒）
+EMPTY_GRACE_SECONDS = float(os.getenv("CUSTOM_VC_GRACE_SECONDS", 30))
+# 作成直後、作成者が入室するまでの猶予（秒）
+CREATED_GRACE_SECONDS = float(os.getenv("CUSTOM_VC_CREATED_GRACE_SECONDS", 120))
+# チャンネル削除の間隔（レート制限に引っかからないように）
+DELETE_INTERVAL = float(os.getenv("CUSTOM_VC_DELETE_INTERVAL", 0.5))
+# 取りこぼしを拾う見直しの間隔（分）
+RECONCILE_MINUTES = float(os.getenv("CUSTOM_VC_RECONCILE_MINUTES", 15))
+
+
+class CustomRoom:
+    def __init__(self, guild_id: int, vc_id: int, tc_id: int, owner_id: int):
+        self.guild_id = guild_id
+        self.vc_id = vc_id
+        self.tc_id = tc_id
+        self.owner_id = owner_id
+
+
 class CustomVC(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.check_empty_vcs.start()
-
-    def cog_unload(self):
-        self.check_empty_vcs.cancel()
+        self.pool = bot.database.for_cog("CustomVC")
+        # vc_id -> 部屋（DBの custom_vcs と同じ内容をメモリにも持つ）
+        self.rooms: dict[int, CustomRoom] = {}
+        # vc_id -> 削除予定のタイマー
+        self.delete_timers: dict[int, asyncio.TimerHandle] = {}
+        self.delete_queue: asyncio.Queue[int] = asyncio.Queue()
+        self.delete_worker: asyncio.Task | None = None
 
     async def cog_load(self):
         # 起動時に custom_vcs テーブルを作成
-        async with self.bot.get_cog("DBHandler").pool.acquire() as conn:
+        async with self.pool.acquire() as conn:
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS custom_vcs (
                     guild_id BIGINT,
@@ -21,43 +44,120 @@ class CustomVC(commands.Cog):
                     owner_id BIGINT
                 )
             """)
+            rows = await conn.fetch("SELECT guild_id, vc_id, tc_id, owner_id FROM custom_vcs")
+        self.rooms = {row["vc_id"]: CustomRoom(row["guild_id"], row["vc_id"], row["tc_id"], row["owner_id"]) for row in rows}
+        self.delete_worker = asyncio.create_task(self._delete_loop())
+        self.reconcile.change_interval(minutes=RECONCILE_MINUTES)
+        self.reconcile.start()
 
-    @tasks.loop(minutes=1)
-    async def check_empty_vcs(self):
-        db = self.bot.get_cog("DBHandler")
-        async with db.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT guild_id, vc_id, tc_id FROM custom_vcs")
-            for row in rows:
-                guild = self.bot.get_guild(row["guild_id"])
-                if not guild:
-                    await conn.execute("DELETE FROM custom_vcs WHERE guild_id = $1 AND vc_id = $2", row["guild_id"], row["vc_id"])
-                    continue
-                vc_channel = guild.get_channel(row["vc_id"])
-                tc_channel = guild.get_channel(row["tc_id"])
-                if not vc_channel or not tc_channel:
-                    await conn.execute("DELETE FROM custom_vcs WHERE guild_id = $1 AND vc_id = $2", row["guild_id"], row["vc_id"])
-                    continue
-                if len(vc_channel.members) == 0:
-                    try:
-                        await vc_channel.delete(reason="Custom VC empty, deleting")
-                    except Exception:
-                        pass
-                    try:
-                        await tc_channel.delete(reason="Custom VC empty, deleting")
-                    except Exception:
-                        pass
-                    await conn.execute("DELETE FROM custom_vcs WHERE guild_id = $1 AND vc_id = $2", row["guild_id"], row["vc_id"])
+    def cog_unload(self):
+        self.reconcile.cancel()
+        for timer in self.delete_timers.values():
+            timer.cancel()
+        self.delete_timers.clear()
+        if self.delete_worker:
+            self.delete_worker.cancel()
+
+    # === 削除の予約 ===
+
+    def schedule_delete(self, vc_id: int, delay: float = EMPTY_GRACE_SECONDS):
+        if vc_id in self.delete_timers:
+            return
+        loop = asyncio.get_running_loop()
+        self.delete_timers[vc_id] = loop.call_later(delay, self._enqueue_delete, vc_id)
+
+    def cancel_delete(self, vc_id: int):
+        timer = self.delete_timers.pop(vc_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _enqueue_delete(self, vc_id: int):
+        self.delete_timers.pop(vc_id, None)
+        self.delete_queue.put_nowait(vc_id)
+
+    async def _delete_loop(self):
+        # 溜まっている分をまとめて取り出し、間隔を空けながら消してDBは1回で更新する
+        while True:
+            batch = [await self.delete_queue.get()]
+            while not self.delete_queue.empty():
+                batch.append(self.delete_queue.get_nowait())
+            removed = []
+            for vc_id in dict.fromkeys(batch):
+                try:
+                    if await self._delete_room(vc_id):
+                        removed.append(vc_id)
+                except Exception as e:
+                    print(f"[CustomVC] vc={vc_id} の削除に失敗: {e}")
+            if removed:
+                try:
+                    async with self.pool.acquire() as conn:
+                        await conn.execute("DELETE FROM custom_vcs WHERE vc_id = ANY($1::BIGINT[])", removed)
+                except Exception as e:
+                    print(f"[CustomVC] custom_vcs の更新に失敗: {e}")
+
+    async def _delete_room(self, vc_id: int) -> bool:
+        room = self.rooms.get(vc_id)
+        if room is None:
+            return False
+        guild = self.bot.get_guild(room.guild_id)
+        vc_channel = guild.get_channel(room.vc_id) if guild else None
+        if vc_channel is not None and vc_channel.members:
+            # 猶予の間に誰かが戻ってきた
+            return False
+
+        for channel in (vc_channel, guild.get_channel(room.tc_id) if guild else None):
+            if channel is None:
+                continue
+            try:
+                await channel.delete(reason="Custom VC empty, deleting")
+            except discord.NotFound:
+                pass
+            await asyncio.sleep(DELETE_INTERVAL)
+        self.rooms.pop(vc_id, None)
+        return True
+
+    # === イベント ===
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        if before.channel == after.channel:
+            return
+        if after.channel is not None and after.channel.id in self.rooms:
+            self.cancel_delete(after.channel.id)
+        if before.channel is not None and before.channel.id in self.rooms and not before.channel.members:
+            self.schedule_delete(before.channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        # VCが手動で消されたら聞き専テキストも片付ける
+        if channel.id in self.rooms:
+            self.cancel_delete(channel.id)
+            self.delete_queue.put_nowait(channel.id)
+
+    @tasks.loop(minutes=15)
+    async def reconcile(self):
+        # イベントの取りこぼし（停止中に空になった部屋など）を拾う安全網。DBは読まない
+        for vc_id, room in list(self.rooms.items()):
+            if vc_id in self.delete_timers:
+                continue
+            guild = self.bot.get_guild(room.guild_id)
+            vc_channel = guild.get_channel(vc_id) if guild else None
+            if vc_channel is None or not vc_channel.members:
+                self._enqueue_delete(vc_id)
+
+    @reconcile.before_loop
+    async def before_reconcile(self):
+        await self.bot.wait_until_ready()
+
+    # === 作成 ===
 
     async def create_custom_vc(self, guild: discord.Guild, user: discord.Member, vc_name: str):
         db = self.bot.get_cog("DBHandler")
-        async with db.pool.acquire() as conn:
-            await db.create_table_if_needed(guild.id)
-            row = await conn.fetchrow(f"SELECT value FROM settings_{guild.id} WHERE key = $1", "custom_vc_category_id")
-            if not row:
-                raise Exception("カスタムVC用カテゴリが設定されていません。")
-            category_id = int(row["value"])
-
-        category = guild.get_channel(category_id)
+        category_id = await db.get_setting(guild.id, "custom_vc_category_id")
+        if not category_id:
+            raise Exception("カスタムVC用カテゴリが設定されていません。")
+
+        category = guild.get_channel(int(category_id))
         if not category or not isinstance(category, discord.CategoryChannel):
             raise Exception("カスタムVC用カテゴリが見つかりません。")
 
@@ -76,11 +176,14 @@ class CustomVC(commands.Cog):
         tc = await guild.create_text_channel(f"{vc_name}-listener", category=category, overwrites=tc_overwrites, reason="Listener text channel")
 
         # DB登録
-        async with db.pool.acquire() as conn:
+        async with self.pool.acquire() as conn:
             await conn.execute("""
                 INSERT INTO custom_vcs (guild_id, vc_id, tc_id, owner_id)
                 VALUES ($1, $2, $3, $4)
             """, guild.id, vc.id, tc.id, user.id)
+        self.rooms[vc.id] = CustomRoom(guild.id, vc.id, tc.id, user.id)
+        # 誰も入らなければ消す
+        self.schedule_delete(vc.id, CREATED_GRACE_SECONDS)
 
         return vc, tc
 
@@ -93,5 +196,15 @@ class CustomVC(commands.Cog):
         except Exception as e:
             await interaction.response.send_message(f"❌ エラー: {e}", ephemeral=True)
 
+    @app_commands.command(name="customvc_set_category", description="カスタムVCを作成するカテゴリを設定します（管理者専用）。")
+    @app_commands.describe(category="カスタムVCを作成するカテゴリ")
+    async def customvc_set_category(self, interaction: discord.Interaction, category: discord.CategoryChannel):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("🚫 管理者権限が必要です。", ephemeral=True)
+            return
+        db = self.bot.get_cog("DBHandler")
+        await db.set_setting(interaction.guild.id, "custom_vc_category_id", str(category.id))
+        await interaction.response.send_message(f"✅ カスタムVCのカテゴリを `{category.name}` に設定しました。", ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(CustomVC(bot))
@@ -2,11 +2,17 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
-import aiohttp
-import asyncpg
+import uuid
+from discord import PCMVolumeTransformer
 
-# VoiceVox APIのURL（例。実際のVoiceVoxサーバーのURLに合わせてください）
-VOICEVOX_API_BASE = "http://localhost:50021" #ここはまだ仮。どっかからかっさらわないと…
+from utils import http_client
+from utils.aho_corasick import Automaton
+from utils.message_pipeline import STAGE_TTS
+from utils.tts_reader import GuildReader, Utterance
+from utils.tts_cache import TTSCache, normalize_text
+from utils.pcm_audio import PCMBufferSource, decode_wav, needs_conversion, SAMPLE_RATE
+
+# VoiceVox APIのURLは VOICEVOX_API_URL で指定（utils/http_client.py）
 
 class VoiceRead(commands.Cog):
     def __init__(self, bot):
@@ -14,8 +20,11 @@ class VoiceRead(commands.Cog):
         # DBプールは両方のCogで共有してる想定（ここはアクセス用）
         self.server_db = None
         self.user_db = None
-        self.tts_lock = asyncio.Lock()
         self.voice_clients = {}  # guild_id -> voice_client
+        self.readers: dict[int, GuildReader] = {}  # guild_id -> 読み上げキュー
+        self.tts_cache = TTSCache()  # 合成済み音声（全ギルド共通）
+        # guild_id -> (word_dict_version, 辞書のオートマトン)
+        self.dictionaries: dict[int, tuple[str | None, Automaton]] = {}
 
     async def cog_load(self):
         # それぞれのDBハンドラをCogから取得
@@ -23,12 +32,31 @@ class VoiceRead(commands.Cog):
         self.user_db = self.bot.get_cog("UserDBHandler")  # ユーザ設定DB
         if not self.server_db or not self.user_db:
             print("VoiceRead: DBHandler/UserDBHandlerが見つかりません。")
+        await self.tts_cache.load()
+        self.bot.message_pipeline.add_stage("tts", self.handle_message, STAGE_TTS)
+
+    def cog_unload(self):
+        self.bot.message_pipeline.remove_stage("tts")
+        for reader in self.readers.values():
+            reader.close()
+        self.readers.clear()
+
+    def get_reader(self, guild_id: int) -> GuildReader:
+        reader = self.readers.get(guild_id)
+        if reader is None:
+            reader = GuildReader(
+                guild_id,
+                synthesize=lambda utt: self.render(guild_id, utt),
+                play=lambda utt: self.play_utterance(guild_id, utt),
+            )
+            self.readers[guild_id] = reader
+        return reader
 
     ### サーバーデータベース関連メソッド ###
 
-    async def get_read_channels(self, guild_id: int) -> list[int]:
+    @staticmethod
+    def parse_read_channels(value: str | None) -> list[int]:
         # サーバーの読み上げ対象チャンネルIDリスト（カンマ区切り文字列をリストに変換）
-        value = await self.server_db.get_setting(guild_id, "read_channels")
         if not value:
             return []
         try:
@@ -36,6 +64,9 @@ class VoiceRead(commands.Cog):
         except Exception:
             return []
 
+    async def get_read_channels(self, guild_id: int) -> list[int]:
+        return self.parse_read_channels(await self.server_db.get_setting(guild_id, "read_channels"))
+
     async def add_read_channel(self, guild_id: int, channel_id: int):
         channels = await self.get_read_channels(guild_id)
         if channel_id not in channels:
@@ -48,20 +79,19 @@ class VoiceRead(commands.Cog):
             channels.remove(channel_id)
             await self.server_db.set_setting(guild_id, "read_channels", ",".join(map(str, channels)))
 
-    async def get_word_dict(self, guild_id: int) -> dict:
-        # 単語辞書はJSON文字列で保存（key:単語, value:読み方）
-        import json
-        raw = await self.server_db.get_setting(guild_id, "word_dict")
-        if not raw:
-            return {}
-        try:
-            return json.loads(raw)
-        except Exception:
-            return {}
+    async def get_dictionary(self, guild_id: int, version: str | None) -> Automaton:
+        # 辞書は /dict add|remove で word_dict_version が変わったときだけ作り直す
+        cached = self.dictionaries.get(guild_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        automaton = Automaton(await self.server_db.get_read_dictionary(guild_id))
+        self.dictionaries[guild_id] = (version, automaton)
+        return automaton
 
-    async def save_word_dict(self, guild_id: int, word_dict: dict):
-        import json
-        await self.server_db.set_setting(guild_id, "word_dict", json.dumps(word_dict, ensure_ascii=False))
+    async def bump_dictionary_version(self, guild_id: int):
+        # 設定の変更通知で他のプロセスのキャッシュも無効になる
+        self.dictionaries.pop(guild_id, None)
+        await self.server_db.set_setting(guild_id, "word_dict_version", uuid.uuid4().hex)
 
     ### ユーザーデータベース関連メソッド ###
 
@@ -119,18 +149,15 @@ class VoiceRead(commands.Cog):
     @dict.command(name="add", description="単語の読み方を追加します。")
     @app_commands.describe(word="単語", reading="読み方")
     async def dict_add(self, interaction: discord.Interaction, word: str, reading: str):
-        word_dict = await self.get_word_dict(interaction.guild.id)
-        word_dict[word] = reading
-        await self.save_word_dict(interaction.guild.id, word_dict)
+        await self.server_db.set_read_word(interaction.guild.id, word, reading)
+        await self.bump_dictionary_version(interaction.guild.id)
         await interaction.response.send_message(f"✅ `{word}` の読み方を `{reading}` に追加しました。", ephemeral=True)
 
     @dict.command(name="remove", description="単語の読み方を削除します。")
     @app_commands.describe(word="単語")
     async def dict_remove(self, interaction: discord.Interaction, word: str):
-        word_dict = await self.get_word_dict(interaction.guild.id)
-        if word in word_dict:
-            del word_dict[word]
-            await self.save_word_dict(interaction.guild.id, word_dict)
+        if await self.server_db.delete_read_word(interaction.guild.id, word):
+            await self.bump_dictionary_version(interaction.guild.id)
             await interaction.response.send_message(f"✅ `{word}` の読み方を削除しました。", ephemeral=True)
         else:
             await interaction.response.send_message(f"⚠️ `{word}` の読み方は登録されていません。", ephemeral=True)
@@ -148,98 +175,111 @@ class VoiceRead(commands.Cog):
     ### 実際の読み上げ処理（例） ###
 
     async def text_to_speech(self, guild_id: int, text: str, voice_id: int = 1) -> bytes:
-        # VoiceVoxのAPIを使いwavデータを取得する例
-        # 音声バイナリを返すので、Discordのplayで再生できるようにする
-
-        async with aiohttp.ClientSession() as session:
-            # 1. 音声合成テキスト解析
-            params = {"text": text, "speaker": voice_id}
-            async with session.post(f"{VOICEVOX_API_BASE}/audio_query", params=params) as resp:
-                if resp.status != 200:
-                    raise Exception("VoiceVox audio_query API error")
-                audio_query = await resp.json()
-
-            # 2. 音声合成
-            headers = {"Content-Type": "application/json"}
-            async with session.post(f"{VOICEVOX_API_BASE}/synthesis?speaker={voice_id}", json=audio_query, headers=headers) as resp:
-                if resp.status != 200:
-                    raise Exception("VoiceVox synthesis API error")
-                wav_bytes = await resp.read()
-                return wav_bytes
-
-    import discord.opus
-from discord import PCMVolumeTransformer, FFmpegPCMAudio
-
-class VoiceRead(commands.Cog):
-    # ...（前略）
+        # 辞書適用後の文と話者で引けるキャッシュがあればVoiceVoxは呼ばない
+        text = normalize_text(text)
+        return await self.tts_cache.get_or_synthesize(voice_id, text, lambda: self.synthesize(text, voice_id))
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-        if not message.guild:
-            return  # DM無視
+    async def synthesize(self, text: str, voice_id: int) -> bytes:
+        # VoiceVoxのAPIを使いwavデータを取得する
+        # 音声バイナリを返すので、Discordのplayで再生できるようにする
 
+        # 1. 音声合成テキスト解析（副作用がないので失敗時は再送する）
+        params = {"text": text, "speaker": voice_id}
+        resp = await http_client.request("voicevox", "POST", "/audio_query", params=params, retries=http_client.MAX_RETRIES)
+        if resp.status != 200:
+            raise Exception("VoiceVox audio_query API error")
+        audio_query = resp.data
+        # Discordにそのまま流せる 48kHz / ステレオ で出力してもらう（変換不要になる）
+        audio_query["outputSamplingRate"] = SAMPLE_RATE
+        audio_query["outputStereo"] = True
+
+        # 2. 音声合成
+        resp = await http_client.request(
+            "voicevox", "POST", "/synthesis", params={"speaker": voice_id}, json=audio_query,
+            read="bytes", retries=http_client.MAX_RETRIES
+        )
+        if resp.status != 200:
+            raise Exception("VoiceVox synthesis API error")
+        return resp.data
+
+    async def render(self, guild_id: int, utt: Utterance):
+        """読み上げ用のPCMを用意する（再生側はこれを切り出して流すだけ）"""
+        wav = await self.text_to_speech(guild_id, utt.text, utt.voice_id)
+        if needs_conversion(wav):
+            # 周波数変換はCPUを使うのでスレッドで
+            return await asyncio.to_thread(decode_wav, wav)
+        return decode_wav(wav)
+
+    async def handle_message(self, ctx):
+        message = ctx.message
         guild_id = message.guild.id
         channel_id = message.channel.id
 
         # 読み上げ対象チャンネルかチェック
-        read_channels = await self.get_read_channels(guild_id)
+        read_channels = self.parse_read_channels(ctx.settings.get("read_channels"))
         if channel_id not in read_channels:
             return
 
         voice_state = message.author.voice
+        if not voice_state or not voice_state.channel:
+            return
         voice_channel = voice_state.channel
 
-        # 辞書置換
-        word_dict = await self.get_word_dict(guild_id)
-        text = message.content
-        for word, reading in word_dict.items():
-            text = text.replace(word, reading)
+        # 辞書置換（重なる単語は長い方を優先して1回で置き換える）
+        dictionary = await self.get_dictionary(guild_id, ctx.settings.get("word_dict_version"))
+        text = dictionary.replace(message.content)
 
         # 話者の声ID取得（なければデフォルト1）
         voice_id = await self.get_user_voice(message.author.id) or 1
 
-        # TTS音声データ取得
-        try:
-            async with self.tts_lock:
-                wav_data = await self.text_to_speech(guild_id, text, voice_id)
-        except Exception as e:
-            print(f"VoiceRead TTS error: {e}")
-            return
+        # 合成・再生はギルドごとの読み上げキューで行う（ここでは待たない）
+        self.get_reader(guild_id).submit(Utterance(message.author.id, voice_channel, text, voice_id))
 
+    async def play_utterance(self, guild_id: int, utt: Utterance):
         # VC接続と再生
-        try:
-            vc = self.voice_clients.get(guild_id)
-            if vc is None or not vc.is_connected():
-                vc = await voice_channel.connect()
-                self.voice_clients[guild_id] = vc
-            elif vc.channel != voice_channel:
-                await vc.move_to(voice_channel)
-
-            # 再生のためにwavデータを一時ファイルに保存
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-                tmpfile.write(wav_data)
-                tmp_path = tmpfile.name
-
-            audio_source = PCMVolumeTransformer(FFmpegPCMAudio(tmp_path))
-            play_done = asyncio.Event()
-
-            def after_playing(error):
-                if error:
-                    print(f"VoiceRead playback error: {error}")
-                play_done.set()
-
-            vc.play(audio_source, after=after_playing)
-            await play_done.wait()
-
-            # 再生終了後に一時ファイルを削除
-            import os
-            os.remove(tmp_path)
-
-        except Exception as e:
-            print(f"VoiceRead VC playback error: {e}")
+        voice_channel = utt.voice_channel
+        vc = self.voice_clients.get(guild_id)
+        if vc is None or not vc.is_connected():
+            vc = await voice_channel.connect()
+            self.voice_clients[guild_id] = vc
+        elif vc.channel != voice_channel:
+            await vc.move_to(voice_channel)
+
+        # メモリ上のPCMをそのまま流す
+        audio_source = PCMVolumeTransformer(PCMBufferSource(utt.audio))
+        play_done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def after_playing(error):
+            if error:
+                print(f"VoiceRead playback error: {error}")
+            # after は別スレッドから呼ばれる
+            loop.call_soon_threadsafe(play_done.set)
+
+        vc.play(audio_source, after=after_playing)
+        await play_done.wait()
+
+    @app_commands.command(name="tts_stats", description="読み上げキューの状況を表示します（管理者専用）。")
+    async def tts_stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("🚫 管理者権限が必要です。", ephemeral=True)
+            return
+        reader = self.readers.get(interaction.guild.id)
+        if reader is None:
+            await interaction.response.send_message("📭 このサーバーではまだ読み上げていません。", ephemeral=True)
+            return
+        s = reader.get_stats()
+        c = self.tts_cache.get_stats()
+        await interaction.response.send_message(
+            f"📥 待ち: {s['depth']}件（最大 {s['max_depth']}件）\n"
+            f"🗣️ 受付 {s['enqueued']} / まとめ {s['merged']} / 破棄 {s['dropped']} / 期限切れ {s['stale']}\n"
+            f"🎵 合成 {s['synthesized']} / 再生 {s['played']} / エラー {s['errors']}\n"
+            f"⏱️ 発言から再生まで: 平均 {s['avg_latency_ms']:.0f}ms / 最大 {s['max_latency_ms']:.0f}ms\n"
+            f"💾 音声キャッシュ: ヒット率 {c['hit_rate'] * 100:.1f}% "
+            f"(メモリ {c['memory_hits']} / ディスク {c['disk_hits']} / 相乗り {c['coalesced']} / ミス {c['misses']}) "
+            f"{c['disk_entries']}件 {c['disk_bytes'] / 1024 / 1024:.1f}MB",
+            ephemeral=True
+        )
 
 async def setup(bot):
     await bot.add_cog(VoiceRead(bot))
@@ -61,6 +61,36 @@ class Admin(commands.Cog):
         embed.add_field(name="作成日", value=guild.created_at.strftime("%Y/%m/%d"), inline=False)
         await interaction.response.send_message(embed=embed)
 
+    # --- メッセージ処理パイプラインの統計 ---
+    @app_commands.command(name="pipeline_stats", description="メッセージ処理の各ステージの所要時間を表示します。")
+    async def pipeline_stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("🚫 管理者権限が必要です。", ephemeral=True)
+            return
+        embed = discord.Embed(title="📨 メッセージパイプライン統計", color=discord.Color.blue())
+        for name, s in self.bot.message_pipeline.get_stats().items():
+            embed.add_field(
+                name=name,
+                value=f"{s['calls']}回 / avg {s['avg_ms']:.1f}ms / max {s['max_ms']:.1f}ms / 中断 {s['stops']} / エラー {s['errors']}",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="http_stats", description="外部APIへの接続の再利用状況を表示します。")
+    async def http_stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("🚫 管理者権限が必要です。", ephemeral=True)
+            return
+        embed = discord.Embed(title="🌐 HTTP接続統計", color=discord.Color.blue())
+        for name, s in self.bot.http_clients.get_stats().items():
+            embed.add_field(
+                name=name,
+                value=f"{s['requests']}件 / 再送 {s['retries']} / 失敗 {s['failures']}\n"
+                      f"新規接続 {s['connections_created']} / 再利用 {s['connections_reused']} ({s['reuse_rate'] * 100:.1f}%)",
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
 class RoleSelectView(View):
     def __init__(self, roles: list[discord.Role]):
         super().__init__(timeout=None)
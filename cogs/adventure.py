@@ -3,7 +3,6 @@ from discord.ext import commands
 from discord import app_commands
 import random
 import json
-import aiohttp
 
 from utils import adventure as adventure_utils
 from utils import item as item_utils
@@ -13,10 +12,6 @@ from utils import fortune
 class Adventure(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
-
-    async def cog_unload(self):
-        await self.session.close()
 
     @app_commands.command(name="adventure_start", description="冒険を開始します（ステージと難易度を選択）")
     async def start(self, interaction: discord.Interaction):
@@ -37,7 +32,7 @@ class Adventure(commands.Cog):
 
     @app_commands.command(name="adventure_explore", description="冒険を探索してイベントを進行させます")
     async def explore(self, interaction: discord.Interaction):
-        fortune_effects = await fortune.get_today_fotune_effects(interaction.user.id)
+        fortune_effects = await fortune.get_today_fortune_effects(interaction.user.id)
         bonus = fortune_effects.get("event_success_rate_bonus",0)
         event = await adventure_utils.get_random_event()
         roll_result, passed, message = await adventure_utils.resolve_event(interaction.user.id, event,bonus_modifier=bonus)
@@ -64,7 +59,7 @@ class Adventure(commands.Cog):
 
     @app_commands.command(name="adventure_end", description="冒険を終了して報酬を獲得します")
     async def end(self, interaction: discord.Interaction):
-        result = await adventure_utils.end_adventure(interaction.user.id, self.session)
+        result = await adventure_utils.end_adventure(interaction.user.id)
         if not result:
             await interaction.response.send_message("❌ 冒険していません。`/adventure_start` で始めましょう。", ephemeral=True)
             return
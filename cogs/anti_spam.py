@@ -1,44 +1,43 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-from collections import defaultdict
+import datetime
+
+from utils.message_pipeline import STAGE_SPAM
+from utils.rate_limit import RateLimiter, RULES, parse_rule, rules_from_settings
 
 class AntiSpam(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.msg_cache = defaultdict(list)
-        self.cleanup_task.start()
-
-    @tasks.loop(seconds=1)
-    async def cleanup_task(self):
-        for user_id in list(self.msg_cache.keys()):
-            self.msg_cache[user_id] = [ts for ts in self.msg_cache[user_id] if ts > discord.utils.utcnow().timestamp() - 1]
-            if not self.msg_cache[user_id]:
-                del self.msg_cache[user_id]
-
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot or not message.guild:
-            return
+        # 古い記録は投稿のたびに少しずつ捨てるので、掃除用のループは不要
+        self.limiter = RateLimiter()
 
-        now = discord.utils.utcnow().timestamp()
-        self.msg_cache[message.author.id].append(now)
+    async def cog_load(self):
+        self.bot.message_pipeline.add_stage("spam", self.handle_message, STAGE_SPAM)
 
-        db = self.bot.get_cog("DBHandler")
-        max_count_str = await db.get_setting(message.guild.id, "spam_limit") if db else None
-        timeout_str = await db.get_setting(message.guild.id, "spam_timeout") if db else None
+    def cog_unload(self):
+        self.bot.message_pipeline.remove_stage("spam")
 
-        max_count = int(max_count_str) if max_count_str else 5
+    async def handle_message(self, ctx):
+        message = ctx.message
+        mentions = len(message.raw_mentions) + len(message.raw_role_mentions) + (1 if message.mention_everyone else 0)
+        rule = self.limiter.check(
+            message.guild.id, message.author.id, message.content, mentions, rules_from_settings(ctx.settings)
+        )
+        if rule is None:
+            return
+
+        timeout_str = ctx.settings.get("spam_timeout")
         timeout_duration = int(timeout_str) if timeout_str else 3600
 
-        if len(self.msg_cache[message.author.id]) >= max_count:
-            try:
-                await message.author.timeout(discord.utils.utcnow() + discord.timedelta(seconds=timeout_duration),
-                                             reason="スパム検知")
-                await message.channel.send(f"🚨 {message.author.mention} がスパム検知により {timeout_duration // 60}分 タイムアウトされました。", delete_after=10)
-            except Exception:
-                pass
-            self.msg_cache[message.author.id].clear()
+        ctx.flags["spam"] = rule
+        ctx.stop("spam")
+        try:
+            await message.author.timeout(discord.utils.utcnow() + datetime.timedelta(seconds=timeout_duration),
+                                         reason=f"スパム検知（{RULES[rule][2]}）")
+            await message.channel.send(f"🚨 {message.author.mention} がスパム検知（{RULES[rule][2]}）により {timeout_duration // 60}分 タイムアウトされました。", delete_after=10)
+        except Exception:
+            pass
 
     @app_commands.command(name="spam_set_limit", description="スパム検知の投稿上限を設定します（秒間）")
     async def spam_set_limit(self, interaction: discord.Interaction, count: int):
@@ -58,5 +57,42 @@ class AntiSpam(commands.Cog):
         else:
             await interaction.response.send_message("❌ DB Cog が見つかりません。", ephemeral=True)
 
+    @app_commands.command(name="spam_set_rule", description="スパム検知のルールを設定します（件数0で無効）")
+    @app_commands.describe(rule="ルール", count="上限（メンション爆撃はメンション数）", seconds="何秒間での件数か")
+    @app_commands.choices(rule=[app_commands.Choice(name=label, value=name) for name, (_, _, label) in RULES.items()])
+    async def spam_set_rule(self, interaction: discord.Interaction, rule: app_commands.Choice[str], count: int, seconds: float = 1.0):
+        db = self.bot.get_cog("DBHandler")
+        if not db:
+            await interaction.response.send_message("❌ DB Cog が見つかりません。", ephemeral=True)
+            return
+        key = RULES[rule.value][0]
+        if count <= 0:
+            await db.set_setting(interaction.guild.id, key, "off")
+            await interaction.response.send_message(f"✅ {rule.name}の検知を無効にしました。")
+            return
+        await db.set_setting(interaction.guild.id, key, f"{count}/{seconds:g}")
+        await interaction.response.send_message(f"✅ {rule.name}の上限を `{seconds:g}秒間に{count}` に設定しました。")
+
+    @app_commands.command(name="spam_rules", description="現在のスパム検知ルールを表示します")
+    async def spam_rules(self, interaction: discord.Interaction):
+        db = self.bot.get_cog("DBHandler")
+        settings = await db.get_guild_settings(interaction.guild.id) if db else {}
+        lines = []
+        for name, (key, default, label) in RULES.items():
+            rule = parse_rule(settings.get(key), default)
+            lines.append(f"・{label}: " + (f"{rule[1]:g}秒間に{rule[0]}" if rule else "無効"))
+        await interaction.response.send_message("🛡️ スパム検知ルール\n" + "\n".join(lines), ephemeral=True)
+
+    @app_commands.command(name="spam_stats", description="スパム検知の状況を表示します（管理者専用）")
+    async def spam_stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("🚫 管理者権限が必要です。", ephemeral=True)
+            return
+        s = self.limiter.get_stats()
+        triggered = " / ".join(f"{label} {s[f'triggered_{name}']}" for name, (_, _, label) in RULES.items())
+        await interaction.response.send_message(
+            f"🛡️ 判定 {s['checked']}件 / 追跡中 {s['tracked']}人\n検知: {triggered}", ephemeral=True
+        )
+
 async def setup(bot):
     await bot.add_cog(AntiSpam(bot))
@@ -5,7 +5,6 @@ from utils.economy_api import EconomyAPI
 from utils import item as item_utils
 import random
 import asyncio
-import aiohttp
 
 SUITS = ["♠️", "♥️", "♣️", "♦️"]
 RANKS = {
@@ -74,17 +73,19 @@ class BlackJack(commands.Cog):
         self.bot = bot
         self.active_games = {}
 
-    async def fetch_economy(self, session, discord_id):
-        async with session.get(f"https://localhost:8000/link?discord_id={discord_id}") as resp:
-            link_data = await resp.json()
-            shared_id = link_data["universal_id"]
-        api = EconomyAPI(session)
+    async def fetch_economy(self, discord_id):
+        api = EconomyAPI()
+        link_data = await api.get_link(discord_id)
+        if link_data is None:
+            return None, None
+        shared_id = link_data["universal_id"]
         user_data = await api.get_user(shared_id)
         return shared_id, user_data
 
-    async def update_balance(self, session, shared_id, new_balance):
-        api = EconomyAPI(session)
-        await api.update_user(shared_id, {"balance": new_balance})
+    async def credit(self, shared_id, amount):
+        if amount <= 0:
+            return None
+        return await EconomyAPI().increment(shared_id, {"balance": amount})
 
     async def on_hit(self, interaction: discord.Interaction):
         game = self.active_games.get(interaction.message.id)
@@ -149,9 +150,8 @@ class BlackJack(commands.Cog):
 
         payout = int(game["bet"] * payout_multiplier)
 
-        async with aiohttp.ClientSession() as session:
-            new_balance = game["economy"]["balance"] + payout
-            await self.update_balance(session, game["shared_id"], new_balance)
+        updated = await self.credit(game["shared_id"], payout)
+        new_balance = updated["balance"] if updated else game["economy"]["balance"] + payout
 
         embed = self.create_game_embed(game, reveal_dealer=True)
         embed.title = f"決着: {title}"
@@ -159,7 +159,7 @@ class BlackJack(commands.Cog):
         embed.color = color
         embed.add_field(name="掛け金", value=f"{game['bet']:,}コイン")
         embed.add_field(name="払い戻し", value=f"{payout:,}コイン")
-        embed.add_field(name="所持コイン", value=f"{game['economy']['balance'] + payout:,}コイン", inline=False)
+        embed.add_field(name="所持コイン", value=f"{new_balance:,}コイン", inline=False)
 
         if game["item_used"]:
             embed.set_footer(text="インシュランスカードを1枚消費しました。")
@@ -173,19 +173,27 @@ class BlackJack(commands.Cog):
         if bet <= 0:
             return await ctx.send("掛け金は1以上で指定してください。", ephemeral=True)
 
-        async with aiohttp.ClientSession() as session:
-            shared_id, user = await self.fetch_economy(session, ctx.author.id)
-            if user["balance"] < bet:
-                return await ctx.send("コインが足りません。", ephemeral=True)
-
-            item_used = False
-            if use_bonus:
-                has_card = await item_utils.use_item(shared_id, "insurance_card")
-                if not has_card:
-                    return await ctx.send("インシュランス・カードを持っていません。", ephemeral=True)
-                item_used = True
-
-            await self.update_balance(session, shared_id, user["balance"] - bet)
+        shared_id, user = await self.fetch_economy(ctx.author.id)
+        if user is None:
+            return await ctx.send("経済アカウントが見つかりません。/link_start で連携してください。", ephemeral=True)
+        if user["balance"] < bet:
+            return await ctx.send("コインが足りません。", ephemeral=True)
+
+        if use_bonus and await item_utils.get_user_item_count(shared_id, "insurance_card") <= 0:
+            return await ctx.send("インシュランス・カードを持っていません。", ephemeral=True)
+
+        # 掛け金は残高が足りるときだけ原子的に引き落とす（カードは引き落としが通ってから消費する）
+        user = await EconomyAPI().conditional_debit(shared_id, bet)
+        if user is None:
+            return await ctx.send("コインが足りません。", ephemeral=True)
+
+        item_used = False
+        if use_bonus:
+            if not await item_utils.use_item(shared_id, "insurance_card"):
+                # 確認後に使われてしまった場合は掛け金を戻す
+                await self.credit(shared_id, bet)
+                return await ctx.send("インシュランス・カードを持っていません。", ephemeral=True)
+            item_used = True
 
         deck = Deck()
         player_hand = [deck.draw(), deck.draw()]
@@ -4,16 +4,25 @@ import random
 import json
 import os
 
-from utils.userdb import UserDBHandler
+from utils.message_pipeline import STAGE_CHARACTER
 
 CHARACTER_JSON_PATH = "data/charactor.json"
 
 class CharacterCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = UserDBHandler()
         self.characters = self.load_characters()
 
+    @property
+    def db(self):
+        return self.bot.get_cog("UserDBHandler")
+
+    async def cog_load(self):
+        self.bot.message_pipeline.add_stage("character", self.handle_message, STAGE_CHARACTER, guild_only=False, dm_only=True)
+
+    def cog_unload(self):
+        self.bot.message_pipeline.remove_stage("character")
+
     def load_characters(self):
         if not os.path.exists(CHARACTER_JSON_PATH):
             return {}
@@ -65,10 +74,8 @@ class CharacterCog(commands.Cog):
 
         await self.send_character_embed(ctx, character)
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
-            return
+    async def handle_message(self, ctx):
+        message = ctx.message
         if not isinstance(message.channel, discord.DMChannel):
             return
 
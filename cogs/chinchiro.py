@@ -1,10 +1,9 @@
 import discord
 from discord.ext import commands
 from discord import app_commands, ui
-from ..utils import economy_api, item as item_utils
+from utils import economy_api, item as item_utils
 import random
 from collections import Counter
-import aiohttp
 
 DICE_EMOJIS = {1: "1️⃣", 2: "2️⃣", 3: "3️⃣", 4: "4️⃣", 5: "5️⃣", 6: "6️⃣"}
 PAYOUTS = {
@@ -64,7 +63,6 @@ class Chinchiro(commands.Cog):
         return embed
 
     async def end_game(self, interaction: discord.Interaction, game_state):
-        session = self.bot.http_session
         user_id = interaction.user.id
         shared_id = str(interaction.guild.id) + "_" + str(user_id)
         self.active_games.pop(user_id, None)
@@ -73,18 +71,18 @@ class Chinchiro(commands.Cog):
         bet = game_state["bet"]
         item_used = game_state["item_used"]
 
-        user = await economy_api.EconomyAPI(session).get_user(shared_id)
-        if not user:
-            return await interaction.followup.send("ユーザーデータの取得に失敗しました。", ephemeral=True)
-
         hand_name, payout_multiplier = evaluate_dice(dice)
         if item_used and payout_multiplier > 0:
             payout_multiplier *= 1.5
 
         payout = int(bet * payout_multiplier)
-        new_balance = user["balance"] + payout
 
-        await economy_api.EconomyAPI(session).update_user(shared_id, {"balance": new_balance})
+        # 払い戻し（ヒフミなら追加の支払い）をサーバー側で加算
+        api = economy_api.EconomyAPI()
+        user = await api.increment(shared_id, {"balance": payout}) if payout else await api.get_user(shared_id)
+        if not user:
+            return await interaction.followup.send("ユーザーデータの取得に失敗しました。", ephemeral=True)
+        new_balance = user["balance"]
 
         embed = self.create_game_embed(game_state, final=True, result_text=hand_name)
         embed.add_field(name="掛け金", value=f"{bet:,}コイン", inline=True)
@@ -131,7 +129,6 @@ class Chinchiro(commands.Cog):
     @commands.hybrid_command(name="chinchiro", aliases=["cc"], description="サイコロを振って役を揃えよう！")
     @app_commands.describe(bet="賭けるコインの枚数", use_bonus="イカサマの壺を使いますか？")
     async def chinchiro(self, ctx: commands.Context, bet: int, use_bonus: bool = False):
-        session = self.bot.http_session
         user_id = ctx.author.id
         shared_id = f"{ctx.guild.id}_{user_id}"
 
@@ -140,20 +137,27 @@ class Chinchiro(commands.Cog):
         if bet <= 0:
             return await ctx.send("掛け金は1以上の整数で指定してください。", ephemeral=True)
 
-        user = await economy_api.EconomyAPI(session).get_user(shared_id)
+        user = await economy_api.EconomyAPI().get_user(shared_id)
         if not user:
             return await ctx.send("ユーザー情報が取得できませんでした。", ephemeral=True)
         if user["balance"] < bet * 2:
             return await ctx.send("コインが足りません（ヒフミ負けの保険も必要）。", ephemeral=True)
 
+        if use_bonus and await item_utils.get_user_item_count(shared_id, "chinchiro_cup") <= 0:
+            return await ctx.send("イカサマの壺を所持していません。", ephemeral=True)
+
+        # 先にコイン減算（ヒフミ負けの保険として掛け金分は残っている必要がある）。壺は引き落としが通ってから消費する
+        api = economy_api.EconomyAPI()
+        if await api.conditional_debit(shared_id, bet, min_balance=bet) is None:
+            return await ctx.send("コインが足りません（ヒフミ負けの保険も必要）。", ephemeral=True)
+
         item_used = False
         if use_bonus:
-            item_used = await item_utils.use_item(shared_id, "chinchiro_cup")
-            if not item_used:
+            if not await item_utils.use_item(shared_id, "chinchiro_cup"):
+                # 確認後に使われてしまった場合は掛け金を戻す
+                await api.increment(shared_id, {"balance": bet})
                 return await ctx.send("イカサマの壺を所持していません。", ephemeral=True)
-
-        # 先にコイン減算
-        await economy_api.EconomyAPI(session).update_user(shared_id, {"balance": user["balance"] - bet})
+            item_used = True
 
         if item_used and random.random() < 0.2:
             dice = [1, 2, 4]
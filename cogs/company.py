@@ -8,7 +8,7 @@ from userdb import add_user_to_company, remove_user_from_company, get_company_by
 class Company(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = bot.db  # `bot.db` に DB pool がある前提
+        self.db = bot.database.for_cog("Company")
 
     # -------------------------------------
     # /company create [名前]
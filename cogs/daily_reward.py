@@ -0,0 +1,47 @@
+from discord.ext import commands
+import random
+from datetime import time, datetime, timedelta, timezone
+
+from utils import economy_api
+
+# ご褒美を配る時刻（UTC）
+REWARD_TIME = time(0, 0)
+
+class DailyPetReward(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        # 毎分時刻を確認するのではなく、共有スケジューラで0時ちょうどに起こしてもらう
+        self.bot.scheduler.every_day("daily_pet_reward", REWARD_TIME, self.distribute_rewards)
+
+    async def distribute_rewards(self):
+        userdb = self.bot.get_cog("UserDBHandler")
+        # 0時に起きるので、集計するのは終わったばかりの前日分（UTC）
+        day = datetime.now(timezone.utc).date() - timedelta(days=1)
+
+        all_actions = await userdb.get_all_today_pet_actions(day)
+        # 複数サーバーで活動した人は合計してDMは1通にする
+        rewards: dict[int, int] = {}
+        for record in all_actions:
+            user_id = record["user_id"]
+            count = record["command_count"]
+            multiplier = random.randint(50, 100)
+            reward = count * multiplier
+            await economy_api.increment(str(user_id), {"balance": reward})
+            rewards[user_id] = rewards.get(user_id, 0) + reward
+
+        # DMは一斉送信に任せる（DM失敗は記録だけして無視）
+        if rewards:
+            await self.bot.broadcaster.start("daily_pet_reward", [
+                ("user", user_id, {"content": f"🌙 昨日のペット活動のご褒美：{reward} コインをゲット！おやすみ！"})
+                for user_id, reward in rewards.items()
+            ])
+
+        await userdb.reset_pet_action_counts(day)
+
+    def cog_unload(self):
+        self.bot.scheduler.cancel("daily_pet_reward")
+
+async def setup(bot):
+    await bot.add_cog(DailyPetReward(bot))
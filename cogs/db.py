@@ -1,21 +1,29 @@
-import asyncpg
+import os
+import uuid
+import asyncio
+from collections import OrderedDict
+import discord
 from discord.ext import commands
+from discord import app_commands
 
-DB_CONFIG = {
-    "user": "orbisuser",
-    "password": "orbispass",
-    "database": "orbis",
-    "host": "orbis-db",
-    "port": 5432,
-}
+# ギルド設定キャッシュに保持する最大ギルド数（LRU）
+SETTINGS_CACHE_MAX_GUILDS = int(os.getenv("SETTINGS_CACHE_MAX_GUILDS", 5000))
+# 他プロセスへのキャッシュ無効化通知に使うNOTIFYチャンネル
+SETTINGS_NOTIFY_CHANNEL = "orbis_settings_changed"
 
 class DBHandler(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.pool = None
+        # guild_id -> {key: value} のライトスルーキャッシュ
+        self.settings_cache: OrderedDict[int, dict[str, str]] = OrderedDict()
+        self._settings_loading: dict[int, asyncio.Task] = {}
+        # 読み込み中に書き込み・無効化があったかを判定するための世代番号
+        self._settings_generation = 0
+        self._instance_id = uuid.uuid4().hex
 
     async def cog_load(self):
-        self.pool = await asyncpg.create_pool(**DB_CONFIG)
+        self.pool = self.bot.database.for_cog("DBHandler")
         async with self.pool.acquire() as conn:
             # settingsテーブル作成
             await conn.execute("""
@@ -43,6 +51,77 @@ class DBHandler(commands.Cog):
                 );
             """)
 
+            # 読み上げ辞書（1単語1行）
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS read_dictionary (
+                    guild_id BIGINT,
+                    word TEXT,
+                    reading TEXT NOT NULL,
+                    PRIMARY KEY (guild_id, word)
+                );
+            """)
+            await self._migrate_word_dict(conn)
+
+            # NGワード（channel_id = 0 はギルド全体）
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS ngwords (
+                    guild_id BIGINT,
+                    channel_id BIGINT DEFAULT 0,
+                    word TEXT,
+                    PRIMARY KEY (guild_id, channel_id, word)
+                );
+            """)
+
+        # 他プロセスでの設定変更を受け取ってキャッシュを無効化する
+        await self.bot.database.listen(SETTINGS_NOTIFY_CHANNEL, self._on_settings_notify, on_reset=self.clear_settings_cache)
+
+    # === settingsキャッシュ ===
+
+    def clear_settings_cache(self):
+        self._settings_generation += 1
+        self.settings_cache.clear()
+
+    def invalidate_guild_settings(self, guild_id: int):
+        self._settings_generation += 1
+        self.settings_cache.pop(guild_id, None)
+
+    def _on_settings_notify(self, payload: str):
+        # payload = "<instance_id>:<guild_id>"
+        instance_id, _, guild_id = payload.partition(":")
+        if instance_id == self._instance_id or not guild_id.isdigit():
+            return  # 自分の書き込みはライトスルー済み
+        self.invalidate_guild_settings(int(guild_id))
+
+    async def _load_guild_settings(self, guild_id: int) -> dict[str, str]:
+        generation = self._settings_generation
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT key, value FROM settings WHERE guild_id = $1", guild_id)
+        settings = {row["key"]: row["value"] for row in rows}
+        # 読み込み中に更新が入っていたら古い可能性があるのでキャッシュしない
+        if generation == self._settings_generation:
+            self.settings_cache[guild_id] = settings
+            while len(self.settings_cache) > SETTINGS_CACHE_MAX_GUILDS:
+                self.settings_cache.popitem(last=False)
+        return settings
+
+    async def get_guild_settings(self, guild_id: int) -> dict[str, str]:
+        """ギルドの全設定を返す（キャッシュ優先。返り値は変更しないこと）"""
+        settings = self.settings_cache.get(guild_id)
+        if settings is not None:
+            self.settings_cache.move_to_end(guild_id)
+            return settings
+
+        # 同じギルドの同時読み込みは1クエリにまとめる
+        task = self._settings_loading.get(guild_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_guild_settings(guild_id))
+            self._settings_loading[guild_id] = task
+            task.add_done_callback(lambda _: self._settings_loading.pop(guild_id, None))
+        return await asyncio.shield(task)
+
+    async def _publish_settings_change(self, conn, guild_id: int):
+        await self.bot.database.notify(conn, SETTINGS_NOTIFY_CHANNEL, f"{self._instance_id}:{guild_id}")
+
     # === settings系 ===
     async def set_setting(self, guild_id: int, key: str, value: str):
         query = """
@@ -53,22 +132,98 @@ class DBHandler(commands.Cog):
         """
         async with self.pool.acquire() as conn:
             await conn.execute(query, guild_id, key, value)
+            self._settings_generation += 1
+            cached = self.settings_cache.get(guild_id)
+            if cached is not None:
+                cached[key] = value
+            await self._publish_settings_change(conn, guild_id)
 
     async def get_setting(self, guild_id: int, key: str) -> str | None:
-        query = "SELECT value FROM settings WHERE guild_id = $1 AND key = $2"
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(query, guild_id, key)
-            return row["value"] if row else None
+        settings = await self.get_guild_settings(guild_id)
+        return settings.get(key)
 
     async def delete_setting(self, guild_id: int, key: str):
         query = "DELETE FROM settings WHERE guild_id = $1 AND key = $2"
         async with self.pool.acquire() as conn:
             await conn.execute(query, guild_id, key)
+            self._settings_generation += 1
+            cached = self.settings_cache.get(guild_id)
+            if cached is not None:
+                cached.pop(key, None)
+            await self._publish_settings_change(conn, guild_id)
 
     async def delete_all_settings_for_guild(self, guild_id: int):
         query = "DELETE FROM settings WHERE guild_id = $1"
         async with self.pool.acquire() as conn:
             await conn.execute(query, guild_id)
+            self.invalidate_guild_settings(guild_id)
+            await self._publish_settings_change(conn, guild_id)
+
+    # === 読み上げ辞書系 ===
+
+    async def _migrate_word_dict(self, conn):
+        # 旧形式（settings の word_dict にJSONで丸ごと保存）を行に移す
+        try:
+            async with conn.transaction():
+                moved = await conn.fetchval("""
+                    WITH moved AS (
+                        INSERT INTO read_dictionary (guild_id, word, reading)
+                        SELECT s.guild_id, d.key, d.value
+                        FROM settings s, jsonb_each_text(s.value::jsonb) d
+                        WHERE s.key = 'word_dict'
+                        ON CONFLICT DO NOTHING
+                        RETURNING 1
+                    )
+                    SELECT count(*) FROM moved
+                """)
+                await conn.execute("DELETE FROM settings WHERE key = 'word_dict'")
+            if moved:
+                print(f"[DBHandler] 読み上げ辞書 {moved} 件を read_dictionary に移行しました。")
+        except Exception as e:
+            print(f"[DBHandler] 読み上げ辞書の移行に失敗: {e}")
+
+    async def get_read_dictionary(self, guild_id: int) -> dict[str, str]:
+        query = "SELECT word, reading FROM read_dictionary WHERE guild_id = $1"
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(query, guild_id)
+        return {row["word"]: row["reading"] for row in rows}
+
+    async def set_read_word(self, guild_id: int, word: str, reading: str):
+        query = """
+            INSERT INTO read_dictionary (guild_id, word, reading)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (guild_id, word)
+            DO UPDATE SET reading = EXCLUDED.reading
+        """
+        async with self.pool.acquire() as conn:
+            await conn.execute(query, guild_id, word, reading)
+
+    async def delete_read_word(self, guild_id: int, word: str) -> bool:
+        query = "DELETE FROM read_dictionary WHERE guild_id = $1 AND word = $2"
+        async with self.pool.acquire() as conn:
+            result = await conn.execute(query, guild_id, word)
+        return result != "DELETE 0"
+
+    # === NGワード系 ===
+
+    async def get_ngwords(self, guild_id: int) -> list[tuple[str, int | None]]:
+        """(単語, channel_id) のリスト。ギルド全体のものは channel_id が None"""
+        query = "SELECT word, channel_id FROM ngwords WHERE guild_id = $1"
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(query, guild_id)
+        return [(row["word"], row["channel_id"] or None) for row in rows]
+
+    async def add_ngword(self, guild_id: int, word: str, channel_id: int | None = None):
+        query = "INSERT INTO ngwords (guild_id, channel_id, word) VALUES ($1, $2, $3) ON CONFLICT DO NOTHING"
+        async with self.pool.acquire() as conn:
+            await conn.execute(query, guild_id, channel_id or 0, word)
+
+    async def remove_ngword(self, guild_id: int, word: str) -> bool:
+        # ギルド全体・チャンネル限定のどちらに登録されていても消す
+        query = "DELETE FROM ngwords WHERE guild_id = $1 AND word = $2"
+        async with self.pool.acquire() as conn:
+            result = await conn.execute(query, guild_id, word)
+        return result != "DELETE 0"
 
     # === pets系 ===
 
@@ -138,5 +293,29 @@ class DBHandler(commands.Cog):
             rows = await conn.fetch(query)
             return [(r["guild_id"], int(r["channel_id"])) for r in rows if r["channel_id"].isdigit()]
 
+    # === 共有プールの統計 ===
+
+    @app_commands.command(name="db_stats", description="DB接続プールの利用状況を表示します（管理者専用）")
+    async def db_stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("🚫 管理者権限が必要です。", ephemeral=True)
+            return
+
+        stats = self.bot.database.get_stats()
+        embed = discord.Embed(title="🗄️ DBプール統計", color=discord.Color.blue())
+        pool = stats.pop("_pool", None)
+        if pool:
+            embed.description = f"接続数: {pool['size']} (idle {pool['idle']}) / 上限 {pool['max_size']}"
+        for name, s in sorted(stats.items()):
+            embed.add_field(
+                name=name,
+                value=(
+                    f"取得 {s['acquires']}回 / 待ち avg {s['acquire_wait_avg_ms']:.1f}ms max {s['acquire_wait_max_ms']:.1f}ms\n"
+                    f"クエリ {s['queries']}回 / avg {s['query_avg_ms']:.1f}ms max {s['query_max_ms']:.1f}ms / エラー {s['errors']}"
+                ),
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(DBHandler(bot))
@@ -1,17 +1,59 @@
 import random
 import datetime
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands, Interaction, Member, Message
 import discord
 
 from utils import fortune
 from utils import economy_api
-from utils import userdb  # ← company_members テーブル操作用
+from utils.message_pipeline import STAGE_ECONOMY
+from utils.activity_accrual import ActivityAccrual, FLUSH_INTERVAL, calc_level
+from utils.leaderboard import Leaderboard, BOARDS, RESYNC_INTERVAL, RESYNC_RETRY_INTERVAL
 
 class Economy(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = bot.db  # ← BotにDB Poolがある前提
+        self.pool = bot.database.for_cog("Economy")
+        # 発言ごとの活動度・収入はここに貯めてまとめて反映する
+        self.accrual = ActivityAccrual(self.pool)
+        # /rank 用の順位索引（経済APIの応答で随時更新）
+        self.leaderboard = Leaderboard()
+
+    async def cog_load(self):
+        self.accrual.load_pending()
+        self.flush_activity.change_interval(seconds=FLUSH_INTERVAL)
+        self.flush_activity.start()
+        economy_api.add_user_listener(self.leaderboard.update)
+        self.resync_leaderboard.change_interval(seconds=RESYNC_INTERVAL)
+        self.resync_leaderboard.start()
+        self.bot.message_pipeline.add_loader("economy_user", self.load_economy_user)
+        self.bot.message_pipeline.add_stage("economy", self.handle_message, STAGE_ECONOMY, guild_only=False, background=True)
+
+    async def cog_unload(self):
+        self.bot.message_pipeline.remove_stage("economy")
+        self.bot.message_pipeline.remove_loader("economy_user")
+        self.flush_activity.cancel()
+        self.resync_leaderboard.cancel()
+        economy_api.remove_user_listener(self.leaderboard.update)
+        await self.accrual.close()
+
+    @tasks.loop(seconds=15)
+    async def flush_activity(self):
+        await self.accrual.flush()
+
+    @tasks.loop(seconds=3600)
+    async def resync_leaderboard(self):
+        # 起動直後と以降は間隔ごとに全件を取り直す（普段は差分で更新される）
+        users = await economy_api.get_all_users()
+        if users:
+            self.leaderboard.load(users)
+        # 一度も取れていなければ1時間待たずに取り直す
+        interval = RESYNC_INTERVAL if self.leaderboard.synced else RESYNC_RETRY_INTERVAL
+        if self.resync_leaderboard.seconds != interval:
+            self.resync_leaderboard.change_interval(seconds=interval)
+
+    async def load_economy_user(self, ctx):
+        return await self.accrual.get_user(self.get_shared_id(ctx.message.author))
 
     def get_shared_id(self, user: discord.User):
         return str(user.id)
@@ -49,7 +91,7 @@ class Economy(commands.Cog):
         activity = user.get("activity_score", 100)
         level = user.get("level", 1)
         fortune_effects = await fortune.get_today_fortune_effects(interaction.user.id)
-        income_multiplier = fortune_effects.get("income_multiplier", 1.0)
+        income_multiplier = fortune_effects.get("economy", {}).get("income_multiplier", 1.0)
 
         base_income = int(random.randint(int(activity * level * 1.5 * 10), int(activity * level * 2.0 * 10)) * income_multiplier)
 
@@ -57,21 +99,22 @@ class Economy(commands.Cog):
         company_bonus = 0
         company_id = user.get("company_id")
 
-        async with self.db.pool.acquire() as conn:
-            if company_id:
-                row = await conn.fetchrow("SELECT total_assets FROM company_members WHERE company_id = $1", int(company_id))
-                if row:
-                    total_assets = row["total_assets"]
-                    bonus_rate = random.uniform(0.0025, 0.0075)
-                    company_bonus = int(total_assets * bonus_rate)
-                await userdb.add_assets_to_user(conn, int(company_id), base_income)
+        if company_id:
+            async with self.pool.acquire() as conn:
+                total_assets = await conn.fetchval(
+                    "UPDATE company_members SET total_assets = total_assets + $1 WHERE company_id = $2 RETURNING total_assets",
+                    base_income, int(company_id)
+                )
+            if total_assets is not None:
+                bonus_rate = random.uniform(0.0025, 0.0075)
+                company_bonus = int((total_assets - base_income) * bonus_rate)
 
         total_income = base_income + company_bonus
 
-        await economy_api.update_user(shared_id, {
-            "balance": user["balance"] + total_income,
-            "last_work_time": now.isoformat()
-        })
+        # 残高は加算、最終勤務時刻は上書きを1リクエストで
+        updated = await economy_api.increment(shared_id, {"balance": total_income}, {"last_work_time": now.isoformat()})
+        if updated is None:
+            return await interaction.response.send_message("❌ 報酬の反映に失敗しました。", ephemeral=True)
 
         msg = f"💼 お疲れさまです！{base_income} 円を獲得しました。"
         if company_bonus > 0:
@@ -88,14 +131,10 @@ class Economy(commands.Cog):
         sender_id = self.get_shared_id(interaction.user)
         recipient_id = self.get_shared_id(target)
 
-        sender = await self.ensure_user(sender_id)
-        recipient = await self.ensure_user(recipient_id)
-
-        if sender["balance"] < amount:
-            return await interaction.response.send_message("❌ 残高不足です。", ephemeral=True)
-
-        await economy_api.update_user(sender_id, {"balance": sender["balance"] - amount})
-        await economy_api.update_user(recipient_id, {"balance": recipient["balance"] + amount})
+        # 残高チェックと両者の増減はサーバー側で1トランザクション
+        result = await economy_api.transfer(sender_id, recipient_id, amount)
+        if result is None:
+            return await interaction.response.send_message("❌ 残高不足、または送金に失敗しました。", ephemeral=True)
 
         await interaction.response.send_message(
             f"✅ {interaction.user.mention} → {target.mention} に {amount} 円を送金しました。"
@@ -114,13 +153,15 @@ class Economy(commands.Cog):
             f"✅ {user.mention} の所持金を {amount} 円に設定しました。"
         )
 
-    @commands.Cog.listener()
-    async def on_message(self, message: Message):
-        if message.author.bot or len(message.content.strip()) < 5:
+    async def handle_message(self, ctx):
+        if ctx.flags["content_length"] < 5:
             return
 
+        message = ctx.message
         shared_id = self.get_shared_id(message.author)
-        user = await self.ensure_user(shared_id)
+        user = await ctx.load("economy_user")
+        if user is None:
+            return
 
         today = datetime.date.today()
         last_date_str = user.get("last_active_date")
@@ -133,61 +174,72 @@ class Economy(commands.Cog):
         else:
             activity = user.get("activity_score", 100.0)
 
-        activity += round(random.uniform(0.5, 1.0), 2)
+        gain = round(random.uniform(0.5, 1.0), 2)
+        activity += gain
 
         balance = user.get("balance", 0)
-        total = balance + activity
-        level = 1
-        threshold, increment = 500, 150
-        while total >= threshold:
-            level += 1
-            threshold += increment
-            increment += 150
+        level = calc_level(balance, activity)
 
         income = 0
         if random.randint(1, 10) <= 3:
             income = int(activity * level * 10)
             if reset or not last_date_str:
                 income *= 10
-            user["balance"] += income
 
         company_id = user.get("company_id")
 
-        async with self.db.pool.acquire() as conn:
-            if income > 0 and company_id:
-                await userdb.add_assets_to_user(conn, int(company_id), income)
+        # APIへの反映は ActivityAccrual がまとめて行う
+        self.accrual.add(
+            shared_id, user,
+            activity_gain=gain,
+            reset=reset,
+            today=today.isoformat(),
+            income=income,
+            level=level,
+            company_id=int(company_id) if company_id else None
+        )
 
-        await economy_api.update_user(shared_id, {
-            "activity_score": round(activity, 2),
-            "last_active_date": today.isoformat(),
-            "balance": user["balance"],
-            "level": level
-        })
+    @app_commands.command(name="activity_stats", description="活動度の書き込み待ち状況を表示します（管理者専用）。")
+    async def activity_stats(self, interaction: Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            return await interaction.response.send_message("🚫 管理者専用コマンドです。", ephemeral=True)
+        s = self.accrual.get_stats()
+        await interaction.response.send_message(
+            f"📝 未反映ユーザー: {s['pending_users']}人 / 企業: {s['pending_companies']}社\n"
+            f"⏱️ 現在の遅延: {s['current_lag']:.1f}秒 / 前回: {s['last_flush_lag']:.1f}秒 / 最大: {s['max_flush_lag']:.1f}秒\n"
+            f"💾 書き込み回数: {s['flushes']}回 / 反映 {s['flushed_users']}件 / 失敗 {s['failed_users']}件 "
+            f"(前回 {s['last_flush_duration'] * 1000:.0f}ms)",
+            ephemeral=True
+        )
 
     @app_commands.command(name="rank", description="ユーザーのレベルランキングを表示します。")
-    @app_commands.describe(page="表示するページ番号（1ページ30人）")
-    async def rank(self, interaction: Interaction, page: int = 1):
-        users = await economy_api.get_all_users()
-        if not users:
+    @app_commands.describe(page="表示するページ番号（1ページ30人）", by="並び順")
+    @app_commands.choices(by=[app_commands.Choice(name=label, value=key) for key, label in BOARDS.items()])
+    async def rank(self, interaction: Interaction, page: int = 1, by: str = "level"):
+        if not self.leaderboard.loaded or not len(self.leaderboard):
             return await interaction.response.send_message("📉 ランキングデータが見つかりません。")
 
-        users.sort(key=lambda x: x.get("level", 1), reverse=True)
-        total_pages = (len(users) + 29) // 30
+        total_pages = self.leaderboard.total_pages(30)
         page = max(1, min(page, total_pages))
-        start = (page - 1) * 30
-        end = start + 30
-        ranking_slice = users[start:end]
+        rows = self.leaderboard.page(by, page, 30)
 
+        # 初回の全件同期が済むまでは起動後に見えたユーザーだけなので、順位は付けない
+        synced = self.leaderboard.synced
         embed = discord.Embed(
-            title=f"🏆 レベルランキング（ページ {page}/{total_pages}）",
-            description="現在のトップユーザーたちのランキングです。",
+            title=f"🏆 {BOARDS[by]}ランキング（ページ {page}/{total_pages}）",
+            description="現在のトップユーザーたちのランキングです。" if synced
+            else "⏳ 集計中です。起動後に更新があったユーザーだけを表示しています（順位は確定していません）。",
             color=discord.Color.gold()
         )
 
-        for i, user in enumerate(ranking_slice, start=start + 1):
-            mention = f"<@{user['shared_id']}>"
-            level = user.get("level", 1)
-            embed.add_field(name=f"{i}位", value=f"{mention}：Lv.{level}", inline=False)
+        for rank, shared_id, level, balance in rows:
+            mention = f"<@{shared_id}>"
+            value = f"{mention}：Lv.{level}" if by == "level" else f"{mention}：{balance:,} 円"
+            embed.add_field(name=f"{rank}位" if synced else "集計中", value=value, inline=False)
+
+        my_rank = self.leaderboard.rank_of(by, self.get_shared_id(interaction.user)) if synced else None
+        if my_rank:
+            embed.set_footer(text=f"あなたの順位: {my_rank}位 / {len(self.leaderboard)}人")
 
         await interaction.response.send_message(embed=embed)
 
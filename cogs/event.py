@@ -4,14 +4,16 @@ from discord import app_commands, Interaction, Embed, ui
 from discord.ext import commands
 import random
 import string
-from utils.event_db import UserDBHandler  # ← これを作成済み前提
 import datetime
-import asyncpg
 
 class EventCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = bot.userdb
+
+    @property
+    def db(self):
+        # イベント投稿は UserDBHandler のテーブルに保存している
+        return self.bot.get_cog("UserDBHandler")
 
     async def generate_see_id(self):
         while True:
@@ -33,28 +35,52 @@ class EventCog(commands.Cog):
         )
         embed.set_footer(text="Orbis イベントシステム")
 
-        # DM送信（ユーザー全体）
-        for user in self.bot.users:
-            try:
-                await user.send(embed=embed)
-            except Exception:
-                continue
+        # DM（ユーザー全体）とサーバーの通知チャンネルへ。送信は裏で、レート制限に合わせて進める
+        targets = [("user", user.id) for user in self.bot.users if not user.bot]
+        targets += [("channel", guild.system_channel.id) for guild in self.bot.guilds if guild.system_channel]
+        job_id = await self.bot.broadcaster.start(
+            "event_start", targets, {"embed": embed.to_dict()}, report_channel_id=interaction.channel_id
+        )
 
-        # サーバー送信（通知チャンネル仮定）
-        for guild in self.bot.guilds:
-            if guild.system_channel:
-                try:
-                    await guild.system_channel.send(embed=embed)
-                except Exception:
-                    continue
+        await interaction.followup.send(
+            f"イベント開始通知の送信を開始しました（#{job_id}、{len(targets)}件）。進捗はこのチャンネルに表示されます。"
+        )
 
-        await interaction.followup.send("イベント開始通知をすべてのサーバーとユーザーに送信しました！")
+    @app_commands.command(name="broadcast_status", description="一斉送信の進捗と失敗の内訳を表示します（管理者専用）。")
+    @app_commands.describe(job_id="一斉送信のID")
+    async def broadcast_status(self, interaction: discord.Interaction, job_id: int):
+        if not is_event_admin(interaction.user.id):
+            await interaction.response.send_message("⚠️ このコマンドは管理者専用です。", ephemeral=True)
+            return
+        job = await self.bot.broadcaster.get_job(job_id)
+        if job is None:
+            await interaction.response.send_message("❌ その一斉送信は見つかりません。", ephemeral=True)
+            return
+        errors = await self.bot.broadcaster.get_errors(job_id)
+        error_text = "\n".join(f"・{row['error']}: {row['cnt']}件" for row in errors) or "なし"
+        await interaction.response.send_message(
+            f"📣 #{job_id}（{job['name']}）: {job['status']}\n"
+            f"送信 {job['sent']} / 失敗 {job['failed']} / 全 {job['total']}件\n"
+            f"失敗の内訳:\n{error_text}",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="broadcast_cancel", description="一斉送信を中止します（管理者専用）。")
+    @app_commands.describe(job_id="一斉送信のID")
+    async def broadcast_cancel(self, interaction: discord.Interaction, job_id: int):
+        if not is_event_admin(interaction.user.id):
+            await interaction.response.send_message("⚠️ このコマンドは管理者専用です。", ephemeral=True)
+            return
+        if await self.bot.broadcaster.cancel(job_id):
+            await interaction.response.send_message(f"🛑 一斉送信 #{job_id} を中止しました。", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"⚠️ 一斉送信 #{job_id} は実行中ではありません。", ephemeral=True)
 
     @app_commands.command(name="event_submit", description="イベントに画像とコメントで投稿します。")
     @app_commands.describe(image="投稿する画像", comment="コメントを入力してください")
     async def event_submit(self, interaction: discord.Interaction, image: discord.Attachment, comment: str):
         await interaction.response.defer()
-        see_id = self.generate_see_id()
+        see_id = await self.generate_see_id()
         image_url = image.url
 
         await self.db.add_event_submission(user_id=interaction.user.id, image_url=image_url, comment=comment, see_id=see_id)
@@ -3,8 +3,6 @@ from discord.ext import commands
 from discord import app_commands
 import random
 from utils import economy_api
-import aiohttp
-import asyncio
 
 CHOICES = {
     "✊": "rock",
@@ -28,11 +26,10 @@ class JankenButton(discord.ui.Button):
 
 
 class JankenView(discord.ui.View):
-    def __init__(self, shared_id, bet_amount, session, timeout=60):
+    def __init__(self, shared_id, bet_amount, timeout=60):
         super().__init__(timeout=timeout)
         self.shared_id = shared_id
         self.bet_amount = bet_amount
-        self.session = session
         self.rounds = 0
         self.user_wins = 0
         self.dealer_wins = 0
@@ -81,9 +78,9 @@ class JankenView(discord.ui.View):
         multiplier = MULTIPLIERS.get(self.user_wins, 0)
         winnings = int(self.bet_amount * multiplier)
 
-        api = economy_api.EconomyAPI(self.session)
+        api = economy_api.EconomyAPI()
         if multiplier > 0:
-            await api.update_user(self.shared_id, {"delta": winnings})
+            await api.increment(self.shared_id, {"balance": winnings})
             result_text = f"🎉 {self.user_wins}勝で{winnings}円ゲット！（倍率x{multiplier}）"
         else:
             result_text = f"💸 全敗でした……残念！掛け金は戻りません。"
@@ -99,7 +96,6 @@ class JankenView(discord.ui.View):
 class Janken(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
 
     @app_commands.command(name="janken", description="じゃんけんでお金を稼ごう！3本勝負です")
     @app_commands.describe(bet="掛け金（所持金の範囲内で）")
@@ -109,7 +105,7 @@ class Janken(commands.Cog):
             return
 
         shared_id = f"{interaction.guild.id}-{interaction.user.id}"
-        api = economy_api.EconomyAPI(self.session)
+        api = economy_api.EconomyAPI()
         user = await api.get_user(shared_id)
         if not user:
             await interaction.response.send_message("ユーザー情報が取得できませんでした。", ephemeral=True)
@@ -119,17 +115,17 @@ class Janken(commands.Cog):
             await interaction.response.send_message(f"所持金が不足しています。現在の所持金：{user['balance']}円", ephemeral=True)
             return
 
-        await api.update_user(shared_id, {"delta": -bet})  # 掛け金を引く
+        # 掛け金を引く（残高が足りるときだけ）
+        if await api.conditional_debit(shared_id, bet) is None:
+            await interaction.response.send_message("所持金が不足しています。", ephemeral=True)
+            return
 
-        view = JankenView(shared_id, bet, self.session)
+        view = JankenView(shared_id, bet)
         await interaction.response.send_message(
             content=f"🎲 じゃんけんスタート！掛け金：{bet}円\n3回じゃんけんしましょう！ボタンを押して選んでください！",
             view=view
         )
 
-    def cog_unload(self):
-        asyncio.create_task(self.session.close())
-
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Janken(bot))
\ No newline at end of file
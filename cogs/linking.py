@@ -1,10 +1,9 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import httpx
-import os
+import aiohttp
 
-API_BASE_URL = os.getenv("ECONOMY_API_URL", "http://localhost:8000")
+from utils import http_client
 
 class LinkCog(commands.Cog):
     def __init__(self, bot):
@@ -15,22 +14,22 @@ class LinkCog(commands.Cog):
     async def link_start(self, interaction: discord.Interaction):
         shared_id = str(interaction.user.id)  # ここは共通IDに置き換えてもOK
 
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.post(f"{API_BASE_URL}/link-code", json={
-                    "source": "discord",
-                    "universal_id": shared_id
-                })
-                resp.raise_for_status()
-                data = resp.json()
-                code = data["code"]
-
-                await interaction.response.send_message(
-                    f"✅ あなたの連携コードは `{code}` です。\nこのコードを連携先のサービスで入力してください。",
-                    ephemeral=True
-                )
-            except httpx.HTTPError as e:
-                await interaction.response.send_message("❌ 連携コードの取得に失敗しました。", ephemeral=True)
+        try:
+            resp = await http_client.request("economy", "POST", "/link-code", json={
+                "source": "discord",
+                "universal_id": shared_id
+            })
+        except aiohttp.ClientError:
+            resp = None
+        if resp is None or not resp.ok:
+            await interaction.response.send_message("❌ 連携コードの取得に失敗しました。", ephemeral=True)
+            return
+
+        code = resp.data["code"]
+        await interaction.response.send_message(
+            f"✅ あなたの連携コードは `{code}` です。\nこのコードを連携先のサービスで入力してください。",
+            ephemeral=True
+        )
 
     # /link-complete <code> → サービスで表示されたコードを入力して連携する
     @app_commands.command(name="link_complete", description="コードを使って連携を完了します")
@@ -38,25 +37,25 @@ class LinkCog(commands.Cog):
     async def link_complete(self, interaction: discord.Interaction, code: str):
         target_id = str(interaction.user.id)
 
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.post(f"{API_BASE_URL}/link", json={
-                    "code": code,
-                    "target_type": "discord",
-                    "target_id": target_id
-                })
-                resp.raise_for_status()
-                data = resp.json()
-
-                await interaction.response.send_message(
-                    f"✅ 連携が完了しました！\n共通ID: `{data['universal_id']}`",
-                    ephemeral=True
-                )
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    await interaction.response.send_message("❌ 無効または期限切れのコードです。", ephemeral=True)
-                else:
-                    await interaction.response.send_message("❌ 連携中にエラーが発生しました。", ephemeral=True)
+        try:
+            resp = await http_client.request("economy", "POST", "/link", json={
+                "code": code,
+                "target_type": "discord",
+                "target_id": target_id
+            })
+        except aiohttp.ClientError:
+            resp = None
+        if resp is not None and resp.status == 404:
+            await interaction.response.send_message("❌ 無効または期限切れのコードです。", ephemeral=True)
+            return
+        if resp is None or not resp.ok:
+            await interaction.response.send_message("❌ 連携中にエラーが発生しました。", ephemeral=True)
+            return
+
+        await interaction.response.send_message(
+            f"✅ 連携が完了しました！\n共通ID: `{resp.data['universal_id']}`",
+            ephemeral=True
+        )
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(LinkCog(bot))
@@ -114,6 +114,8 @@ class Love(commands.Cog):
 
         all_users = await db.get_all_user_ids()
 
+        # DMは一斉送信にまとめて渡す（1件ずつ待たない）
+        targets = []
         for user_id in all_users:
             last_trigger = self.event_cache.get(str(user_id))
             if last_trigger == today_str:
@@ -126,21 +128,17 @@ class Love(commands.Cog):
             love, affection, _ = await self.get_user_love_status(user_id)
             result = self.try_love_event(user_id, partner_id, affection, love)
             if result:
-                try:
-                    user = self.bot.get_user(int(user_id)) or await self.bot.fetch_user(int(user_id))
-                    if user:
-                        embed = discord.Embed(
-                            title=f"💖 特別なイベント発生！",
-                            description=result["text"],
-                            color=0xff69b4
-                        )
-                        embed.set_image(url=result["image"])
-                        await user.send(embed=embed)
-                        self.event_cache[str(user_id)] = today_str
-                except Exception as e:
-                    print(f"[ERROR] DM送信失敗: {e}")
-                    continue
-
+                embed = discord.Embed(
+                    title=f"💖 特別なイベント発生！",
+                    description=result["text"],
+                    color=0xff69b4
+                )
+                embed.set_image(url=result["image"])
+                targets.append(("user", int(user_id), {"embed": embed.to_dict()}))
+                self.event_cache[str(user_id)] = today_str
+
+        if targets:
+            await self.bot.broadcaster.start("love_event", targets)
         self.save_event_cache()
 
 
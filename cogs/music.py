@@ -2,39 +2,29 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from discord.voice_client import VoiceClient
+import os
 import asyncio
-import yt_dlp
-import asyncpg
-import random
 import traceback
-from userdb import UserDBHandler
-from db import DBHandler
-
-
-
-YTDL_OPTIONS = {
-    "format": "bestaudio/best",
-    "noplaylist": True,
-    "quiet": True,
-    "extractaudio": True,
-    "audioformat": "mp3",
-    "outtmpl": "%(id)s.%(ext)s",
-    "restrictfilenames": True,
-    "nocheckcertificate": True,
-    "ignoreerrors": False,
-    "logtostderr": False,
-    "no_warnings": True,
-    "default_search": "auto",
-    "source_address": "0.0.0.0"
-}
+from cogs.db import DBHandler
+from utils.music_extract import MusicExtractor, is_playlist_url
+from utils.play_queue import PlayQueue
+from utils.playlists import PlaylistStore, PAGE_SIZE as PLAYLIST_PAGE_SIZE, MAX_TRACKS as PLAYLIST_MAX_TRACKS
+
+
+# 再生中に先読みしておく後続の曲数
+PREFETCH_TRACKS = int(os.getenv("MUSIC_PREFETCH_TRACKS", 2))
+# /music_queue の1ページあたりの曲数
+QUEUE_PAGE_SIZE = int(os.getenv("MUSIC_QUEUE_PAGE_SIZE", 10))
+# /playlist_play で曲情報を同時に問い合わせる数
+PLAYLIST_RESOLVE_CONCURRENCY = int(os.getenv("MUSIC_PLAYLIST_RESOLVE_CONCURRENCY", 4))
 
 FFMPEG_OPTIONS = {
+    # ストリームが途中で切れたら繋ぎ直す
+    "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
     "options": "-vn"
 }
 
 class YTDLSource(discord.PCMVolumeTransformer):
-    ytdl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
-
     def __init__(self, source, *, data, volume=0.5):
         super().__init__(source, volume)
         self.data = data
@@ -42,29 +32,47 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.url = data.get("url")
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=False):
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: cls.ytdl.extract_info(url, download=not stream))
-        if data is None:
-            raise Exception("情報取得に失敗しました。")
-        if "entries" in data:
-            data = data["entries"][0]
-        filename = data["url"] if stream else cls.ytdl.prepare_filename(data)
-        source = discord.FFmpegPCMAudio(filename, **FFMPEG_OPTIONS)
+    def from_info(cls, data: dict):
+        """抽出済みの情報（MusicExtractor.extract の結果）からストリーム再生用のソースを作る"""
+        source = discord.FFmpegPCMAudio(data["url"], **FFMPEG_OPTIONS)
         return cls(source, data=data)
 
+class Track:
+    """キューに積む曲の情報だけ（ストリームURLやffmpegは再生直前に用意する）"""
+
+    __slots__ = ("url", "title", "webpage_url", "duration", "requester_id")
+
+    def __init__(self, url: str, title: str, webpage_url: str | None = None,
+                 duration: int | None = None, requester_id: int | None = None):
+        self.url = url
+        self.title = title
+        self.webpage_url = webpage_url
+        self.duration = duration
+        self.requester_id = requester_id
+
+    @classmethod
+    def from_info(cls, info: dict, query: str, requester_id: int | None = None) -> "Track":
+        # 検索語より動画ページのURLの方が、あとで引き直したときに同じ曲になる
+        page = info.get("webpage_url")
+        return cls(page or query, info.get("title") or query, page, info.get("duration"), requester_id)
+
 class MusicPlayer:
-    def __init__(self, bot: commands.Bot, guild: discord.Guild):
+    def __init__(self, bot: commands.Bot, guild: discord.Guild, extractor: MusicExtractor):
         self.bot = bot
         self.guild = guild
-        self.queue = asyncio.Queue()
+        self.extractor = extractor
+        self.queue = PlayQueue()
         self.next = asyncio.Event()
-        self.current = None  # 現在のYTDLSource
+        self.current: Track | None = None  # 現在の曲
         self.voice_client: VoiceClient | None = None
         self.loop = False
-        self.shuffle = False
+        # 「前の曲」で今の曲をキューに戻したとき（履歴に積まず、ループでも繰り返さない）
+        self.rewinding = False
+        # /music_jump で飛ばしたとき（ループ中でも今の曲を繰り返さず、キューから次を取る）
+        self.jumping = False
         self.play_task = None
         self.stopped = False
+        self.prefetch_tasks: set[asyncio.Task] = set()
 
     async def connect_voice(self, channel: discord.VoiceChannel):
         if self.voice_client and self.voice_client.is_connected():
@@ -75,39 +83,60 @@ class MusicPlayer:
     def is_playing(self):
         return self.voice_client and self.voice_client.is_playing()
 
+    async def prepare(self, track: Track) -> YTDLSource:
+        """再生直前にストリームURLを引き、ffmpegを起動する（先読み済みならキャッシュから）"""
+        return YTDLSource.from_info(await self.extractor.extract(track.url))
+
+    def prefetch(self):
+        # 次の数曲のストリームURLを今のうちに引いておく（ffmpegはまだ起動しない）
+        for track in self.queue.peek(PREFETCH_TRACKS):
+            task = asyncio.create_task(self.extractor.extract(track.url))
+            self.prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_done)
+
+    def _prefetch_done(self, task: asyncio.Task):
+        self.prefetch_tasks.discard(task)
+        # 失敗しても再生時にもう一度試すので、例外は回収するだけ
+        if not task.cancelled():
+            task.exception()
+
     async def play_loop(self):
         while not self.stopped:
             self.next.clear()
             try:
-                if self.loop and self.current:
-                    source = self.current
+                if self.loop and self.current and not (self.rewinding or self.jumping):
+                    track = self.current
                 else:
-                    source = await self.queue.get()
-                    self.current = source
+                    self.rewinding = False
+                    self.jumping = False
+                    track = await self.queue.get()
+                    self.current = track
             except asyncio.CancelledError:
                 break
 
             if not self.voice_client or not self.voice_client.is_connected():
                 break
 
+            try:
+                source = await self.prepare(track)
+            except Exception as e:
+                print(f"[Music] guild={self.guild.id} {track.title} を再生できません: {e}")
+                self.current = None
+                if self.queue.empty():
+                    break
+                continue
+
             self.voice_client.play(source, after=lambda e: self.bot.loop.call_soon_threadsafe(self.next.set))
+            self.prefetch()
             await self.next.wait()
+            if not self.rewinding and (self.jumping or not self.loop):
+                self.queue.history.append(track)
 
             # ループオフかつキュー空なら停止
             if self.queue.empty() and not self.loop:
                 self.current = None
                 break
 
-            # シャッフル時はキューをシャッフルしループさせる
-            if self.queue.empty() and self.shuffle:
-                # キューシャッフルは一旦queueからリスト取り出してシャッフルして再投入
-                new_items = []
-                while not self.queue.empty():
-                    new_items.append(await self.queue.get())
-                random.shuffle(new_items)
-                for item in new_items:
-                    await self.queue.put(item)
-
     async def start_playing(self):
         if self.play_task is None or self.play_task.done():
             self.stopped = False
@@ -119,6 +148,8 @@ class MusicPlayer:
             self.voice_client.stop()
         if self.play_task:
             self.play_task.cancel()
+        for task in self.prefetch_tasks:
+            task.cancel()
         self.current = None
         # キュークリアは呼び出し側で行うことが多い
 
@@ -134,21 +165,50 @@ class MusicPlayer:
         if self.voice_client and self.voice_client.is_playing():
             self.voice_client.stop()
 
+    async def previous(self) -> Track | None:
+        """1つ前の曲に戻る。今の曲はその次に再生されるようキューの先頭に戻す"""
+        if not self.queue.history:
+            return None
+        track = self.queue.history.pop()
+        if self.current:
+            self.queue.appendleft(self.current)
+        self.queue.appendleft(track)
+        if self.is_playing() or (self.voice_client and self.voice_client.is_paused()):
+            self.rewinding = True
+            self.voice_client.stop()
+        else:
+            await self.start_playing()
+        return track
+
+    async def jump(self, index: int):
+        """キューの index 番目（0始まり）の曲まで飛ばす"""
+        self.queue.jump(index)
+        if self.is_playing() or (self.voice_client and self.voice_client.is_paused()):
+            self.jumping = True
+            self.voice_client.stop()
+
     def get_queue_list(self):
-        # queue._queueはdequeなのでリストに変換
-        return list(self.queue._queue)
+        return list(self.queue)
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.players = {}  # guild.id -> MusicPlayer
-        # DBハンドラはUserDBHandlerをbotにセット済みと想定
-        self.userdb: UserDBHandler = bot.get_cog("UserDBHandler")
-        self.db: DBHandler = bot.get_cog("DBHandler")
+        self.db: DBHandler | None = None
+        self.playlists = PlaylistStore(bot.database.for_cog("Music"))
+        # yt-dlp の抽出は専用プロセスで（結果はURL/動画IDごとにキャッシュ）
+        self.extractor = MusicExtractor()
+
+    async def cog_load(self):
+        self.db = self.bot.get_cog("DBHandler")
+        await self.playlists.init()
+
+    def cog_unload(self):
+        self.extractor.close()
 
     def get_player(self, guild: discord.Guild) -> MusicPlayer:
         if guild.id not in self.players:
-            self.players[guild.id] = MusicPlayer(self.bot, guild)
+            self.players[guild.id] = MusicPlayer(self.bot, guild, self.extractor)
         return self.players[guild.id]
 
     @app_commands.command(name="music_play", description="音楽を再生・キューに追加します。")
@@ -165,9 +225,10 @@ class Music(commands.Cog):
             await player.connect_voice(voice_state.channel)
 
         try:
-            source = await YTDLSource.from_url(url, loop=self.bot.loop, stream=True)
-            await player.queue.put(source)
-            await interaction.followup.send(f"✅ キューに追加しました: **{source.title}**")
+            # ここでは曲名の確認だけ。ストリームは再生直前に用意する
+            track = Track.from_info(await self.extractor.extract(url), url, interaction.user.id)
+            player.queue.append(track)
+            await interaction.followup.send(f"✅ キューに追加しました: **{track.title}**")
             if not player.is_playing():
                 await player.start_playing()
         except Exception as e:
@@ -198,29 +259,78 @@ class Music(commands.Cog):
         await interaction.response.send_message("⏭ 曲をスキップしました。")
 
     @app_commands.command(name="music_queue", description="キューの内容を表示します。")
-    async def music_queue(self, interaction: discord.Interaction):
+    @app_commands.describe(page="ページ番号")
+    async def music_queue(self, interaction: discord.Interaction, page: int = 1):
         player = self.get_player(interaction.guild)
-        queue = player.get_queue_list()
-        if not queue:
+        total = len(player.queue)
+        if not total:
             await interaction.response.send_message("キューは空です。", ephemeral=True)
             return
+        pages = (total + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE
+        if not 1 <= page <= pages:
+            await interaction.response.send_message(f"⚠️ ページは1〜{pages}で指定してください。", ephemeral=True)
+            return
+        start = (page - 1) * QUEUE_PAGE_SIZE
         embed = discord.Embed(title="再生キュー", color=discord.Color.blue())
-        for i, song in enumerate(queue, start=1):
+        if player.current:
+            embed.description = f"🎶 再生中: **{player.current.title}**"
+        for i, song in enumerate(player.queue.page(start, QUEUE_PAGE_SIZE), start=start + 1):
             embed.add_field(name=f"{i}.", value=song.title, inline=False)
+        shuffle = "・🔀シャッフル中" if player.queue.shuffled else ""
+        embed.set_footer(text=f"{page}/{pages}ページ・全{total}曲{shuffle}")
         await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="music_clear", description="キューを空にします。")
     async def music_clear(self, interaction: discord.Interaction):
         player = self.get_player(interaction.guild)
-        # キュー全クリア
-        while not player.queue.empty():
-            try:
-                player.queue.get_nowait()
-                player.queue.task_done()
-            except asyncio.QueueEmpty:
-                break
+        player.queue.clear()
         await interaction.response.send_message("🗑 キューを空にしました。")
 
+    @app_commands.command(name="music_remove", description="キューから曲を削除します。")
+    @app_commands.describe(number="キューの曲番号")
+    async def music_remove(self, interaction: discord.Interaction, number: int):
+        player = self.get_player(interaction.guild)
+        if not 1 <= number <= len(player.queue):
+            await interaction.response.send_message("⚠️ 無効な曲番号です。", ephemeral=True)
+            return
+        track = player.queue.remove(number - 1)
+        await interaction.response.send_message(f"🗑 キューから削除しました: **{track.title}**")
+
+    @app_commands.command(name="music_move", description="キューの曲の順番を変えます。")
+    @app_commands.describe(number="移動する曲番号", to="移動先の曲番号")
+    async def music_move(self, interaction: discord.Interaction, number: int, to: int):
+        player = self.get_player(interaction.guild)
+        size = len(player.queue)
+        if not (1 <= number <= size and 1 <= to <= size):
+            await interaction.response.send_message("⚠️ 無効な曲番号です。", ephemeral=True)
+            return
+        track = player.queue[number - 1]
+        player.queue.move(number - 1, to - 1)
+        await interaction.response.send_message(f"↕️ **{track.title}** を{to}番目に移動しました。")
+
+    @app_commands.command(name="music_jump", description="キューの指定した曲まで飛ばします。")
+    @app_commands.describe(number="キューの曲番号")
+    async def music_jump(self, interaction: discord.Interaction, number: int):
+        player = self.get_player(interaction.guild)
+        if not 1 <= number <= len(player.queue):
+            await interaction.response.send_message("⚠️ 無効な曲番号です。", ephemeral=True)
+            return
+        track = player.queue[number - 1]
+        await player.jump(number - 1)
+        await interaction.response.send_message(f"⏭ **{track.title}** まで飛ばしました。")
+
+    @app_commands.command(name="music_previous", description="前の曲に戻ります。")
+    async def music_previous(self, interaction: discord.Interaction):
+        player = self.get_player(interaction.guild)
+        if player.voice_client is None or not player.voice_client.is_connected():
+            await interaction.response.send_message("❌ ボイスチャンネルに接続していません。", ephemeral=True)
+            return
+        track = await player.previous()
+        if track is None:
+            await interaction.response.send_message("前の曲はありません。", ephemeral=True)
+            return
+        await interaction.response.send_message(f"⏮ 前の曲に戻ります: **{track.title}**")
+
     @app_commands.command(name="music_loop", description="ループ再生のON/OFFを切り替えます。")
     async def music_loop(self, interaction: discord.Interaction):
         player = self.get_player(interaction.guild)
@@ -230,8 +340,8 @@ class Music(commands.Cog):
     @app_commands.command(name="music_shuffle", description="シャッフル再生のON/OFFを切り替えます。")
     async def music_shuffle(self, interaction: discord.Interaction):
         player = self.get_player(interaction.guild)
-        player.shuffle = not player.shuffle
-        await interaction.response.send_message(f"🔀 シャッフル再生を {'ON' if player.shuffle else 'OFF'} にしました。")
+        player.queue.set_shuffle(not player.queue.shuffled)
+        await interaction.response.send_message(f"🔀 シャッフル再生を {'ON' if player.queue.shuffled else 'OFF'} にしました。")
 
     @app_commands.command(name="music_nowplaying", description="現在再生中の曲を表示します。")
     async def music_nowplaying(self, interaction: discord.Interaction):
@@ -241,156 +351,227 @@ class Music(commands.Cog):
         else:
             await interaction.response.send_message("現在再生中の曲はありません。", ephemeral=True)
 
-    # プレイリスト関連コマンドはUserDBHandlerを使う
+    @app_commands.command(name="music_stats", description="曲情報の取得状況を表示します（管理者専用）。")
+    async def music_stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("🚫 管理者権限が必要です。", ephemeral=True)
+            return
+        s = self.extractor.get_stats()
+        await interaction.response.send_message(
+            f"🎵 曲情報キャッシュ: ヒット率 {s['hit_rate'] * 100:.1f}% "
+            f"(ヒット {s['hits']} / 相乗り {s['coalesced']} / 取得 {s['misses']})\n"
+            f"保持 {s['cached']}件 / 取得中 {s['inflight']}件 / タイムアウト {s['timeouts']} / エラー {s['errors']}",
+            ephemeral=True
+        )
+
+    async def enqueue_entries(self, player: MusicPlayer, entries: list[dict], requester_id: int) -> tuple[int, int]:
+        """{"url", "title"} の並びを順番どおりにキューへ積む。(追加数, 失敗数) を返す
+
+        曲名が分からないものだけ最大 PLAYLIST_RESOLVE_CONCURRENCY 件ずつ並行して問い合わせ、
+        先頭から解決できた順にキューへ入れる（1曲目が入った時点で再生を始める）。
+        """
+        slots = asyncio.Semaphore(PLAYLIST_RESOLVE_CONCURRENCY)
+
+        async def resolve(entry: dict) -> Track:
+            if entry.get("title"):
+                return Track(entry["url"], entry["title"], entry["url"], entry.get("duration"), requester_id)
+            async with slots:
+                return Track.from_info(await self.extractor.extract(entry["url"]), entry["url"], requester_id)
+
+        tasks = [asyncio.create_task(resolve(entry)) for entry in entries]
+        added = failed = 0
+        try:
+            for task in tasks:
+                try:
+                    track = await task
+                except Exception as e:
+                    print(f"[Music] guild={player.guild.id} プレイリストの曲を読み込めません: {e}")
+                    failed += 1
+                    continue
+                # 読み込み中に /music_stop されたら残りは積まない
+                if added and player.stopped:
+                    break
+                player.queue.append(track)
+                added += 1
+                if not player.is_playing():
+                    await player.start_playing()
+        finally:
+            for task in tasks:
+                task.cancel()
+        return added, failed
+
+    async def load_saved_playlist(self, user_id: int, name: str) -> list[dict] | None:
+        playlist = await self.playlists.get(user_id, name)
+        if playlist is None:
+            return None
+        return [dict(row) for row in await self.playlists.tracks(playlist["playlist_id"])]
+
+    @app_commands.command(name="playlist_play", description="プレイリストの曲をまとめてキューに追加します。")
+    @app_commands.describe(name="自分のプレイリスト名、またはYouTubeなどのプレイリストURL")
+    async def playlist_play(self, interaction: discord.Interaction, name: str):
+        await interaction.response.defer()
+        voice_state = interaction.user.voice
+        if not voice_state or not voice_state.channel:
+            await interaction.followup.send("❌ ボイスチャンネルに参加してから使ってください。", ephemeral=True)
+            return
+
+        if name.startswith(("http://", "https://")):
+            if not is_playlist_url(name):
+                await interaction.followup.send("⚠️ プレイリストのURLではありません。1曲だけなら /music_play を使ってください。", ephemeral=True)
+                return
+            try:
+                entries = await self.extractor.extract_playlist(name)
+            except Exception as e:
+                await interaction.followup.send(f"❌ エラーが発生しました: {e}")
+                return
+            label = "プレイリスト"
+        else:
+            entries = await self.load_saved_playlist(interaction.user.id, name)
+            if entries is None:
+                await interaction.followup.send("⚠️ そのプレイリストは存在しません。", ephemeral=True)
+                return
+            label = f"プレイリスト「{name}」"
+        if not entries:
+            await interaction.followup.send("プレイリストは空です。", ephemeral=True)
+            return
+
+        player = self.get_player(interaction.guild)
+        if player.voice_client is None or not player.voice_client.is_connected():
+            await player.connect_voice(voice_state.channel)
+
+        await interaction.followup.send(f"⏳ {label}の{len(entries)}曲をキューに追加しています…")
+        added, failed = await self.enqueue_entries(player, entries, interaction.user.id)
+        message = f"✅ {label}から{added}曲をキューに追加しました。"
+        if failed:
+            message += f"（{failed}曲は読み込めませんでした）"
+        await interaction.followup.send(message)
+
+    # プレイリスト関連コマンド（曲は playlist_tracks に1行ずつ保存する）
 
     @app_commands.command(name="playlist_create", description="プレイリストを作成します。")
     @app_commands.describe(name="プレイリスト名")
     async def playlist_create(self, interaction: discord.Interaction, name: str):
-        user_id = interaction.user.id
-        key = f"playlist:{name}"
-        existing = await self.userdb.get_user_setting(user_id, key)
-        if existing is not None:
+        if not await self.playlists.create(interaction.user.id, name):
             await interaction.response.send_message("⚠️ その名前のプレイリストはすでに存在します。", ephemeral=True)
             return
-        await self.userdb.set_user_setting(user_id, key, "[]")
         await interaction.response.send_message(f"✅ プレイリスト「{name}」を作成しました。")
 
     @app_commands.command(name="playlist_remove", description="プレイリストを削除します。")
     @app_commands.describe(name="プレイリスト名")
     async def playlist_remove(self, interaction: discord.Interaction, name: str):
-        user_id = interaction.user.id
-        key = f"playlist:{name}"
-        existing = await self.userdb.get_user_setting(user_id, key)
-        if existing is None:
+        if not await self.playlists.delete(interaction.user.id, name):
             await interaction.response.send_message("⚠️ そのプレイリストは存在しません。", ephemeral=True)
             return
-        await self.userdb.delete_user_setting(user_id, key)
         await interaction.response.send_message(f"✅ プレイリスト「{name}」を削除しました。")
 
     @app_commands.command(name="playlist_list", description="自分のプレイリスト一覧を表示します。")
-    async def playlist_list(self, interaction: discord.Interaction):
-        user_id = interaction.user.id
-        query = "SELECT key FROM user_settings WHERE user_id = $1 AND key LIKE 'playlist:%'"
-        async with self.userdb.pool.acquire() as conn:
-            rows = await conn.fetch(query, user_id)
-        names = [row["key"][9:] for row in rows]  # 'playlist:'除去
-        if not names:
+    @app_commands.describe(page="ページ番号")
+    async def playlist_list(self, interaction: discord.Interaction, page: int = 1):
+        page = max(page, 1)
+        rows, total = await self.playlists.list_for_user(interaction.user.id, page)
+        if not total:
             await interaction.response.send_message("プレイリストがありません。", ephemeral=True)
             return
-        await interaction.response.send_message("🎵 プレイリスト一覧:\n" + "\n".join(names))
+        pages = (total + PLAYLIST_PAGE_SIZE - 1) // PLAYLIST_PAGE_SIZE
+        if not rows:
+            await interaction.response.send_message(f"⚠️ ページは1〜{pages}で指定してください。", ephemeral=True)
+            return
+        lines = "\n".join(f"{row['name']}（{row['track_count']}曲）" for row in rows)
+        await interaction.response.send_message(f"🎵 プレイリスト一覧（{page}/{pages}ページ）:\n{lines}")
 
     @app_commands.command(name="playlist_see", description="プレイリストの中身を表示します。")
-    @app_commands.describe(name="プレイリスト名")
-    async def playlist_see(self, interaction: discord.Interaction, name: str):
-        user_id = interaction.user.id
-        key = f"playlist:{name}"
-        data = await self.userdb.get_user_setting(user_id, key)
-        if data is None:
+    @app_commands.describe(name="プレイリスト名", page="ページ番号")
+    async def playlist_see(self, interaction: discord.Interaction, name: str, page: int = 1):
+        playlist = await self.playlists.get(interaction.user.id, name)
+        if playlist is None:
             await interaction.response.send_message("⚠️ そのプレイリストは存在しません。", ephemeral=True)
             return
-        import json
-        try:
-            playlist = json.loads(data)
-        except Exception:
-            playlist = []
-        if not playlist:
+        if not playlist["track_count"]:
             await interaction.response.send_message("プレイリストは空です。", ephemeral=True)
             return
-        desc = "\n".join(f"{i+1}. {item['title']}" for i, item in enumerate(playlist))
-        await interaction.response.send_message(f"🎶 プレイリスト「{name}」の曲:\n{desc}")
+        pages = (playlist["track_count"] + PLAYLIST_PAGE_SIZE - 1) // PLAYLIST_PAGE_SIZE
+        if not 1 <= page <= pages:
+            await interaction.response.send_message(f"⚠️ ページは1〜{pages}で指定してください。", ephemeral=True)
+            return
+        rows = await self.playlists.tracks(playlist["playlist_id"], page)
+        first = (page - 1) * PLAYLIST_PAGE_SIZE + 1
+        desc = "\n".join(f"{i}. {row['title'] or row['url']}" for i, row in enumerate(rows, start=first))
+        await interaction.response.send_message(
+            f"🎶 プレイリスト「{name}」の曲（{page}/{pages}ページ・全{playlist['track_count']}曲）:\n{desc}"
+        )
+
+    async def add_to_playlist(self, interaction: discord.Interaction, playlist_name: str,
+                              items: list[tuple[str, str | None, int | None]], what: str):
+        added = await self.playlists.append(interaction.user.id, playlist_name, items)
+        if added is None:
+            await interaction.followup.send("⚠️ そのプレイリストは存在しません。", ephemeral=True)
+        elif added < len(items):
+            await interaction.followup.send(
+                f"⚠️ プレイリストは{PLAYLIST_MAX_TRACKS}曲までです。{len(items)}曲中{added}曲だけ追加しました。"
+            )
+        else:
+            await interaction.followup.send(f"✅ プレイリスト「{playlist_name}」に{what}を追加しました。")
 
     @app_commands.command(name="playlist_song_add", description="プレイリストに曲を追加します。")
     @app_commands.describe(playlist_name="プレイリスト名", url="曲のURL")
     async def playlist_song_add(self, interaction: discord.Interaction, playlist_name: str, url: str):
-        user_id = interaction.user.id
-        key = f"playlist:{playlist_name}"
-        data = await self.userdb.get_user_setting(user_id, key)
-        if data is None:
-            await interaction.response.send_message("⚠️ そのプレイリストは存在しません。", ephemeral=True)
-            return
-        import json
-        try:
-            playlist = json.loads(data)
-        except Exception:
-            playlist = []
-        # YTDLでタイトル取得(同期処理はasyncioでラップ)
+        await interaction.response.defer()
+        # タイトル取得（抽出プロセス経由。/music_play と結果を共有する）
         try:
-            info = await asyncio.get_event_loop().run_in_executor(None, lambda: yt_dlp.YoutubeDL(YTDL_OPTIONS).extract_info(url, download=False))
-            if "entries" in info:
-                info = info["entries"][0]
-            title = info.get("title", url)
+            info = await self.extractor.extract(url)
+            title, duration = info.get("title") or url, info.get("duration")
         except Exception:
-            title = url
-        playlist.append({"url": url, "title": title})
-        await self.userdb.set_user_setting(user_id, key, json.dumps(playlist))
-        await interaction.response.send_message(f"✅ プレイリスト「{playlist_name}」に曲を追加しました。")
+            title, duration = url, None
+        await self.add_to_playlist(interaction, playlist_name, [(url, title, duration)], "曲")
 
     @app_commands.command(name="playlist_song_queue", description="今のキューの曲をプレイリストに追加します。")
     @app_commands.describe(playlist_name="プレイリスト名")
     async def playlist_song_queue(self, interaction: discord.Interaction, playlist_name: str):
-        user_id = interaction.user.id
-        key = f"playlist:{playlist_name}"
-        data = await self.userdb.get_user_setting(user_id, key)
-        if data is None:
-            await interaction.response.send_message("⚠️ そのプレイリストは存在しません。", ephemeral=True)
-            return
-        import json
-        try:
-            playlist = json.loads(data)
-        except Exception:
-            playlist = []
         player = self.get_player(interaction.guild)
         queue = player.get_queue_list()
         if not queue:
             await interaction.response.send_message("キューは空です。", ephemeral=True)
             return
-        for song in queue:
-            playlist.append({"url": song.data.get("webpage_url", ""), "title": song.title})
-        await self.userdb.set_user_setting(user_id, key, json.dumps(playlist))
-        await interaction.response.send_message(f"✅ プレイリスト「{playlist_name}」にキューの曲を追加しました。")
+        await interaction.response.defer()
+        items = [(song.webpage_url or song.url, song.title, song.duration) for song in queue]
+        await self.add_to_playlist(interaction, playlist_name, items, "キューの曲")
 
     @app_commands.command(name="playlist_song_nowplaying", description="現在再生中の曲をプレイリストに追加します。")
     @app_commands.describe(playlist_name="プレイリスト名")
     async def playlist_song_nowplaying(self, interaction: discord.Interaction, playlist_name: str):
-        user_id = interaction.user.id
-        key = f"playlist:{playlist_name}"
-        data = await self.userdb.get_user_setting(user_id, key)
-        if data is None:
-            await interaction.response.send_message("⚠️ そのプレイリストは存在しません。", ephemeral=True)
-            return
-        import json
         player = self.get_player(interaction.guild)
-        if not player.current:
+        song = player.current
+        if not song:
             await interaction.response.send_message("現在再生中の曲はありません。", ephemeral=True)
             return
-        try:
-            playlist = json.loads(data)
-        except Exception:
-            playlist = []
-        playlist.append({"url": player.current.data.get("webpage_url", ""), "title": player.current.title})
-        await self.userdb.set_user_setting(user_id, key, json.dumps(playlist))
-        await interaction.response.send_message(f"✅ プレイリスト「{playlist_name}」に現在再生中の曲を追加しました。")
+        await interaction.response.defer()
+        items = [(song.webpage_url or song.url, song.title, song.duration)]
+        await self.add_to_playlist(interaction, playlist_name, items, "現在再生中の曲")
 
     @app_commands.command(name="playlist_song_remove", description="プレイリストの曲を削除します。")
     @app_commands.describe(playlist_name="プレイリスト名", number="曲番号")
     async def playlist_song_remove(self, interaction: discord.Interaction, playlist_name: str, number: int):
-        user_id = interaction.user.id
-        key = f"playlist:{playlist_name}"
-        data = await self.userdb.get_user_setting(user_id, key)
-        if data is None:
+        if await self.playlists.get(interaction.user.id, playlist_name) is None:
             await interaction.response.send_message("⚠️ そのプレイリストは存在しません。", ephemeral=True)
             return
-        import json
-        try:
-            playlist = json.loads(data)
-        except Exception:
-            playlist = []
-        if number < 1 or number > len(playlist):
+        row = await self.playlists.remove(interaction.user.id, playlist_name, number)
+        if row is None:
+            await interaction.response.send_message("⚠️ 無効な曲番号です。", ephemeral=True)
+            return
+        await interaction.response.send_message(
+            f"✅ プレイリスト「{playlist_name}」から **{row['title'] or row['url']}** を削除しました。"
+        )
+
+    @app_commands.command(name="playlist_song_move", description="プレイリストの曲の順番を変えます。")
+    @app_commands.describe(playlist_name="プレイリスト名", number="移動する曲番号", to="移動先の曲番号")
+    async def playlist_song_move(self, interaction: discord.Interaction, playlist_name: str, number: int, to: int):
+        if await self.playlists.get(interaction.user.id, playlist_name) is None:
+            await interaction.response.send_message("⚠️ そのプレイリストは存在しません。", ephemeral=True)
+            return
+        if not await self.playlists.move(interaction.user.id, playlist_name, number, to):
             await interaction.response.send_message("⚠️ 無効な曲番号です。", ephemeral=True)
             return
-        playlist.pop(number - 1)
-        await self.userdb.set_user_setting(user_id, key, json.dumps(playlist))
-        await interaction.response.send_message(f"✅ プレイリスト「{playlist_name}」から曲を削除しました。")
+        await interaction.response.send_message(f"✅ プレイリスト「{playlist_name}」の{number}曲目を{to}曲目に移動しました。")
 
 async def setup(bot):
     await bot.add_cog(Music(bot))
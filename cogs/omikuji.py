@@ -28,11 +28,12 @@ class Omikuji(commands.Cog):
             await interaction.response.send_message("今日はもうおみくじを引いたよ！また明日ね🌅", ephemeral=True)
             return
 
-        result = fortune.draw_fortune()  # ランダムにおみくじを引く
+        # 今日の運勢（/work や冒険で使われるものと同じ）
+        result = (await fortune.get_today_fortune(user_id))["fortune"]
         self.set_last_draw_date(user_id)
 
         embed = discord.Embed(
-            title=f"🎴 {result['fortune']}の運勢 🎴",
+            title=f"🎴 {result['fortune_name']}の運勢 🎴",
             description=result['message'],
             color=discord.Color.gold()
         )
@@ -1,7 +1,6 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import asyncpg
 import random
 from datetime import datetime
 from utils.item import use_item
@@ -13,11 +12,11 @@ import os
 class Pet(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.pool: asyncpg.Pool = None
+        self.pool = None
         self.pet_images = {}
 
     async def cog_load(self):
-        self.pool = self.bot.db.pool
+        self.pool = self.bot.database.for_cog("Pet")
         # JSON読み込み
         json_path = os.path.join("data","pet_images.json")
         try:
@@ -4,7 +4,7 @@ from discord import app_commands, ui
 import random
 from collections import Counter
 from utils.economy_api import EconomyAPI
-from utils.item_utils import get_inventory, use_item
+from utils.item import get_inventory, get_user_item_count, use_item
 
 SUITS = ["♠️", "♥️", "♣️", "♦️"]
 RANKS_ORDER = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"]
@@ -117,9 +117,11 @@ class Poker(commands.Cog):
         # 経済API反映
         api: EconomyAPI = state["api"]
         shared_id = str(interaction.user.id)
-        user = await api.get_user(shared_id)
-        new_balance = user["balance"] + payout
-        await api.update_user(shared_id, {"balance": new_balance})
+        if payout > 0:
+            user = await api.increment(shared_id, {"balance": payout})
+        else:
+            user = await api.get_user(shared_id)
+        new_balance = user["balance"] if user else 0
 
         embed = self.create_embed({"hand": final_hand}, final=True)
         embed.add_field(name="掛け金", value=f"{bet:,}コイン", inline=True)
@@ -168,21 +170,26 @@ class Poker(commands.Cog):
         if bet <= 0:
             return await ctx.send("掛け金は1以上で指定してください。", ephemeral=True)
 
-        session = self.bot.aiohttp_session
-        api = EconomyAPI(session)
+        api = EconomyAPI()
         shared_id = str(ctx.author.id)
         user = await api.get_user(shared_id)
         if not user or user["balance"] < bet:
             return await ctx.send("コインが足りません。", ephemeral=True)
 
+        if use_bonus and await get_user_item_count(shared_id, "poker_chip") <= 0:
+            return await ctx.send("ポーカーチップがありません。", ephemeral=True)
+
+        # 掛け金は残高が足りるときだけ原子的に引き落とす（チップは引き落としが通ってから消費する）
+        if await api.conditional_debit(shared_id, bet) is None:
+            return await ctx.send("コインが足りません。", ephemeral=True)
+
         item_used = False
         if use_bonus:
-            if await use_item(shared_id, "poker_chip"):
-                item_used = True
-            else:
+            if not await use_item(shared_id, "poker_chip"):
+                # 確認後に使われてしまった場合は掛け金を戻す
+                await api.increment(shared_id, {"balance": bet})
                 return await ctx.send("ポーカーチップがありません。", ephemeral=True)
-
-        await api.update_user(shared_id, {"balance": user["balance"] - bet})
+            item_used = True
 
         deck = Deck()
         if item_used and random.random() < 0.2:
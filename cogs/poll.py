@@ -1,10 +1,17 @@
+import os
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-import asyncpg
 import json
+import time
 import datetime
 
+# 投票をまとめてDBに書き込む間隔（秒）と、これだけ溜まったら待たずに書き込む件数
+VOTE_FLUSH_INTERVAL = float(os.getenv("POLL_VOTE_FLUSH_INTERVAL", 1.0))
+VOTE_FLUSH_BATCH = int(os.getenv("POLL_VOTE_FLUSH_BATCH", 500))
+# 途中経過でメッセージを編集する最短間隔（秒）
+EDIT_INTERVAL = float(os.getenv("POLL_EDIT_INTERVAL", 5.0))
+
 class PollButton(discord.ui.Button):
     def __init__(self, label: str, poll_id: int, option_index: int):
         super().__init__(style=discord.ButtonStyle.primary, label=label, custom_id=f"poll_{poll_id}_{option_index}")
@@ -17,23 +24,83 @@ class PollButton(discord.ui.Button):
             await cog.register_vote(interaction, self.poll_id, self.option_index)
 
 class PollView(discord.ui.View):
-    def __init__(self, poll_id: int, options: list[str], timeout: int):
+    def __init__(self, poll_id: int, options: list[str], timeout: int | None):
         super().__init__(timeout=timeout)
         for i, option in enumerate(options):
             self.add_item(PollButton(option, poll_id, i))
 
+class PollTally:
+    """開催中の投票1件分の集計（投票のたびにDBへ問い合わせない）"""
+
+    def __init__(self, poll_id: int, question: str, options: list[str], expires_at: int,
+                 channel_id: int | None = None, message_id: int | None = None):
+        self.poll_id = poll_id
+        self.question = question
+        self.options = options
+        self.expires_at = expires_at
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.counts = [0] * len(options)
+        self.voters: set[int] = set()
+
+    def add(self, user_id: int, option_index: int) -> bool:
+        if user_id in self.voters:
+            return False
+        self.voters.add(user_id)
+        self.counts[option_index] += 1
+        return True
+
+    def build_embed(self, ended: bool = False) -> discord.Embed:
+        total = sum(self.counts)
+        title = "📊 投票終了" if ended else "📊 投票受付中！"
+        embed = discord.Embed(title=title, description=self.question, color=discord.Color.blurple())
+        for i, (opt, count) in enumerate(zip(self.options, self.counts)):
+            ratio = count / total if total else 0.0
+            bar = "█" * round(ratio * 10) + "░" * (10 - round(ratio * 10))
+            embed.add_field(name=f"{i+1}. {opt}", value=f"{bar} {count}票（{ratio * 100:.0f}%）", inline=False)
+        embed.set_footer(text=f"合計 {total}票")
+        embed.timestamp = datetime.datetime.fromtimestamp(self.expires_at, datetime.timezone.utc)
+        return embed
+
 class Poll(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db: asyncpg.Pool = None
-        self.poll_timeout_check.start()
+        self.db = None
+        # poll_id -> 開催中の投票の集計
+        self.tallies: dict[int, PollTally] = {}
+        # まだDBに書いていない (poll_id, user_id, option_index)
+        self.pending_votes: list[tuple[int, int, int]] = []
 
     async def cog_load(self):
-        self.db = self.bot.get_cog("DBHandler").pool  # DBHandlerのpoolを使う
+        self.db = self.bot.database.for_cog("Poll")
         await self.create_tables()
+        # 終わっていない投票の集計を読み込み、締め切りをスケジューラに載せる（過ぎているものはすぐ実行される）
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch("SELECT * FROM polls WHERE ended = FALSE")
+            votes = await conn.fetch("""
+                SELECT v.poll_id, v.user_id, v.option_index FROM votes v
+                JOIN polls p ON p.poll_id = v.poll_id WHERE p.ended = FALSE
+            """)
+        for row in rows:
+            tally = PollTally(row["poll_id"], row["question"], json.loads(row["options"]), row["expires_at"],
+                              row["channel_id"], row["message_id"])
+            self.tallies[tally.poll_id] = tally
+            if tally.message_id:
+                # 再起動後もボタンが効くように
+                self.bot.add_view(PollView(tally.poll_id, tally.options, timeout=None), message_id=tally.message_id)
+            self.schedule_finish(tally.poll_id, tally.expires_at)
+        for vote in votes:
+            tally = self.tallies.get(vote["poll_id"])
+            if tally is not None:
+                tally.add(vote["user_id"], vote["option_index"])
 
-    def cog_unload(self):
-        self.poll_timeout_check.cancel()
+    async def cog_unload(self):
+        for key in [key for key in self.bot.scheduler.jobs if key.startswith("poll:")]:
+            self.bot.scheduler.cancel(key)
+        await self.flush_votes()
+
+    def schedule_finish(self, poll_id: int, expires_at: int):
+        self.bot.scheduler.schedule(f"poll:{poll_id}", expires_at, self.finish_poll, poll_id)
 
     async def create_tables(self):
         async with self.db.acquire() as conn:
@@ -60,20 +127,85 @@ class Poll(commands.Cog):
                 )
             """)
 
-    @tasks.loop(seconds=10)
-    async def poll_timeout_check(self):
-        now_ts = int(datetime.datetime.utcnow().timestamp())
+    # === 投票の書き込み ===
+
+    async def flush_votes(self):
+        """溜まった投票を1回の executemany で書き込む（重複はDB側でも無視）"""
+        self.bot.scheduler.cancel("poll:flush")
+        batch, self.pending_votes = self.pending_votes, []
+        if not batch:
+            return
+        try:
+            async with self.db.acquire() as conn:
+                await conn.executemany(
+                    "INSERT INTO votes (poll_id, user_id, option_index) VALUES ($1, $2, $3) ON CONFLICT (poll_id, user_id) DO NOTHING",
+                    batch
+                )
+        except Exception as e:
+            # 書けなかった分は次回に回す
+            print(f"[Poll] 投票の書き込みに失敗（{len(batch)}件）: {e}")
+            self.pending_votes = batch + self.pending_votes
+            self.bot.scheduler.call_later("poll:flush", VOTE_FLUSH_INTERVAL * 5, self.flush_votes)
+
+    def schedule_flush(self):
+        if len(self.pending_votes) >= VOTE_FLUSH_BATCH:
+            self.bot.scheduler.call_later("poll:flush", 0, self.flush_votes)
+        elif self.bot.scheduler.get("poll:flush") is None:
+            self.bot.scheduler.call_later("poll:flush", VOTE_FLUSH_INTERVAL, self.flush_votes)
+
+    # === 途中経過の表示 ===
+
+    def schedule_edit(self, poll_id: int):
+        # 投票が続いても EDIT_INTERVAL に1回だけ編集する
+        key = f"poll:edit:{poll_id}"
+        if self.bot.scheduler.get(key) is None:
+            self.bot.scheduler.call_later(key, EDIT_INTERVAL, self.update_message, poll_id)
+
+    async def update_message(self, poll_id: int, ended: bool = False):
+        tally = self.tallies.get(poll_id)
+        if tally is None or not tally.message_id:
+            return
+        channel = self.bot.get_channel(tally.channel_id)
+        if channel is None:
+            return
+        try:
+            message = channel.get_partial_message(tally.message_id)
+            if ended:
+                await message.edit(embed=tally.build_embed(ended=True), view=None)
+            else:
+                await message.edit(embed=tally.build_embed())
+        except discord.HTTPException as e:
+            print(f"[Poll] 投票 {poll_id} のメッセージ更新に失敗: {e}")
+
+    async def finish_poll(self, poll_id: int):
+        # 締め切りまでの投票を書き込んでから確定する
+        await self.flush_votes()
         async with self.db.acquire() as conn:
-            rows = await conn.fetch("SELECT poll_id, creator_id, options FROM polls WHERE ended = FALSE AND expires_at <= $1", now_ts)
-            for row in rows:
-                await self.finish_poll(conn, row["poll_id"], row["creator_id"], row["options"])
+            # 終了済みにできたときだけ集計する（複数プロセスでも1回だけ）
+            row = await conn.fetchrow(
+                "UPDATE polls SET ended = TRUE WHERE poll_id = $1 AND ended = FALSE RETURNING creator_id, options",
+                poll_id
+            )
+            if row is None:
+                self.tallies.pop(poll_id, None)
+                return
+            vote_rows = await conn.fetch("SELECT option_index, COUNT(*) AS cnt FROM votes WHERE poll_id = $1 GROUP BY option_index", poll_id)
 
-    async def finish_poll(self, conn, poll_id: int, creator_id: int, options_json: str):
-        options = json.loads(options_json)
+        creator_id = row["creator_id"]
+        options = json.loads(row["options"])
         counts = {i: 0 for i in range(len(options))}
-        vote_rows = await conn.fetch("SELECT option_index, COUNT(*) AS cnt FROM votes WHERE poll_id = $1 GROUP BY option_index", poll_id)
-        for row in vote_rows:
-            counts[row["option_index"]] = row["cnt"]
+        for vote in vote_rows:
+            counts[vote["option_index"]] = vote["cnt"]
+
+        self.bot.scheduler.cancel(f"poll:edit:{poll_id}")
+        tally = self.tallies.get(poll_id)
+        if tally is not None:
+            # 他プロセスで受けた票も含めた最終結果で締める（書き込みに失敗した分はメモリ側が多い）
+            for i in range(len(options)):
+                counts[i] = max(counts[i], tally.counts[i])
+            tally.counts = [counts[i] for i in range(len(options))]
+            await self.update_message(poll_id, ended=True)
+            self.tallies.pop(poll_id, None)
 
         total_votes = sum(counts.values())
         result = f"📊 投票結果（ID: {poll_id}）\n"
@@ -88,21 +220,19 @@ class Poll(commands.Cog):
             except:
                 pass
 
-        await conn.execute("UPDATE polls SET ended = TRUE WHERE poll_id = $1", poll_id)
-
     async def register_vote(self, interaction: discord.Interaction, poll_id: int, option_index: int):
-        user_id = interaction.user.id
-        async with self.db.acquire() as conn:
-            exists = await conn.fetchval("SELECT 1 FROM votes WHERE poll_id = $1 AND user_id = $2", poll_id, user_id)
-            if exists:
-                await interaction.response.send_message("❌ あなたはすでに投票済みです。", ephemeral=True)
-                return
+        tally = self.tallies.get(poll_id)
+        if tally is None:
+            await interaction.response.send_message("❌ この投票はすでに終了しています。", ephemeral=True)
+            return
+        if not tally.add(interaction.user.id, option_index):
+            await interaction.response.send_message("❌ あなたはすでに投票済みです。", ephemeral=True)
+            return
 
-            await conn.execute(
-                "INSERT INTO votes (poll_id, user_id, option_index) VALUES ($1, $2, $3)",
-                poll_id, user_id, option_index
-            )
-            await interaction.response.send_message(f"✅ `{option_index + 1}`番目の選択肢に投票しました。", ephemeral=True)
+        self.pending_votes.append((poll_id, interaction.user.id, option_index))
+        self.schedule_flush()
+        self.schedule_edit(poll_id)
+        await interaction.response.send_message(f"✅ `{option_index + 1}`番目の選択肢に投票しました。", ephemeral=True)
 
     @app_commands.command(name="poll", description="投票を開始します。")
     @app_commands.describe(
@@ -119,7 +249,7 @@ class Poll(commands.Cog):
             await interaction.response.send_message("❌ 投票時間は10〜86400秒（24時間）以内で指定してください。", ephemeral=True)
             return
 
-        expires_at = int((datetime.datetime.utcnow() + datetime.timedelta(seconds=duration)).timestamp())
+        expires_at = int(time.time()) + duration
 
         async with self.db.acquire() as conn:
             row = await conn.fetchrow("""
@@ -129,14 +259,14 @@ class Poll(commands.Cog):
             """, interaction.guild.id, interaction.channel.id, interaction.user.id, question, json.dumps(option_list), expires_at)
 
             poll_id = row["poll_id"]
+        tally = PollTally(poll_id, question, option_list, expires_at, interaction.channel.id)
+        self.tallies[poll_id] = tally
+        self.schedule_finish(poll_id, expires_at)
 
-        embed = discord.Embed(title="📊 投票開始！", description=question, color=discord.Color.blurple())
-        for i, opt in enumerate(option_list):
-            embed.add_field(name=f"{i+1}. {opt}", value="\u200b", inline=False)
-        embed.set_footer(text=f"投票終了まで{duration}秒")
-
-        view = PollView(poll_id, option_list, timeout=duration)
-        msg = await interaction.channel.send(embed=embed, view=view)
+        # 締め切りはスケジューラが管理するので、ボタン側はタイムアウトさせない
+        view = PollView(poll_id, option_list, timeout=None)
+        msg = await interaction.channel.send(embed=tally.build_embed(), view=view)
+        tally.message_id = msg.id
         await interaction.response.send_message("✅ 投票を開始しました。", ephemeral=True)
 
         # message_id を保存
@@ -2,15 +2,6 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
-import asyncpg
-
-DB_CONFIG = {
-    "user": "orbisuser",
-    "password": "orbispass",
-    "database": "orbis",
-    "host": "orbis-db",
-    "port": 5432,
-}
 
 class Radio(commands.Cog):
     def __init__(self, bot):
@@ -21,7 +12,7 @@ class Radio(commands.Cog):
         self.radio_urls = {}     # guild_id -> current radio url
 
     async def cog_load(self):
-        self.pool = await asyncpg.create_pool(**DB_CONFIG)
+        self.pool = self.bot.database.for_cog("Radio")
         async with self.pool.acquire() as conn:
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS radio_settings (
@@ -4,20 +4,33 @@ from discord import app_commands
 import json
 import urllib.parse
 
+from utils.message_pipeline import STAGE_SGC
+
 JSON_CHANNEL_ID = 123456789012345678  # JSON送信用チャンネルID（DB管理なら不要かも）
 
 class SGCClient(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = bot.db  # DBHandlerインスタンスが bot.db にセットされている前提
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
+    @property
+    def db(self):
+        return self.bot.get_cog("DBHandler")
+
+    async def cog_load(self):
+        self.bot.message_pipeline.add_stage("sgc", self.handle_message, STAGE_SGC, background=True)
+
+    def cog_unload(self):
+        self.bot.message_pipeline.remove_stage("sgc")
+
+    @staticmethod
+    def is_sgc_channel(settings: dict, channel_id: int) -> bool:
+        return settings.get("sgc_enabled") == "true" and settings.get("sgc_channel_id") == str(channel_id)
+
+    async def handle_message(self, ctx):
+        message = ctx.message
 
-        # SGCに接続されているチャンネルのみ処理（DBで判定）
-        if message.guild and await self.db.is_sgc_connected(message.guild.id, message.channel.id):
+        # SGCに接続されているチャンネルのみ処理（設定スナップショットで判定）
+        if self.is_sgc_channel(ctx.settings, message.channel.id):
             dic = {
                 "type": "message",
                 "version": "2",
@@ -65,12 +78,13 @@ class SGCClient(commands.Cog):
             if dic.get("type") != "message":
                 return
 
-            for channel in self.bot.get_all_channels():
-                if (
-                    isinstance(channel, discord.TextChannel)
-                    and await self.db.is_sgc_connected(channel.guild.id, channel.id)
-                    and channel.guild.id != int(dic["guildId"])
-                ):
+            for guild in self.bot.guilds:
+                if guild.id == int(dic["guildId"]):
+                    continue
+                settings = await self.db.get_guild_settings(guild.id)
+                channel_id = await self.db.get_sgc_channel_id(guild.id)
+                channel = guild.get_channel(channel_id) if channel_id else None
+                if isinstance(channel, discord.TextChannel) and self.is_sgc_channel(settings, channel.id):
                     embed = discord.Embed(description=dic["content"], color=0x9B95C9)
                     embed.set_author(
                         name=f"{dic['userName']}#{dic['userDiscriminator']}",
@@ -91,12 +105,13 @@ class SGCClient(commands.Cog):
 
     @app_commands.command(name="sgc_disconnect", description="このチャンネルのSGC接続を解除します")
     async def sgc_disconnect(self, interaction: discord.Interaction):
-        await self.db.disconnect_sgc(interaction.guild.id, interaction.channel.id)
+        await self.db.disconnect_sgc(interaction.guild.id)
         await interaction.response.send_message("❌ このチャンネルのSGC接続を解除しました。", ephemeral=True)
 
     @app_commands.command(name="sgc_status", description="このチャンネルがSGCに接続されているか確認します")
     async def sgc_status(self, interaction: discord.Interaction):
-        connected = await self.db.is_sgc_connected(interaction.guild.id, interaction.channel.id)
+        settings = await self.db.get_guild_settings(interaction.guild.id)
+        connected = self.is_sgc_channel(settings, interaction.channel.id)
         if connected:
             await interaction.response.send_message("✅ このチャンネルはSGCに **接続されています**。", ephemeral=True)
         else:
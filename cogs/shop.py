@@ -1,7 +1,12 @@
 import discord
 from discord.ext import commands
 from discord import app_commands, ui
-from ..utils import economy_api, shop as shop_utils, item as item_utils, misc
+import os
+import datetime
+from utils import economy_api, shop as shop_utils, item as item_utils
+
+# 毎日の在庫リセット時刻（UTC, "HH:MM"）
+RESTOCK_TIME = datetime.time.fromisoformat(os.getenv("SHOP_RESTOCK_TIME", "00:00"))
 
 class PurchaseModal(ui.Modal, title="購入数量を入力"):
     quantity = ui.TextInput(label="数量", placeholder="1", required=True)
@@ -51,11 +56,11 @@ class ShopView(ui.View):
 
     async def on_select(self, interaction: discord.Interaction):
         self.selected = interaction.data["values"][0]
-        gov = misc.get_shared_id(interaction.guild.id, interaction.user.id)
+        gov = str(interaction.user.id)
 
-        self.balance = (await economy_api.EconomyAPI(interaction.client.http_session).get_user(gov))["balance"]
+        self.balance = (await economy_api.EconomyAPI().get_user(gov))["balance"]
         self.stock = await shop_utils.fetch_item_stock(self.selected)
-        owned = await item_utils.get_user_item_count(gov, self.selected)  # ← 修正ポイント
+        owned = await item_utils.get_user_item_count(gov, self.selected)
 
         info = self.shop_items[self.selected]
         embed = discord.Embed(
@@ -77,7 +82,7 @@ class ShopView(ui.View):
         await interaction.response.send_modal(modal)
 
     async def process_purchase(self, interaction: discord.Interaction, item_id: str, qty: int):
-        gov = misc.get_shared_id(interaction.guild.id, interaction.user.id)
+        gov = str(interaction.user.id)
         info = self.shop_items[item_id]
 
         total = info["price"] * qty
@@ -88,9 +93,8 @@ class ShopView(ui.View):
         if stock < qty:
             return await interaction.response.send_message("在庫が不足しています。", ephemeral=True)
 
+        # 在庫・残高・所持品の更新は /buy が1トランザクションで行う
         ok = await shop_utils.purchase_item(gov, item_id, qty)
-        ok &= await item_utils.add_item(gov, item_id, qty)
-        ok &= await economy_api.EconomyAPI(interaction.client.http_session).update_user(gov, {"balance": self.balance - total})
         if not ok:
             return await interaction.response.send_message("購入に失敗しました。", ephemeral=True)
 
@@ -102,6 +106,13 @@ class Shop(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    async def cog_load(self):
+        # daily_reset の商品を毎日 max_daily_stock まで戻す
+        self.bot.scheduler.every_day("shop:restock", RESTOCK_TIME, shop_utils.reset_daily_stock)
+
+    def cog_unload(self):
+        self.bot.scheduler.cancel("shop:restock")
+
     @commands.hybrid_command()
     @app_commands.describe()
     async def shop(self, ctx: commands.Context):
@@ -1,15 +1,14 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import asyncpg
 
 class Tickets(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db: asyncpg.Pool = None
+        self.db = None
 
     async def cog_load(self):
-        self.db = self.bot.get_cog("DBHandler").pool
+        self.db = self.bot.database.for_cog("Tickets")
         await self.create_tables()
 
     async def create_tables(self):
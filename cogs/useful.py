@@ -1,14 +1,78 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 import asyncio
 import random
 import datetime
 
+from utils.reminders import ReminderStore
+
+# スケジューラに張っておくのは「次に期限が来るリマインダー」1件分だけ
+NEXT_REMINDER_KEY = "remind:next"
+
 class Useful(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.reminders = []  # 簡易的にメモリ保持。再起動すると消えます
+        self.reminders = ReminderStore(bot.database.for_cog("Reminders"))
+
+    async def cog_load(self):
+        await self.reminders.init()
+        # 停止中に期限が過ぎた分も含め、一番近い期限からまとめて配信する
+        await self.arm_next_reminder()
+
+    def cog_unload(self):
+        self.bot.scheduler.cancel(NEXT_REMINDER_KEY)
+
+    # === リマインダー配信 ===
+
+    async def arm_next_reminder(self, due_at: float | None = None):
+        """due_at（省略時はDBの最小値）が今張っている期限より早ければ張り直す"""
+        if due_at is None:
+            due_at = await self.reminders.next_due()
+            if due_at is None:
+                self.bot.scheduler.cancel(NEXT_REMINDER_KEY)
+                return
+        else:
+            armed = self.bot.scheduler.get(NEXT_REMINDER_KEY)
+            if armed is not None and armed.when <= due_at:
+                return
+        self.bot.scheduler.schedule(NEXT_REMINDER_KEY, due_at, self.deliver_due_reminders)
+
+    async def deliver_due_reminders(self):
+        try:
+            while True:
+                rows = await self.reminders.claim_due()
+                if not rows:
+                    break
+                results = await asyncio.gather(*(self.deliver_reminder(row) for row in rows))
+                delivered = [row for row, ok in zip(rows, results) if ok]
+                failed = [row for row, ok in zip(rows, results) if not ok]
+                await self.reminders.complete(delivered, failed)
+        finally:
+            try:
+                await self.arm_next_reminder()
+            except Exception as e:
+                # DBに届かなくても配信が止まらないよう、少し後に取り直す
+                print(f"[Reminder] 次の期限の取得に失敗: {e}")
+                self.bot.scheduler.call_later(NEXT_REMINDER_KEY, 60, self.deliver_due_reminders)
+
+    async def deliver_reminder(self, row) -> bool:
+        text = f"⏰ リマインダー：{row['message']}"
+        try:
+            user = self.bot.get_user(row["user_id"]) or await self.bot.fetch_user(row["user_id"])
+            await user.send(text)
+            return True
+        except Exception:
+            pass
+        # DM拒否の場合はチャンネルで通知
+        channel = self.bot.get_channel(row["channel_id"]) if row["channel_id"] else None
+        if channel is not None:
+            try:
+                await channel.send(f"<@{row['user_id']}> {text}")
+                return True
+            except Exception:
+                pass
+        return False
 
     # 埋め込み投稿コマンド    
     @app_commands.command(name="embed", description="シンプルな埋め込みメッセージを送信します。")
@@ -23,24 +87,50 @@ class Useful(commands.Cog):
 
     # リマインダー設定コマンド
     @app_commands.command(name="remind", description="指定時間後にリマインダーを送信します。（例: 10m, 1h, 30s）")
-    @app_commands.describe(time="時間（例：10m、1h、30s）", message="リマインダー内容")
-    async def remind(self, interaction: discord.Interaction, time: str, message: str):
+    @app_commands.describe(time="時間（例：10m、1h、30s、1d）", message="リマインダー内容", repeat="繰り返す間隔（例：1d。省略時は1回だけ）")
+    async def remind(self, interaction: discord.Interaction, time: str, message: str, repeat: str = None):
         seconds = self.parse_time(time)
         if seconds is None or seconds <= 0:
             await interaction.response.send_message("❌ 時間の指定が不正です。例：10m、1h、30s", ephemeral=True)
             return
+        interval = None
+        if repeat:
+            interval = self.parse_time(repeat)
+            if interval is None or interval < 60:
+                await interaction.response.send_message("❌ 繰り返し間隔は1分以上で指定してください。例：1h、1d", ephemeral=True)
+                return
 
-        await interaction.response.send_message(f"⏰ {time}後にリマインダーをセットしました。", ephemeral=True)
+        due_at = datetime.datetime.now(datetime.timezone.utc).timestamp() + seconds
+        reminder_id = await self.reminders.add(
+            interaction.user.id, interaction.guild.id if interaction.guild else None,
+            interaction.channel.id if interaction.channel else None, message, due_at, interval
+        )
+        if reminder_id is None:
+            await interaction.response.send_message("❌ 登録できるリマインダーの上限に達しています。`/remind_cancel` で整理してください。", ephemeral=True)
+            return
+        await self.arm_next_reminder(due_at)
+        suffix = f"（以降 {repeat} ごと）" if interval else ""
+        await interaction.response.send_message(f"⏰ {time}後にリマインダーをセットしました{suffix}。ID: `{reminder_id}`", ephemeral=True)
 
-        async def reminder_task():
-            await asyncio.sleep(seconds)
-            try:
-                await interaction.user.send(f"⏰ リマインダー：{message}")
-            except:
-                # DM拒否の場合はチャンネルで通知
-                await interaction.channel.send(f"{interaction.user.mention} ⏰ リマインダー：{message}")
+    @app_commands.command(name="remind_list", description="登録中のリマインダーを表示します。")
+    async def remind_list(self, interaction: discord.Interaction):
+        rows = await self.reminders.list_for_user(interaction.user.id)
+        if not rows:
+            await interaction.response.send_message("📭 登録中のリマインダーはありません。", ephemeral=True)
+            return
+        lines = []
+        for row in rows:
+            repeat = f"（{row['interval_seconds'] // 60}分ごと）" if row["interval_seconds"] else ""
+            lines.append(f"`{row['reminder_id']}` <t:{int(row['due_at'])}:R>{repeat} {row['message'][:50]}")
+        await interaction.response.send_message("⏰ リマインダー一覧\n" + "\n".join(lines), ephemeral=True)
 
-        self.bot.loop.create_task(reminder_task())
+    @app_commands.command(name="remind_cancel", description="リマインダーを取り消します。")
+    @app_commands.describe(reminder_id="/remind_list に表示されるID")
+    async def remind_cancel(self, interaction: discord.Interaction, reminder_id: int):
+        if await self.reminders.cancel(interaction.user.id, reminder_id):
+            await interaction.response.send_message(f"🗑️ リマインダー `{reminder_id}` を取り消しました。", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"⚠️ リマインダー `{reminder_id}` は見つかりません。", ephemeral=True)
 
     def parse_time(self, time_str: str) -> int | None:
         try:
@@ -52,6 +142,8 @@ class Useful(commands.Cog):
                 return num * 60
             elif unit == 'h':
                 return num * 3600
+            elif unit == 'd':
+                return num * 86400
             else:
                 return None
         except:
@@ -1,25 +1,16 @@
-import asyncpg
 from discord.ext import commands
 import json
 import datetime
 import os
 import csv
 
-DB_CONFIG = {
-    "user": "orbisuser",
-    "password": "orbispass",
-    "database": "orbis",
-    "host": "orbis-db",
-    "port": 5432,
-}
-
 class UserDBHandler(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.pool = None
 
     async def cog_load(self):
-        self.pool = await asyncpg.create_pool(**DB_CONFIG)
+        self.pool = self.bot.database.for_cog("UserDBHandler")
         async with self.pool.acquire() as conn:
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS user_settings (
@@ -162,7 +153,7 @@ class UserDBHandler(commands.Cog):
 
     # 新コマンド実行履歴をインクリメント
     async def increment_pet_action_count(self, guild_id: int, user_id: int):
-        today = datetime.utcnow().date()
+        today = datetime.datetime.now(datetime.timezone.utc).date()
         async with self.pool.acquire() as conn:
             await conn.execute("""
                 INSERT INTO user_pet_actions (guild_id, user_id, action_date, command_count)
@@ -173,7 +164,7 @@ class UserDBHandler(commands.Cog):
 
     # その日の合計アクション数を取得（数値A）
     async def get_today_action_count(self, guild_id: int, user_id: int) -> int:
-        today = datetime.utcnow().date()
+        today = datetime.datetime.now(datetime.timezone.utc).date()
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow("""
                 SELECT command_count FROM user_pet_actions
@@ -181,21 +172,26 @@ class UserDBHandler(commands.Cog):
             """, guild_id, user_id, today)
             return row["command_count"] if row else 0
 
-    # 全ユーザー分の今日のコマンド履歴を取得（自動報酬用途）
-    async def get_all_today_pet_actions(self):
-        today = datetime.utcnow().date()
+    # 全ユーザー分のその日（省略時は今日、UTC）のコマンド履歴を取得（自動報酬用途）
+    async def get_all_today_pet_actions(self, day: datetime.date | None = None):
+        day = day or datetime.datetime.now(datetime.timezone.utc).date()
         async with self.pool.acquire() as conn:
             return await conn.fetch("""
                 SELECT guild_id, user_id, command_count FROM user_pet_actions
                 WHERE action_date = $1
-            """, today)
+            """, day)
 
     # 履歴を削除（報酬配布後リセット用）
-    async def reset_pet_action_counts(self):
-        today = datetime.utcnow().date()
+    async def reset_pet_action_counts(self, day: datetime.date | None = None):
+        day = day or datetime.datetime.now(datetime.timezone.utc).date()
         async with self.pool.acquire() as conn:
-            await conn.execute("DELETE FROM user_pet_actions WHERE action_date = $1", today)
+            await conn.execute("DELETE FROM user_pet_actions WHERE action_date = $1", day)
     
+    async def get_all_user_ids(self) -> list[int]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT DISTINCT user_id FROM user_settings")
+        return [row["user_id"] for row in rows]
+
     # キャラ選択
     async def set_partner_character(self, user_id: int, character_id: str):
         await self.set_user_setting(user_id, "partner_character", character_id)
@@ -1,45 +1,76 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import re
+import uuid
+import datetime
+
+from utils.message_pipeline import STAGE_FILTER
+from utils.ngword import GuildNGWords
 
 class WordFilter(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # guild_id -> コンパイル済みNGワード（ngword_version が変わったら作り直す）
+        self.ngwords: dict[int, GuildNGWords] = {}
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot or not message.guild:
-            return
+    async def cog_load(self):
+        self.bot.message_pipeline.add_stage("filter", self.handle_message, STAGE_FILTER)
+
+    def cog_unload(self):
+        self.bot.message_pipeline.remove_stage("filter")
+
+    async def get_ngwords(self, guild_id: int, version: str | None) -> GuildNGWords:
+        cached = self.ngwords.get(guild_id)
+        if cached is not None and cached.version == version:
+            return cached
+        db = self.bot.get_cog("DBHandler")
+        compiled = GuildNGWords(version, await db.get_ngwords(guild_id))
+        self.ngwords[guild_id] = compiled
+        return compiled
 
+    async def bump_ngword_version(self, guild_id: int):
+        # 設定の変更通知で他のプロセスのキャッシュも無効になる
+        self.ngwords.pop(guild_id, None)
         db = self.bot.get_cog("DBHandler")
-        ngwords = await db.get_ngwords(message.guild.id, message.channel.id)
-
-        for word in ngwords:
-            if re.search(re.escape(word), message.content, re.IGNORECASE):
-                await message.delete()
-                timeout_seconds = int(await db.get_setting(message.guild.id, "ngword_timeout") or 600)
-                try:
-                    await message.author.timeout(discord.utils.utcnow() + discord.timedelta(seconds=timeout_seconds),
-                                                 reason=f"NGワード検出（'{word}'）")
-                    await message.channel.send(
-                        f"🚫 {message.author.mention} がNGワードによりタイムアウトされました（{timeout_seconds // 60}分）",
-                        delete_after=10
-                    )
-                except Exception:
-                    pass
-                break
+        await db.set_setting(guild_id, "ngword_version", uuid.uuid4().hex)
+
+    async def handle_message(self, ctx):
+        message = ctx.message
+        ngwords = await self.get_ngwords(message.guild.id, ctx.settings.get("ngword_version"))
+        found = ngwords.find_all(message.channel.id, message.content)
+        if not found:
+            return
+
+        ctx.flags["ngword"] = found[0]
+        ctx.flags["ngwords"] = found
+        ctx.stop("ngword")
+        await message.delete()
+        timeout_seconds = int(ctx.settings.get("ngword_timeout") or 600)
+        words = "', '".join(found)
+        try:
+            await message.author.timeout(discord.utils.utcnow() + datetime.timedelta(seconds=timeout_seconds),
+                                         reason=f"NGワード検出（'{words}'）")
+            await message.channel.send(
+                f"🚫 {message.author.mention} がNGワードによりタイムアウトされました（{timeout_seconds // 60}分）",
+                delete_after=10
+            )
+        except Exception:
+            pass
 
     @app_commands.command(name="ngword_add", description="NGワードを追加します。")
     async def ngword_add(self, interaction: discord.Interaction, word: str, channel: discord.TextChannel = None):
         db = self.bot.get_cog("DBHandler")
         await db.add_ngword(interaction.guild.id, word, channel.id if channel else None)
+        await self.bump_ngword_version(interaction.guild.id)
         await interaction.response.send_message(f"✅ NGワード `{word}` を追加しました。")
 
     @app_commands.command(name="ngword_remove", description="NGワードを削除します。")
     async def ngword_remove(self, interaction: discord.Interaction, word: str):
         db = self.bot.get_cog("DBHandler")
-        await db.remove_ngword(interaction.guild.id, word)
+        if not await db.remove_ngword(interaction.guild.id, word):
+            await interaction.response.send_message(f"⚠️ NGワード `{word}` は登録されていません。")
+            return
+        await self.bump_ngword_version(interaction.guild.id)
         await interaction.response.send_message(f"🗑️ NGワード `{word}` を削除しました。")
 
     @app_commands.command(name="ngword_set_timeout", description="NGワード検出時のタイムアウト秒数を設定します。")
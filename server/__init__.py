@@ -0,0 +1 @@
+# Botが叩く経済・アイテム・ショップ・連携APIのローカル参照実装
@@ -0,0 +1,44 @@
+import os
+import asyncpg
+from aiohttp import web
+
+from utils.database import DB_CONFIG
+from server import economy, items, link, shop
+
+HOST = os.getenv("ECONOMY_SERVER_HOST", "0.0.0.0")
+PORT = int(os.getenv("ECONOMY_SERVER_PORT", 8000))
+POOL_MAX_SIZE = int(os.getenv("ECONOMY_SERVER_POOL_MAX_SIZE", 20))
+
+
+async def on_startup(app: web.Application):
+    app["pool"] = await asyncpg.create_pool(**DB_CONFIG, min_size=2, max_size=POOL_MAX_SIZE)
+    async with app["pool"].acquire() as conn:
+        await economy.init_schema(conn)
+        await economy.purge_idempotency(conn)
+        await items.init_schema(conn)
+        await shop.init_schema(conn)
+        await link.init_schema(conn)
+    print(f"[EconomyServer] http://{HOST}:{PORT} で起動しました。")
+
+
+async def on_cleanup(app: web.Application):
+    await app["pool"].close()
+
+
+def make_app() -> web.Application:
+    app = web.Application()
+    app.add_routes(economy.routes)
+    app.add_routes(items.routes)
+    app.add_routes(shop.routes)
+    app.add_routes(link.routes)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main():
+    web.run_app(make_app(), host=HOST, port=PORT, print=None)
+
+
+if __name__ == "__main__":
+    main()
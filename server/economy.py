@@ -0,0 +1,246 @@
+import json
+from aiohttp import web
+
+from utils.activity_accrual import calc_level
+
+# 経済APIのユーザー列（PATCH / increment で触れるもの）
+NUMERIC_FIELDS = {"balance", "activity_score", "money", "gold"}
+TEXT_FIELDS = {"last_active_date", "last_work_time"}
+SETTABLE_FIELDS = NUMERIC_FIELDS | TEXT_FIELDS | {"level", "company_id"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS economy_users (
+    shared_id TEXT PRIMARY KEY,
+    balance BIGINT NOT NULL DEFAULT 0,
+    activity_score DOUBLE PRECISION NOT NULL DEFAULT 100,
+    level INT NOT NULL DEFAULT 1,
+    money BIGINT NOT NULL DEFAULT 0,
+    gold BIGINT NOT NULL DEFAULT 0,
+    last_active_date TEXT,
+    last_work_time TEXT,
+    company_id INT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS economy_idempotency (
+    key TEXT PRIMARY KEY,
+    status INT,
+    body JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# 冪等キーの保持期間
+IDEMPOTENCY_TTL = "1 day"
+
+routes = web.RouteTableDef()
+
+
+class Insufficient(Exception):
+    """残高・在庫不足（409）"""
+
+
+def user_to_dict(row) -> dict:
+    user = dict(row)
+    user.pop("created_at", None)
+    return user
+
+
+def _check_fields(data: dict, allowed: set[str]):
+    unknown = set(data) - allowed
+    if unknown:
+        raise web.HTTPBadRequest(text=f"unknown fields: {sorted(unknown)}")
+
+
+async def ensure_user(conn, shared_id: str):
+    await conn.execute(
+        "INSERT INTO economy_users (shared_id) VALUES ($1) ON CONFLICT DO NOTHING", shared_id
+    )
+
+
+async def sync_level(conn, row):
+    """残高・活動度からレベルを再計算する（行ロックは呼び出し側のUPDATEで取得済み）"""
+    level = calc_level(row["balance"], row["activity_score"])
+    if level != row["level"]:
+        row = await conn.fetchrow(
+            "UPDATE economy_users SET level = $2 WHERE shared_id = $1 RETURNING *", row["shared_id"], level
+        )
+    return row
+
+
+async def increment_user(conn, shared_id: str, delta: dict, set_fields: dict) -> dict:
+    """1ユーザー分の加算と上書きを行い、レベルを再計算して返す（呼び出し側のトランザクション内）"""
+    _check_fields(delta, NUMERIC_FIELDS)
+    _check_fields(set_fields, SETTABLE_FIELDS)
+    if set(delta) & set(set_fields):
+        raise web.HTTPBadRequest(text="same field in delta and set")
+
+    await ensure_user(conn, shared_id)
+    assignments, args = [], [shared_id]
+    for field, value in delta.items():
+        args.append(value)
+        assignments.append(f"{field} = {field} + ${len(args)}")
+    for field, value in set_fields.items():
+        args.append(value)
+        assignments.append(f"{field} = ${len(args)}")
+    if assignments:
+        row = await conn.fetchrow(
+            f"UPDATE economy_users SET {', '.join(assignments)} WHERE shared_id = $1 RETURNING *", *args
+        )
+    else:
+        row = await conn.fetchrow("SELECT * FROM economy_users WHERE shared_id = $1", shared_id)
+
+    # 残高・活動度が動いたらレベルも合わせる
+    if "level" not in set_fields and ({"balance", "activity_score"} & (set(delta) | set(set_fields))):
+        row = await sync_level(conn, row)
+    return user_to_dict(row)
+
+
+async def debit_user(conn, shared_id: str, amount: int, min_balance: int = 0) -> dict:
+    row = await conn.fetchrow(
+        """
+        UPDATE economy_users SET balance = balance - $2
+        WHERE shared_id = $1 AND balance - $2 >= $3
+        RETURNING *
+        """,
+        shared_id, amount, min_balance
+    )
+    if row is None:
+        raise Insufficient("insufficient balance")
+    return user_to_dict(await sync_level(conn, row))
+
+
+async def run_idempotent(request: web.Request, handler) -> web.Response:
+    """Idempotency-Key 付きの書き込みを1トランザクションで実行し、同じキーには同じ応答を返す"""
+    pool = request.app["pool"]
+    key = request.headers.get("Idempotency-Key")
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if key:
+                # 同じキーが処理中なら、ここで相手のコミットを待つことになる
+                inserted = await conn.fetchval(
+                    "INSERT INTO economy_idempotency (key) VALUES ($1) ON CONFLICT DO NOTHING RETURNING key", key
+                )
+                if inserted is None:
+                    row = await conn.fetchrow("SELECT status, body FROM economy_idempotency WHERE key = $1", key)
+                    return web.json_response(json.loads(row["body"]), status=row["status"])
+            try:
+                # 不足で中断したときは途中の書き込みだけ巻き戻す（セーブポイント）
+                async with conn.transaction():
+                    body = await handler(conn)
+                status = 200
+            except Insufficient as e:
+                status, body = 409, {"error": str(e)}
+            if key:
+                await conn.execute(
+                    "UPDATE economy_idempotency SET status = $2, body = $3 WHERE key = $1",
+                    key, status, json.dumps(body)
+                )
+    return web.json_response(body, status=status)
+
+
+# ---------- ユーザー ----------
+
+@routes.get("/user")
+async def list_users(request: web.Request):
+    async with request.app["pool"].acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM economy_users ORDER BY shared_id")
+    return web.json_response([user_to_dict(r) for r in rows])
+
+
+@routes.get("/user/{shared_id}")
+async def get_user(request: web.Request):
+    async with request.app["pool"].acquire() as conn:
+        row = await conn.fetchrow("SELECT * FROM economy_users WHERE shared_id = $1", request.match_info["shared_id"])
+    if row is None:
+        raise web.HTTPNotFound(text="user not found")
+    return web.json_response(user_to_dict(row))
+
+
+@routes.post("/user")
+async def create_user(request: web.Request):
+    data = await request.json()
+    shared_id = str(data["shared_id"])
+    async with request.app["pool"].acquire() as conn:
+        await ensure_user(conn, shared_id)
+        row = await conn.fetchrow("SELECT * FROM economy_users WHERE shared_id = $1", shared_id)
+    return web.json_response(user_to_dict(row), status=201)
+
+
+@routes.patch("/user/{shared_id}")
+async def update_user(request: web.Request):
+    data = await request.json()
+    _check_fields(data, SETTABLE_FIELDS)
+    shared_id = request.match_info["shared_id"]
+    async with request.app["pool"].acquire() as conn:
+        async with conn.transaction():
+            exists = await conn.fetchval("SELECT 1 FROM economy_users WHERE shared_id = $1 FOR UPDATE", shared_id)
+            if not exists:
+                raise web.HTTPNotFound(text="user not found")
+            user = await increment_user(conn, shared_id, {}, data)
+    return web.json_response(user)
+
+
+# ---------- 差分API ----------
+
+@routes.post("/user/{shared_id}/increment")
+async def increment(request: web.Request):
+    data = await request.json()
+    shared_id = request.match_info["shared_id"]
+    return await run_idempotent(
+        request, lambda conn: increment_user(conn, shared_id, data.get("delta", {}), data.get("set", {}))
+    )
+
+
+@routes.post("/user/increment")
+async def increment_many(request: web.Request):
+    data = await request.json()
+    # デッドロックを避けるため常に shared_id 順に行ロックを取る
+    items = sorted(data.get("items", []), key=lambda i: str(i["shared_id"]))
+
+    async def handler(conn):
+        return [
+            await increment_user(conn, str(i["shared_id"]), i.get("delta", {}), i.get("set", {}))
+            for i in items
+        ]
+    return await run_idempotent(request, handler)
+
+
+@routes.post("/user/{shared_id}/debit")
+async def debit(request: web.Request):
+    data = await request.json()
+    shared_id = request.match_info["shared_id"]
+    amount = int(data["amount"])
+    if amount < 0:
+        raise web.HTTPBadRequest(text="amount must be >= 0")
+    return await run_idempotent(
+        request, lambda conn: debit_user(conn, shared_id, amount, int(data.get("min_balance", 0)))
+    )
+
+
+@routes.post("/transfer")
+async def transfer(request: web.Request):
+    data = await request.json()
+    from_id, to_id, amount = str(data["from"]), str(data["to"]), int(data["amount"])
+    if amount <= 0 or from_id == to_id:
+        raise web.HTTPBadRequest(text="invalid transfer")
+
+    async def handler(conn):
+        await ensure_user(conn, to_id)
+        # 2行のロック順を固定してデッドロックを避ける
+        await conn.fetch(
+            "SELECT 1 FROM economy_users WHERE shared_id = ANY($1::text[]) ORDER BY shared_id FOR UPDATE",
+            [from_id, to_id]
+        )
+        sender = await debit_user(conn, from_id, amount)
+        recipient = await increment_user(conn, to_id, {"balance": amount}, {})
+        return {"from": sender, "to": recipient}
+    return await run_idempotent(request, handler)
+
+
+async def init_schema(conn):
+    await conn.execute(SCHEMA)
+
+
+async def purge_idempotency(conn):
+    await conn.execute(f"DELETE FROM economy_idempotency WHERE created_at < now() - interval '{IDEMPOTENCY_TTL}'")
@@ -0,0 +1,72 @@
+from aiohttp import web
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS economy_inventory (
+    inventory_id SERIAL PRIMARY KEY,
+    gov_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    amount INT NOT NULL DEFAULT 0,
+    UNIQUE (gov_id, item_id)
+);
+"""
+
+routes = web.RouteTableDef()
+
+
+async def add_item(conn, gov_id: str, item_id: str, amount: int) -> dict:
+    row = await conn.fetchrow(
+        """
+        INSERT INTO economy_inventory (gov_id, item_id, amount) VALUES ($1, $2, $3)
+        ON CONFLICT (gov_id, item_id) DO UPDATE SET amount = economy_inventory.amount + EXCLUDED.amount
+        RETURNING inventory_id, gov_id, item_id, amount
+        """,
+        gov_id, item_id, amount
+    )
+    return dict(row)
+
+
+@routes.get("/items/{gov_id}")
+async def get_items(request: web.Request):
+    async with request.app["pool"].acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT inventory_id, gov_id, item_id, amount FROM economy_inventory WHERE gov_id = $1 AND amount > 0",
+            request.match_info["gov_id"]
+        )
+    return web.json_response([dict(r) for r in rows])
+
+
+@routes.put("/items/add")
+async def put_item(request: web.Request):
+    data = await request.json()
+    async with request.app["pool"].acquire() as conn:
+        item = await add_item(conn, str(data["gov_id"]), data["item_id"], int(data.get("amount", 1)))
+    return web.json_response(item)
+
+
+@routes.post("/items/update")
+async def update_item(request: web.Request):
+    data = await request.json()
+    async with request.app["pool"].acquire() as conn:
+        row = await conn.fetchrow(
+            "UPDATE economy_inventory SET amount = $2 WHERE inventory_id = $1 RETURNING inventory_id, gov_id, item_id, amount",
+            int(data["inventory_id"]), int(data["amount"])
+        )
+    if row is None:
+        raise web.HTTPNotFound(text="inventory not found")
+    return web.json_response(dict(row))
+
+
+@routes.delete("/items/{inventory_id}")
+async def delete_item(request: web.Request):
+    async with request.app["pool"].acquire() as conn:
+        deleted = await conn.fetchval(
+            "DELETE FROM economy_inventory WHERE inventory_id = $1 RETURNING inventory_id",
+            int(request.match_info["inventory_id"])
+        )
+    if deleted is None:
+        raise web.HTTPNotFound(text="inventory not found")
+    return web.json_response({"deleted": deleted})
+
+
+async def init_schema(conn):
+    await conn.execute(SCHEMA)
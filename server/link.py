@@ -0,0 +1,79 @@
+import os
+import secrets
+from aiohttp import web
+
+# 連携コードの有効期限（分）
+LINK_CODE_TTL_MINUTES = int(os.getenv("LINK_CODE_TTL_MINUTES", 10))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS economy_link_codes (
+    code TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    universal_id TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS economy_links (
+    target_type TEXT NOT NULL,
+    target_id TEXT NOT NULL,
+    universal_id TEXT NOT NULL,
+    PRIMARY KEY (target_type, target_id)
+);
+"""
+
+routes = web.RouteTableDef()
+
+
+@routes.post("/link-code")
+async def create_link_code(request: web.Request):
+    data = await request.json()
+    code = secrets.token_hex(4).upper()
+    async with request.app["pool"].acquire() as conn:
+        await conn.execute(
+            f"""
+            INSERT INTO economy_link_codes (code, source, universal_id, expires_at)
+            VALUES ($1, $2, $3, now() + interval '{LINK_CODE_TTL_MINUTES} minutes')
+            """,
+            code, data.get("source", "discord"), str(data["universal_id"])
+        )
+    return web.json_response({"code": code})
+
+
+@routes.post("/link")
+async def complete_link(request: web.Request):
+    data = await request.json()
+    async with request.app["pool"].acquire() as conn:
+        async with conn.transaction():
+            universal_id = await conn.fetchval(
+                "DELETE FROM economy_link_codes WHERE code = $1 AND expires_at > now() RETURNING universal_id",
+                data["code"]
+            )
+            if universal_id is None:
+                raise web.HTTPNotFound(text="invalid or expired code")
+            await conn.execute(
+                """
+                INSERT INTO economy_links (target_type, target_id, universal_id) VALUES ($1, $2, $3)
+                ON CONFLICT (target_type, target_id) DO UPDATE SET universal_id = EXCLUDED.universal_id
+                """,
+                data["target_type"], str(data["target_id"]), universal_id
+            )
+    return web.json_response({"universal_id": universal_id})
+
+
+@routes.get("/link")
+async def get_link(request: web.Request):
+    discord_id = request.query.get("discord_id")
+    if not discord_id:
+        raise web.HTTPBadRequest(text="discord_id is required")
+    async with request.app["pool"].acquire() as conn:
+        universal_id = await conn.fetchval(
+            "SELECT universal_id FROM economy_links WHERE target_type = 'discord' AND target_id = $1", discord_id
+        )
+    if universal_id is None:
+        raise web.HTTPNotFound(text="not linked")
+    return web.json_response({"universal_id": universal_id})
+
+
+async def init_schema(conn):
+    await conn.execute(SCHEMA)
+    await conn.execute("DELETE FROM economy_link_codes WHERE expires_at < now()")
@@ -0,0 +1,169 @@
+"""
+経済APIの負荷試験。Botと同じクライアント（utils/economy_api, utils/shop）で
+/work・/pay・カジノの払い戻し・ショップ購入を混ぜて投げ、p50/p99とスループットを出す。
+
+    python -m server.loadgen --url http://localhost:8000 --duration 30 --concurrency 32
+"""
+import time
+import random
+import asyncio
+import argparse
+import datetime
+
+from utils import http_client, economy_api, shop as shop_utils
+
+# 操作ごとの比率（--mix で上書き）
+DEFAULT_MIX = "work=35,pay=25,casino=35,shop=5"
+
+
+class OpStats:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.ok = 0
+        self.rejected = 0
+
+    def record(self, elapsed: float, ok: bool):
+        self.latencies.append(elapsed)
+        if ok:
+            self.ok += 1
+        else:
+            self.rejected += 1
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoadGenerator:
+    def __init__(self, users: int, seed_balance: int, item_ids: list[str]):
+        self.user_ids = [f"loadtest_{i}" for i in range(users)]
+        self.seed_balance = seed_balance
+        self.item_ids = item_ids
+        self.stats: dict[str, OpStats] = {}
+        self.ops = {
+            "work": self.op_work,
+            "pay": self.op_pay,
+            "casino": self.op_casino,
+            "shop": self.op_shop,
+        }
+
+    # ---------- 操作（Botの各コマンドと同じ呼び出し） ----------
+
+    async def op_work(self) -> bool:
+        user_id = random.choice(self.user_ids)
+        now = datetime.datetime.utcnow().isoformat()
+        return await economy_api.increment(user_id, {"balance": random.randint(1000, 5000)}, {"last_work_time": now}) is not None
+
+    async def op_pay(self) -> bool:
+        sender, recipient = random.sample(self.user_ids, 2)
+        return await economy_api.transfer(sender, recipient, random.randint(1, 500)) is not None
+
+    async def op_casino(self) -> bool:
+        # 掛け金の引き落とし → 勝てば払い戻し（blackjack / poker と同じ2往復）
+        user_id = random.choice(self.user_ids)
+        bet = random.randint(100, 2000)
+        if await economy_api.conditional_debit(user_id, bet) is None:
+            return False
+        if random.random() < 0.45:
+            return await economy_api.increment(user_id, {"balance": bet * 2}) is not None
+        return True
+
+    async def op_shop(self) -> bool:
+        return await shop_utils.purchase_item(random.choice(self.user_ids), random.choice(self.item_ids), 1)
+
+    # ---------- 実行 ----------
+
+    async def seed(self):
+        await asyncio.gather(*(
+            economy_api.increment(user_id, {}, {"balance": self.seed_balance}) for user_id in self.user_ids
+        ))
+        for item_id in self.item_ids:
+            definition = shop_utils.get_item_definition(item_id)
+            await http_client.request("shop", "PUT", f"/items/{item_id}", json={
+                "price": definition["price"], "stock": 1_000_000, "daily_reset": False
+            })
+
+    async def worker(self, names: list[str], weights: list[float], deadline: float):
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = await self.ops[name]()
+            except Exception as e:
+                print(f"[loadgen] {name} でエラー: {e}")
+                ok = False
+            self.stats.setdefault(name, OpStats()).record(time.perf_counter() - started, ok)
+
+    async def run(self, mix: dict[str, float], concurrency: int, duration: float) -> float:
+        names, weights = list(mix), list(mix.values())
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.worker(names, weights, deadline) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float):
+        print(f"{'op':<8}{'count':>8}{'ok':>8}{'rej':>6}{'ops/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        total = OpStats()
+        for name, s in sorted(self.stats.items()):
+            total.latencies += s.latencies
+            total.ok += s.ok
+            total.rejected += s.rejected
+            self._print_row(name, s, elapsed)
+        self._print_row("total", total, elapsed)
+
+        for service, s in http_client.registry.get_stats().items():
+            if s["requests"]:
+                print(
+                    f"[{service}] requests={s['requests']} retries={s['retries']} failures={s['failures']} "
+                    f"new_conn={s['connections_created']} reuse={s['reuse_rate'] * 100:.1f}%"
+                )
+
+    @staticmethod
+    def _print_row(name: str, s: OpStats, elapsed: float):
+        count = len(s.latencies)
+        print(
+            f"{name:<8}{count:>8}{s.ok:>8}{s.rejected:>6}{count / elapsed:>9.1f}"
+            f"{s.percentile(0.50) * 1000:>9.1f}{s.percentile(0.99) * 1000:>9.1f}"
+            f"{(max(s.latencies) if s.latencies else 0) * 1000:>9.1f}"
+        )
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+async def main(args):
+    # 接続先を負荷試験用に差し替える（接続数などは通常のBotと同じ設定）
+    http_client.registry.services["economy"]["base_url"] = args.url
+    http_client.registry.services["shop"]["base_url"] = args.url.rstrip("/") + "/api/shop"
+
+    mix = parse_mix(args.mix)
+    unknown = set(mix) - {"work", "pay", "casino", "shop"}
+    if unknown:
+        raise SystemExit(f"unknown ops in --mix: {sorted(unknown)}")
+
+    gen = LoadGenerator(args.users, args.seed_balance, list(shop_utils.load_item_definitions()))
+    try:
+        await gen.seed()
+        print(f"[loadgen] users={args.users} concurrency={args.concurrency} duration={args.duration}s mix={args.mix}")
+        elapsed = await gen.run(mix, args.concurrency, args.duration)
+        gen.report(elapsed)
+    finally:
+        await http_client.registry.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="経済APIの負荷試験")
+    parser.add_argument("--url", default="http://localhost:8000", help="経済APIのURL")
+    parser.add_argument("--users", type=int, default=200, help="試験用ユーザー数")
+    parser.add_argument("--seed-balance", type=int, default=1_000_000, help="試験開始時の残高")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時に動かすクライアント数")
+    parser.add_argument("--duration", type=float, default=30.0, help="試験時間（秒）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="操作の比率 (例: work=35,pay=25,casino=35,shop=5)")
+    asyncio.run(main(parser.parse_args()))
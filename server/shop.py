@@ -0,0 +1,121 @@
+import os
+from aiohttp import web
+
+from utils.shop import load_item_definitions
+from server.economy import Insufficient, debit_user, run_idempotent
+from server.items import add_item
+
+# 定義ファイルから作る初期在庫
+DEFAULT_STOCK = int(os.getenv("SHOP_DEFAULT_STOCK", 100))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS economy_shop_items (
+    shop_item_id SERIAL PRIMARY KEY,
+    item_id TEXT UNIQUE NOT NULL,
+    price BIGINT NOT NULL,
+    stock INT NOT NULL DEFAULT 0,
+    daily_reset BOOLEAN NOT NULL DEFAULT TRUE,
+    max_daily_stock INT NOT NULL DEFAULT 0,
+    active BOOLEAN NOT NULL DEFAULT TRUE
+);
+"""
+
+COLUMNS = "shop_item_id, item_id, price, stock, daily_reset, max_daily_stock, active"
+
+routes = web.RouteTableDef()
+
+
+@routes.get("/api/shop/items")
+async def list_items(request: web.Request):
+    async with request.app["pool"].acquire() as conn:
+        rows = await conn.fetch(f"SELECT {COLUMNS} FROM economy_shop_items ORDER BY shop_item_id")
+    return web.json_response([dict(r) for r in rows])
+
+
+@routes.get("/api/shop/items/{item_id}")
+async def get_item(request: web.Request):
+    async with request.app["pool"].acquire() as conn:
+        row = await conn.fetchrow(
+            f"SELECT {COLUMNS} FROM economy_shop_items WHERE item_id = $1", request.match_info["item_id"]
+        )
+    if row is None:
+        raise web.HTTPNotFound(text="item not found")
+    return web.json_response(dict(row))
+
+
+@routes.put("/api/shop/items/{item_id}")
+async def put_item(request: web.Request):
+    """管理者用：販売アイテムの追加・変更"""
+    data = await request.json()
+    stock = int(data.get("stock", DEFAULT_STOCK))
+    async with request.app["pool"].acquire() as conn:
+        row = await conn.fetchrow(
+            f"""
+            INSERT INTO economy_shop_items (item_id, price, stock, daily_reset, max_daily_stock, active)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            ON CONFLICT (item_id) DO UPDATE SET
+                price = EXCLUDED.price, stock = EXCLUDED.stock, daily_reset = EXCLUDED.daily_reset,
+                max_daily_stock = EXCLUDED.max_daily_stock, active = EXCLUDED.active
+            RETURNING {COLUMNS}
+            """,
+            request.match_info["item_id"], int(data["price"]), stock,
+            bool(data.get("daily_reset", True)), int(data.get("max_daily_stock", stock)), bool(data.get("active", True))
+        )
+    return web.json_response(dict(row))
+
+
+@routes.post("/api/shop/buy")
+async def buy(request: web.Request):
+    """在庫の引き当て・代金の引き落とし・アイテム付与を1トランザクションで行う"""
+    data = await request.json()
+    gov_id, item_id, amount = str(data["gov_id"]), data["item_id"], int(data.get("amount", 1))
+    if amount <= 0:
+        raise web.HTTPBadRequest(text="amount must be > 0")
+
+    async def handler(conn):
+        price = await conn.fetchval(
+            """
+            UPDATE economy_shop_items SET stock = stock - $2
+            WHERE item_id = $1 AND active AND stock >= $2
+            RETURNING price
+            """,
+            item_id, amount
+        )
+        if price is None:
+            raise Insufficient("out of stock")
+        user = await debit_user(conn, gov_id, price * amount)
+        item = await add_item(conn, gov_id, item_id, amount)
+        return {"user": user, "item": item, "total": price * amount}
+    return await run_idempotent(request, handler)
+
+
+@routes.post("/api/shop/restock")
+async def restock(request: web.Request):
+    data = await request.json()
+    async with request.app["pool"].acquire() as conn:
+        row = await conn.fetchrow(
+            f"UPDATE economy_shop_items SET stock = stock + $2 WHERE item_id = $1 RETURNING {COLUMNS}",
+            data["item_id"], int(data["amount"])
+        )
+    if row is None:
+        raise web.HTTPNotFound(text="item not found")
+    return web.json_response(dict(row))
+
+
+@routes.post("/api/shop/reset")
+async def reset(request: web.Request):
+    async with request.app["pool"].acquire() as conn:
+        result = await conn.execute("UPDATE economy_shop_items SET stock = max_daily_stock WHERE daily_reset")
+    return web.json_response({"reset": int(result.split()[-1])})
+
+
+async def init_schema(conn):
+    await conn.execute(SCHEMA)
+    # 定義ファイルにあって未登録のアイテムを販売リストに入れておく
+    await conn.executemany(
+        """
+        INSERT INTO economy_shop_items (item_id, price, stock, max_daily_stock)
+        VALUES ($1, $2, $3, $3) ON CONFLICT (item_id) DO NOTHING
+        """,
+        [(item_id, int(d["price"]), DEFAULT_STOCK) for item_id, d in load_item_definitions().items()]
+    )
@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+
+from utils import economy_api
+
+# 何秒ごとにまとめて書き込むか
+FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", 15))
+# 未反映ユーザー数がこれを超えたら間隔を待たずに書き込む
+FLUSH_THRESHOLD = int(os.getenv("ACTIVITY_FLUSH_THRESHOLD", 500))
+# 1回の書き込みで同時に叩くAPIリクエスト数
+FLUSH_CONCURRENCY = int(os.getenv("ACTIVITY_FLUSH_CONCURRENCY", 8))
+# 1リクエストにまとめるユーザー数
+FLUSH_BATCH_SIZE = int(os.getenv("ACTIVITY_FLUSH_BATCH_SIZE", 100))
+# ユーザー情報スナップショットの保持数と有効期限
+SNAPSHOT_MAX_USERS = int(os.getenv("ACTIVITY_SNAPSHOT_MAX_USERS", 10000))
+SNAPSHOT_TTL = float(os.getenv("ACTIVITY_SNAPSHOT_TTL", 300))
+# シャットダウン時に書き込めなかった分の退避先
+PENDING_FILE = os.path.join("data", "activity_pending.json")
+
+
+def calc_level(balance: float, activity: float) -> int:
+    total = balance + activity
+    level = 1
+    threshold, increment = 500, 150
+    while total >= threshold:
+        level += 1
+        threshold += increment
+        increment += 150
+    return level
+
+
+class PendingActivity:
+    """1ユーザー分の未反映の増分"""
+
+    def __init__(self, first_at: float | None = None):
+        self.activity = 0.0
+        self.income = 0
+        self.reset = False
+        self.last_active_date: str | None = None
+        self.messages = 0
+        self.first_at = first_at or time.time()
+
+    def merge(self, other: "PendingActivity"):
+        # other の方が古い増分（書き込み失敗で戻ってきた分など）
+        if self.reset:
+            other_activity = 0.0
+        else:
+            other_activity = other.activity
+            self.reset = other.reset
+        self.activity += other_activity
+        self.income += other.income
+        self.messages += other.messages
+        self.last_active_date = self.last_active_date or other.last_active_date
+        self.first_at = min(self.first_at, other.first_at)
+
+    def to_delta(self, shared_id: str) -> dict:
+        """経済APIの apply_deltas 用の1件分"""
+        delta = {"balance": self.income}
+        set_fields = {"last_active_date": self.last_active_date}
+        if self.reset:
+            set_fields["activity_score"] = round(100.0 + self.activity, 2)
+        else:
+            delta["activity_score"] = round(self.activity, 2)
+        return {"shared_id": shared_id, "delta": delta, "set": set_fields}
+
+    def to_dict(self) -> dict:
+        return {
+            "activity": self.activity,
+            "income": self.income,
+            "reset": self.reset,
+            "last_active_date": self.last_active_date,
+            "messages": self.messages,
+            "first_at": self.first_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PendingActivity":
+        p = cls(data.get("first_at"))
+        p.activity = data.get("activity", 0.0)
+        p.income = data.get("income", 0)
+        p.reset = data.get("reset", False)
+        p.last_active_date = data.get("last_active_date")
+        p.messages = data.get("messages", 0)
+        return p
+
+
+class ActivityAccrual:
+    """発言による活動度・収入をメモリに貯め、まとめて経済APIへ反映する"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.pending: dict[str, PendingActivity] = {}
+        self.company_pending: dict[int, int] = {}
+        # 送信に失敗したバッチ。サーバー側では反映済みかもしれないので、新しい増分とは混ぜず
+        # 同じ Idempotency-Key のまま送り直す
+        self.retry_batches: list[tuple[str, list[tuple[str, PendingActivity]]]] = []
+        # shared_id -> (取得時刻, ユーザー情報)。未反映分も適用済みの見込み値
+        self.snapshots: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        # メトリクス
+        self.flushes = 0
+        self.flushed_users = 0
+        self.failed_users = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.last_flush_duration = 0.0
+
+    # ---------- スナップショット ----------
+
+    async def get_user(self, shared_id: str) -> dict | None:
+        cached = self.snapshots.get(shared_id)
+        if cached and time.time() - cached[0] < SNAPSHOT_TTL:
+            self.snapshots.move_to_end(shared_id)
+            return cached[1]
+
+        user = await economy_api.get_user(shared_id)
+        if user is None:
+            user = await economy_api.create_user(shared_id)
+        if user is not None:
+            self._store_snapshot(shared_id, user)
+        return user
+
+    def _store_snapshot(self, shared_id: str, user: dict):
+        self.snapshots[shared_id] = (time.time(), user)
+        self.snapshots.move_to_end(shared_id)
+        while len(self.snapshots) > SNAPSHOT_MAX_USERS:
+            self.snapshots.popitem(last=False)
+
+    # ---------- 貯める ----------
+
+    def add(self, shared_id: str, user: dict, *, activity_gain: float, reset: bool, today: str,
+            income: int, level: int, company_id: int | None):
+        p = self.pending.get(shared_id)
+        if p is None:
+            p = self.pending[shared_id] = PendingActivity()
+        if reset:
+            p.reset = True
+            p.activity = activity_gain
+        else:
+            p.activity += activity_gain
+        p.income += income
+        p.last_active_date = today
+        p.messages += 1
+
+        if income > 0 and company_id:
+            self.company_pending[company_id] = self.company_pending.get(company_id, 0) + income
+
+        # 次のメッセージ用にスナップショットへも反映しておく
+        base = 100.0 if reset else user.get("activity_score", 100.0)
+        user["activity_score"] = round(base + activity_gain, 2)
+        user["balance"] = user.get("balance", 0) + income
+        user["last_active_date"] = today
+        user["level"] = level
+
+        if len(self.pending) >= FLUSH_THRESHOLD:
+            self.request_flush()
+
+    def request_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self.flush())
+
+    # ---------- 書き込む ----------
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending and not self.company_pending and not self.retry_batches:
+                return
+            started = time.time()
+            pending, self.pending = self.pending, {}
+            company_pending, self.company_pending = self.company_pending, {}
+            retry_batches, self.retry_batches = self.retry_batches, []
+
+            items = list(pending.items())
+            new_batches = [
+                (uuid.uuid4().hex, items[i:i + FLUSH_BATCH_SIZE]) for i in range(0, len(items), FLUSH_BATCH_SIZE)
+            ]
+            if retry_batches or new_batches:
+                lag = started - min(p.first_at for _, batch in retry_batches + new_batches for _, p in batch)
+                self.last_flush_lag = lag
+                self.max_flush_lag = max(self.max_flush_lag, lag)
+
+            semaphore = asyncio.Semaphore(FLUSH_CONCURRENCY)
+            applied = 0
+
+            async def flush_batch(key: str, batch: list[tuple[str, PendingActivity]]) -> bool:
+                nonlocal applied
+                async with semaphore:
+                    ok = await self._apply(batch, key)
+                if ok:
+                    applied += len(batch)
+                else:
+                    self.failed_users += len(batch)
+                    self.retry_batches.append((key, batch))
+                return ok
+
+            # 再送分は古い順に1つずつ（同じユーザーの新しい増分より先に反映させる）
+            for i, (key, batch) in enumerate(retry_batches):
+                if not await flush_batch(key, batch):
+                    # まだ通らないなら残りも次回へ。送っていない新しい増分はキーを持たせずに戻す
+                    self.retry_batches.extend(retry_batches[i + 1:])
+                    for _, batch in new_batches:
+                        for shared_id, p in batch:
+                            self._requeue(shared_id, p)
+                    new_batches = []
+                    break
+            await asyncio.gather(*(flush_batch(key, batch) for key, batch in new_batches))
+
+            if company_pending:
+                try:
+                    async with self.pool.acquire() as conn:
+                        await conn.executemany(
+                            "UPDATE company_members SET total_assets = total_assets + $1 WHERE company_id = $2",
+                            [(amount, company_id) for company_id, amount in company_pending.items()]
+                        )
+                except Exception as e:
+                    print(f"[ActivityAccrual] 企業資産の反映に失敗: {e}")
+                    for company_id, amount in company_pending.items():
+                        self.company_pending[company_id] = self.company_pending.get(company_id, 0) + amount
+
+            self.flushes += 1
+            self.flushed_users += applied
+            self.last_flush_duration = time.time() - started
+
+    async def _apply(self, batch: list[tuple[str, PendingActivity]], key: str) -> bool:
+        # 加算はサーバー側で行うので読み出しは不要（レベルもサーバーが再計算する）
+        updated = await economy_api.apply_deltas([p.to_delta(shared_id) for shared_id, p in batch], key)
+        if updated is None:
+            return False
+        for user in updated:
+            # 書き込み中に新しい増分が来たユーザーは見込み値のスナップショットを残す
+            if user["shared_id"] not in self.pending:
+                self._store_snapshot(user["shared_id"], user)
+        return True
+
+    def _requeue(self, shared_id: str, p: PendingActivity):
+        current = self.pending.get(shared_id)
+        if current is None:
+            self.pending[shared_id] = p
+        else:
+            current.merge(p)
+
+    # ---------- シャットダウン対策 ----------
+
+    def load_pending(self):
+        if not os.path.exists(PENDING_FILE):
+            return
+        try:
+            with open(PENDING_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for shared_id, raw in data.get("users", {}).items():
+                self._requeue(shared_id, PendingActivity.from_dict(raw))
+            for raw in data.get("batches", []):
+                self.retry_batches.append((raw["key"], [
+                    (shared_id, PendingActivity.from_dict(p)) for shared_id, p in raw["users"].items()
+                ]))
+            for company_id, amount in data.get("companies", {}).items():
+                self.company_pending[int(company_id)] = self.company_pending.get(int(company_id), 0) + amount
+            os.remove(PENDING_FILE)
+            print(f"[ActivityAccrual] 前回未反映の {len(self.pending)} 件と再送待ち {len(self.retry_batches)} バッチを読み込みました。")
+        except Exception as e:
+            print(f"[ActivityAccrual] 未反映データの読み込みに失敗: {e}")
+
+    def save_pending(self):
+        if not self.pending and not self.company_pending and not self.retry_batches:
+            return
+        data = {
+            "users": {sid: p.to_dict() for sid, p in self.pending.items()},
+            "batches": [
+                {"key": key, "users": {sid: p.to_dict() for sid, p in batch}} for key, batch in self.retry_batches
+            ],
+            "companies": {str(cid): amount for cid, amount in self.company_pending.items()},
+        }
+        with open(PENDING_FILE, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(f"[ActivityAccrual] 未反映の {len(self.pending)} 件と再送待ち {len(self.retry_batches)} バッチを {PENDING_FILE} に退避しました。")
+
+    async def close(self):
+        """終了時：書き込みを試み、残った分はファイルに退避する"""
+        try:
+            await self.flush()
+        finally:
+            self.save_pending()
+
+    def get_stats(self) -> dict:
+        waiting = list(self.pending.values()) + [p for _, batch in self.retry_batches for _, p in batch]
+        oldest = min((p.first_at for p in waiting), default=None)
+        return {
+            "pending_users": len(self.pending),
+            "retry_batches": len(self.retry_batches),
+            "pending_companies": len(self.company_pending),
+            "current_lag": time.time() - oldest if oldest else 0.0,
+            "last_flush_lag": self.last_flush_lag,
+            "max_flush_lag": self.max_flush_lag,
+            "last_flush_duration": self.last_flush_duration,
+            "flushes": self.flushes,
+            "flushed_users": self.flushed_users,
+            "failed_users": self.failed_users,
+        }
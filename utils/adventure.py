@@ -2,7 +2,6 @@ import random
 import json
 import os
 from typing import Optional
-import aiohttp
 
 from utils import economy_api
 from utils import item as item_utils
@@ -109,7 +108,7 @@ class AdventureManager:
             "message": msg,
         }
 
-    async def end_adventure(self, user_id: int, session: aiohttp.ClientSession) -> dict:
+    async def end_adventure(self, user_id: int) -> dict:
         state = await self.get_state(user_id)
         if not state:
             raise ValueError("冒険が開始されていません。")
@@ -135,12 +134,12 @@ class AdventureManager:
         await self.userdb.set_user_setting(user_id, "exp", str(total_exp))
 
         # ゴールド加算（外部API）
-        economy = economy_api.EconomyAPI(session)
+        economy = economy_api.EconomyAPI()
         await economy.update_user(str(user_id), {"gold": base_gold})
 
         # アイテム付与（外部API）
         for item_id, count in state["inventory"].items():
-            await item_utils.ItemAPI(session).add_item(str(user_id), item_id, count)
+            await item_utils.ItemAPI().add_item(str(user_id), item_id, count)
 
         await self.userdb.clear_adventure_state(user_id)
 
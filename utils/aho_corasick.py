@@ -0,0 +1,119 @@
+from collections import deque
+
+
+class Automaton:
+    """Aho-Corasick法による複数パターン照合。
+
+    patterns は {パターン: 値}。本文を1回なめるだけで全パターンを探せるので、
+    辞書置換やNGワード判定でパターン数に比例して遅くならない。
+    """
+
+    def __init__(self, patterns: dict, ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        # ノードごとの遷移・失敗リンク・そのノードで終わるパターン番号（なければ -1）
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[int] = [-1]
+        # 失敗リンクをたどった先で最初に見つかる「パターンで終わるノード」
+        self.dict_link: list[int] = [0]
+        self.words: list[str] = []
+        self.values: list = []
+
+        index: dict[str, int] = {}
+        for word, value in patterns.items():
+            if not word:
+                continue
+            key = self._fold(word)
+            if key in index:
+                # 大文字小文字を無視すると同じになるものは後勝ち
+                self.values[index[key]] = value
+                continue
+            index[key] = len(self.words)
+            self.words.append(key)
+            self.values.append(value)
+            self._insert(key, index[key])
+        self._build()
+
+    def _fold(self, text: str) -> str:
+        if not self.ignore_case:
+            return text
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        # 小文字にすると長さが変わる文字（İ など）は位置がずれるのでそのまま
+        return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+    def _insert(self, word: str, idx: int):
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(-1)
+                self.dict_link.append(0)
+            node = nxt
+        self.out[node] = idx
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                f = self.goto[f].get(ch, 0)
+                self.fail[child] = f if f != child else 0
+                self.dict_link[child] = f if self.out[f] >= 0 else self.dict_link[f]
+                queue.append(child)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def finditer(self, text: str):
+        """(開始位置, 終了位置, 値) を重なりも含めてすべて返す（終了位置順）"""
+        if not self.words:
+            return
+        goto, fail, out, dict_link = self.goto, self.fail, self.out, self.dict_link
+        node = 0
+        for i, ch in enumerate(self._fold(text)):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] >= 0 else dict_link[node]
+            while hit:
+                idx = out[hit]
+                yield i + 1 - len(self.words[idx]), i + 1, self.values[idx]
+                hit = dict_link[hit]
+
+    def search(self, text: str):
+        """最初に見つかった一致 (開始位置, 終了位置, 値)。なければ None"""
+        return next(self.finditer(text), None)
+
+    def replace(self, text: str) -> str:
+        """一致部分を値で置き換える。重なる場合は左から、同じ位置なら最長のものを優先する"""
+        if not self.words:
+            return text
+        # 開始位置 -> (最長の長さ, 値)
+        best: dict[int, tuple[int, object]] = {}
+        for start, end, value in self.finditer(text):
+            length = end - start
+            if length > best.get(start, (0, None))[0]:
+                best[start] = (length, value)
+        if not best:
+            return text
+
+        parts = []
+        pos = 0
+        for start in sorted(best):
+            if start < pos:
+                continue
+            length, value = best[start]
+            parts.append(text[pos:start])
+            parts.append(str(value))
+            pos = start + length
+        parts.append(text[pos:])
+        return "".join(parts)
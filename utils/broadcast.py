@@ -0,0 +1,353 @@
+import os
+import time
+import json
+import asyncio
+import discord
+
+# 同時に送る数の上限と初期値（応答が遅くなる＝レート制限で待たされたら半分に絞る）
+MAX_CONCURRENCY = int(os.getenv("BROADCAST_MAX_CONCURRENCY", 8))
+INITIAL_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 4))
+# 全体の送信ペース（Discordのグローバル上限 50req/s より低く。DMはチャンネル作成も1回と数える）
+RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE", 25))
+# 1回に読み出す宛先の数
+PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", 500))
+# 5xxなど一時的な失敗の再試行回数と、再試行までの待ち（秒、回数ごとに倍）
+MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.getenv("BROADCAST_RETRY_BASE_DELAY", 10))
+# DBエラーなどでジョブ自体が止まったときに再開するまでの待ち（秒、回数ごとに倍・上限あり）
+JOB_RETRY_BASE_DELAY = float(os.getenv("BROADCAST_JOB_RETRY_BASE_DELAY", 30))
+JOB_RETRY_MAX_DELAY = float(os.getenv("BROADCAST_JOB_RETRY_MAX_DELAY", 600))
+# 進捗メッセージを更新する間隔（秒）
+PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", 15))
+# 1件の送信にこれ以上かかったら、ライブラリがレート制限で待ったとみなす（秒）
+THROTTLE_THRESHOLD = float(os.getenv("BROADCAST_THROTTLE_THRESHOLD", 1.0))
+
+# broadcast_targets.status
+PENDING, SENT, FAILED = 0, 1, 2
+
+
+class AdaptiveLimiter:
+    """同時実行数を増減させる。詰まったら半分、順調なら少しずつ戻す（AIMD）"""
+
+    def __init__(self, initial: int, maximum: int):
+        self.limit = max(1, min(initial, maximum))
+        self.maximum = maximum
+        self.active = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit * 20 and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttled(self):
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+
+
+class Pacer:
+    """送信の間隔を 1/rate 秒以上空ける（全ジョブ共通）"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Broadcaster:
+    """大量のDM・チャンネルへの一斉送信。
+
+    ジョブと宛先はDBに保存し、送信結果も宛先ごとに記録するので、再起動しても続きから送れる。
+    宛先ごとに別の内容を送ることもできる（日次報酬のDMなど）。
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.pool = None
+        self.pacer = Pacer(RATE_PER_SECOND)
+        # job_id -> 実行中のタスク
+        self.runners: dict[int, asyncio.Task] = {}
+        # job_id -> 続けて中断した回数（再開までの待ちを延ばす）
+        self.job_failures: dict[int, int] = {}
+
+    async def init(self, pool):
+        self.pool = pool
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                    job_id BIGSERIAL PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    payload JSONB,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    total INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    report_channel_id BIGINT,
+                    report_message_id BIGINT,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    finished_at TIMESTAMP
+                );
+            """)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_targets (
+                    job_id BIGINT REFERENCES broadcast_jobs(job_id) ON DELETE CASCADE,
+                    target_type TEXT,
+                    target_id BIGINT,
+                    payload JSONB,
+                    status SMALLINT NOT NULL DEFAULT 0,
+                    attempts SMALLINT NOT NULL DEFAULT 0,
+                    error TEXT,
+                    PRIMARY KEY (job_id, target_type, target_id)
+                );
+            """)
+            # 一時的な失敗の再試行は、この時刻（UNIX秒）まで待つ
+            await conn.execute(
+                "ALTER TABLE broadcast_targets ADD COLUMN IF NOT EXISTS next_attempt_at DOUBLE PRECISION NOT NULL DEFAULT 0"
+            )
+
+    # === ジョブの作成・再開 ===
+
+    async def start(self, name: str, targets, payload: dict | None = None,
+                    report_channel_id: int | None = None) -> int:
+        """一斉送信を登録して裏で送り始め、job_id を返す。
+
+        targets は ("user" | "channel", id) か ("user" | "channel", id, 宛先ごとのpayload)。
+        payload は {"content": str, "embed": Embed.to_dict()} の形。
+        """
+        records = {}
+        for target in targets:
+            target_type, target_id = target[0], int(target[1])
+            own = json.dumps(target[2], ensure_ascii=False) if len(target) > 2 and target[2] else None
+            records[(target_type, target_id)] = own
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                job_id = await conn.fetchval("""
+                    INSERT INTO broadcast_jobs (name, payload, total, report_channel_id)
+                    VALUES ($1, $2::jsonb, $3, $4) RETURNING job_id
+                """, name, json.dumps(payload, ensure_ascii=False) if payload else None, len(records), report_channel_id)
+                # 宛先が多くても1回のCOPYで入れる
+                await conn.copy_records_to_table(
+                    "broadcast_targets",
+                    records=[(job_id, t, i, p) for (t, i), p in records.items()],
+                    columns=["job_id", "target_type", "target_id", "payload"],
+                )
+        self._spawn(job_id)
+        return job_id
+
+    async def resume(self):
+        """途中で止まったジョブを再開する（on_readyで呼ぶ。何度呼んでもよい）"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT job_id FROM broadcast_jobs WHERE status = 'running'")
+        for row in rows:
+            self._spawn(row["job_id"])
+
+    def _spawn(self, job_id: int):
+        task = self.runners.get(job_id)
+        if task is not None and not task.done():
+            return
+        self.runners[job_id] = asyncio.create_task(self._run(job_id))
+
+    async def cancel(self, job_id: int) -> bool:
+        async with self.pool.acquire() as conn:
+            result = await conn.execute(
+                "UPDATE broadcast_jobs SET status = 'cancelled', finished_at = NOW() WHERE job_id = $1 AND status = 'running'",
+                job_id
+            )
+        task = self.runners.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+        self.bot.scheduler.cancel(f"broadcast:{job_id}")
+        self.job_failures.pop(job_id, None)
+        return result != "UPDATE 0"
+
+    async def get_job(self, job_id: int):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow("SELECT * FROM broadcast_jobs WHERE job_id = $1", job_id)
+
+    async def get_errors(self, job_id: int) -> list:
+        """失敗の内訳 [(error, 件数)]"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetch("""
+                SELECT error, count(*) AS cnt FROM broadcast_targets
+                WHERE job_id = $1 AND status = $2 GROUP BY error ORDER BY cnt DESC
+            """, job_id, FAILED)
+
+    def close(self):
+        for task in self.runners.values():
+            task.cancel()
+        self.runners.clear()
+
+    # === 送信 ===
+
+    async def _run(self, job_id: int):
+        try:
+            await self.bot.wait_until_ready()
+            job = await self.get_job(job_id)
+            if job is None or job["status"] != "running":
+                return
+            default_payload = json.loads(job["payload"]) if job["payload"] else None
+            limiter = AdaptiveLimiter(INITIAL_CONCURRENCY, MAX_CONCURRENCY)
+            last_report = 0.0
+
+            while True:
+                async with self.pool.acquire() as conn:
+                    rows = await conn.fetch("""
+                        SELECT target_type, target_id, payload, attempts FROM broadcast_targets
+                        WHERE job_id = $1 AND status = $2 AND next_attempt_at <= $4
+                        ORDER BY target_type, target_id LIMIT $3
+                    """, job_id, PENDING, PAGE_SIZE, time.time())
+                    if not rows:
+                        # 残りが再試行待ちだけなら、一番早いものまで待つ
+                        next_at = await conn.fetchval(
+                            "SELECT min(next_attempt_at) FROM broadcast_targets WHERE job_id = $1 AND status = $2",
+                            job_id, PENDING
+                        )
+                if not rows:
+                    if next_at is None:
+                        break
+                    await asyncio.sleep(max(0.0, next_at - time.time()))
+                    continue
+
+                results = await asyncio.gather(*(
+                    self._send_one(limiter, row, json.loads(row["payload"]) if row["payload"] else default_payload)
+                    for row in rows
+                ))
+                await self._record(job_id, rows, results)
+
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self._report(job_id)
+
+            async with self.pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE broadcast_jobs SET status = 'done', finished_at = NOW() WHERE job_id = $1 AND status = 'running'",
+                    job_id
+                )
+            await self._report(job_id)
+            self.job_failures.pop(job_id, None)
+            print(f"[Broadcast] job {job_id} ({job['name']}) 完了")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 状態は running のまま残っているので、少し待ってから続きを送る
+            failures = self.job_failures.get(job_id, 0) + 1
+            self.job_failures[job_id] = failures
+            delay = min(JOB_RETRY_BASE_DELAY * 2 ** (failures - 1), JOB_RETRY_MAX_DELAY)
+            print(f"[Broadcast] job {job_id} が中断しました（{delay:.0f}秒後に再開）: {e!r}")
+            self.bot.scheduler.call_later(f"broadcast:{job_id}", delay, self._respawn, job_id)
+        finally:
+            if self.runners.get(job_id) is asyncio.current_task():
+                self.runners.pop(job_id, None)
+
+    async def _respawn(self, job_id: int):
+        self._spawn(job_id)
+
+    async def _send_one(self, limiter: AdaptiveLimiter, row, payload: dict | None) -> tuple[int, str | None]:
+        """(status, error) を返す。一時的な失敗は PENDING のまま返し、少し待ってから再試行する"""
+        if not payload:
+            return FAILED, "empty_payload"
+        async with limiter:
+            # DMはチャンネル作成と送信で2回リクエストする
+            await self.pacer.wait()
+            if row["target_type"] == "user":
+                await self.pacer.wait()
+            started = time.monotonic()
+            try:
+                target = await self._resolve(row["target_type"], row["target_id"])
+                if target is None:
+                    return FAILED, "not_found"
+                embed = discord.Embed.from_dict(payload["embed"]) if payload.get("embed") else None
+                await target.send(content=payload.get("content"), embed=embed)
+            except discord.Forbidden:
+                return FAILED, "forbidden"
+            except discord.NotFound:
+                return FAILED, "not_found"
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    limiter.on_throttled()
+                if e.status == 429 or e.status >= 500:
+                    if row["attempts"] + 1 < MAX_ATTEMPTS:
+                        return PENDING, f"http_{e.status}"
+                return FAILED, f"http_{e.status}"
+            except Exception as e:
+                if row["attempts"] + 1 < MAX_ATTEMPTS:
+                    return PENDING, type(e).__name__
+                return FAILED, type(e).__name__
+
+            if time.monotonic() - started > THROTTLE_THRESHOLD:
+                limiter.on_throttled()
+            else:
+                limiter.on_success()
+            return SENT, None
+
+    async def _resolve(self, target_type: str, target_id: int):
+        if target_type == "channel":
+            return self.bot.get_channel(target_id) or await self.bot.fetch_channel(target_id)
+        user = self.bot.get_user(target_id) or await self.bot.fetch_user(target_id)
+        if user.bot:
+            return None
+        return user.dm_channel or await user.create_dm()
+
+    async def _record(self, job_id: int, rows, results):
+        now = time.time()
+        updates = [
+            (job_id, row["target_type"], row["target_id"], status, error,
+             now + RETRY_BASE_DELAY * 2 ** row["attempts"] if status == PENDING else 0)
+            for row, (status, error) in zip(rows, results)
+        ]
+        sent = sum(1 for status, _ in results if status == SENT)
+        failed = sum(1 for status, _ in results if status == FAILED)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    UPDATE broadcast_targets SET status = $4, error = $5, next_attempt_at = $6, attempts = attempts + 1
+                    WHERE job_id = $1 AND target_type = $2 AND target_id = $3
+                """, updates)
+                await conn.execute(
+                    "UPDATE broadcast_jobs SET sent = sent + $2, failed = failed + $3 WHERE job_id = $1",
+                    job_id, sent, failed
+                )
+
+    async def _report(self, job_id: int):
+        """指定されたチャンネルに進捗を1つのメッセージで表示し、以降は編集していく"""
+        job = await self.get_job(job_id)
+        if job is None or not job["report_channel_id"]:
+            return
+        channel = self.bot.get_channel(job["report_channel_id"])
+        if channel is None:
+            return
+        done = job["sent"] + job["failed"]
+        ratio = done / job["total"] if job["total"] else 1.0
+        status = {"running": "送信中", "done": "完了", "cancelled": "中止"}.get(job["status"], job["status"])
+        text = (
+            f"📣 一斉送信 #{job_id}（{job['name']}）: {status}\n"
+            f"{done}/{job['total']}件（{ratio * 100:.1f}%） ✅ {job['sent']} / ❌ {job['failed']}"
+        )
+        try:
+            if job["report_message_id"]:
+                await channel.get_partial_message(job["report_message_id"]).edit(content=text)
+                return
+            message = await channel.send(text)
+            async with self.pool.acquire() as conn:
+                await conn.execute("UPDATE broadcast_jobs SET report_message_id = $2 WHERE job_id = $1", job_id, message.id)
+        except discord.HTTPException as e:
+            print(f"[Broadcast] job {job_id} の進捗表示に失敗: {e}")
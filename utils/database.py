@@ -0,0 +1,179 @@
+import os
+import time
+import asyncio
+import asyncpg
+from contextlib import asynccontextmanager
+
+# 接続設定（.env / 環境変数で上書き可能）
+DB_CONFIG = {
+    "user": os.getenv("DB_USER", "orbisuser"),
+    "password": os.getenv("DB_PASSWORD", "orbispass"),
+    "database": os.getenv("DB_NAME", "orbis"),
+    "host": os.getenv("DB_HOST", "orbis-db"),
+    "port": int(os.getenv("DB_PORT", 5432)),
+}
+
+# プール設定
+POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+    "statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100)),
+    "max_inactive_connection_lifetime": float(os.getenv("DB_CONN_MAX_IDLE", 300.0)),
+    "max_queries": int(os.getenv("DB_CONN_MAX_QUERIES", 50000)),
+    "command_timeout": float(os.getenv("DB_QUERY_TIMEOUT", 10.0)),
+}
+
+
+class CogStats:
+    """Cogごとの接続待ち時間・クエリ時間の集計"""
+
+    def __init__(self):
+        self.acquires = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.queries = 0
+        self.query_time_total = 0.0
+        self.query_time_max = 0.0
+        self.errors = 0
+
+    def record_acquire(self, wait: float):
+        self.acquires += 1
+        self.acquire_wait_total += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+
+    def record_query(self, elapsed: float, failed: bool):
+        self.queries += 1
+        self.query_time_total += elapsed
+        self.query_time_max = max(self.query_time_max, elapsed)
+        if failed:
+            self.errors += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "acquires": self.acquires,
+            "acquire_wait_avg_ms": self.acquire_wait_total / self.acquires * 1000 if self.acquires else 0.0,
+            "acquire_wait_max_ms": self.acquire_wait_max * 1000,
+            "queries": self.queries,
+            "query_avg_ms": self.query_time_total / self.queries * 1000 if self.queries else 0.0,
+            "query_max_ms": self.query_time_max * 1000,
+            "errors": self.errors,
+        }
+
+
+class CogPool:
+    """Cog向けのプールビュー。asyncpg.Poolと同じ感覚で acquire() を使える"""
+
+    def __init__(self, database: "Database", name: str):
+        self.database = database
+        self.name = name
+
+    def acquire(self):
+        return self.database.acquire(self.name)
+
+
+class Database:
+    """Bot全体で共有するasyncpgプール"""
+
+    def __init__(self):
+        self.pool: asyncpg.Pool | None = None
+        self.stats: dict[str, CogStats] = {}
+        # LISTEN/NOTIFY用の専用接続（プールとは別に1本だけ持つ）
+        self._listen_conn: asyncpg.Connection | None = None
+        self._listeners: dict[str, list] = {}
+        self._reset_callbacks: list = []
+        self._reconnect_task: asyncio.Task | None = None
+
+    async def connect(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(**DB_CONFIG, **POOL_CONFIG)
+            print(f"[DB] 共有プールを作成しました (min={POOL_CONFIG['min_size']}, max={POOL_CONFIG['max_size']})")
+
+    async def close(self):
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._listen_conn is not None:
+            conn, self._listen_conn = self._listen_conn, None
+            await conn.close()
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def listen(self, channel: str, callback, on_reset=None):
+        """NOTIFYを購読する。callback(payload: str) が呼ばれる。
+        on_reset は接続が切れて通知を取りこぼした可能性があるときに呼ばれる。"""
+        if on_reset is not None:
+            self._reset_callbacks.append(on_reset)
+        first = channel not in self._listeners
+        self._listeners.setdefault(channel, []).append(callback)
+        if self._listen_conn is None:
+            await self._open_listen_conn()
+        elif first:
+            await self._listen_conn.add_listener(channel, self._dispatch_notify)
+
+    async def notify(self, conn, channel: str, payload: str):
+        await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+    async def _open_listen_conn(self):
+        conn = await asyncpg.connect(**DB_CONFIG)
+        conn.add_termination_listener(self._on_listen_terminated)
+        for channel in self._listeners:
+            await conn.add_listener(channel, self._dispatch_notify)
+        self._listen_conn = conn
+
+    def _dispatch_notify(self, conn, pid, channel, payload):
+        for callback in self._listeners.get(channel, []):
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"[DB] NOTIFY処理エラー ({channel}): {e}")
+
+    def _on_listen_terminated(self, conn):
+        if conn is not self._listen_conn:
+            return
+        print("[DB] LISTEN接続が切断されました。再接続します。")
+        self._listen_conn = None
+        self._reconnect_task = asyncio.get_event_loop().create_task(self._reconnect_listen())
+
+    async def _reconnect_listen(self):
+        delay = 1.0
+        while self._listen_conn is None:
+            try:
+                await self._open_listen_conn()
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f"[DB] LISTEN再接続に失敗: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+        # 切断中の通知は届いていないので、キャッシュ側に破棄してもらう
+        for callback in self._reset_callbacks:
+            callback()
+
+    def for_cog(self, name: str) -> CogPool:
+        return CogPool(self, name)
+
+    @asynccontextmanager
+    async def acquire(self, name: str = "default"):
+        stats = self.stats.setdefault(name, CogStats())
+        started = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            stats.record_acquire(time.perf_counter() - started)
+
+            def query_logger(record):
+                stats.record_query(record.elapsed, record.exception is not None)
+
+            conn.add_query_logger(query_logger)
+            try:
+                yield conn
+            finally:
+                conn.remove_query_logger(query_logger)
+
+    def get_stats(self) -> dict[str, dict]:
+        result = {name: s.to_dict() for name, s in self.stats.items()}
+        if self.pool is not None:
+            result["_pool"] = {
+                "size": self.pool.get_size(),
+                "idle": self.pool.get_idle_size(),
+                "min_size": self.pool.get_min_size(),
+                "max_size": self.pool.get_max_size(),
+            }
+        return result
@@ -1,60 +1,195 @@
+import uuid
 import aiohttp
-import asyncio
 from typing import Optional
 
-BASE_URL = "https://localhost:8000"
+from utils import http_client
+
+SERVICE = "economy"
+
+# APIからユーザー情報を受け取るたびに呼ばれるコールバック（ランキングなど）
+_user_listeners: list = []
+
+
+def add_user_listener(callback):
+    if callback not in _user_listeners:
+        _user_listeners.append(callback)
+
+
+def remove_user_listener(callback):
+    if callback in _user_listeners:
+        _user_listeners.remove(callback)
+
+
+def _notify(*users):
+    for user in users:
+        if not user:
+            continue
+        for callback in _user_listeners:
+            try:
+                callback(user)
+            except Exception as e:
+                print(f"[economy_api] listener error: {e}")
+
 
 class EconomyAPI:
-    def __init__(self, session: aiohttp.ClientSession):
+    # session は旧呼び出しとの互換用。通信は共有の http_client を使う
+    def __init__(self, session: aiohttp.ClientSession | None = None):
         self.session = session
 
     async def get_user(self, shared_id: str) -> Optional[dict]:
         try:
-            async with self.session.get(f"{BASE_URL}/user/{shared_id}") as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                print(f"[get_user] Error {resp.status}: {await resp.text()}")
+            resp = await http_client.request(SERVICE, "GET", f"/user/{shared_id}")
+            if resp.status == 200:
+                _notify(resp.data)
+                return resp.data
+            if resp.status != 404:
+                print(f"[get_user] Error {resp.status}: {resp.data}")
         except aiohttp.ClientError as e:
             print(f"[get_user] ClientError: {e}")
         return None
 
     async def create_user(self, shared_id: str) -> Optional[dict]:
         try:
-            async with self.session.post(f"{BASE_URL}/user", json={"shared_id": shared_id}) as resp:
-                if resp.status == 200 or resp.status == 201:
-                    return await resp.json()
-                print(f"[create_user] Error {resp.status}: {await resp.text()}")
+            resp = await http_client.request(SERVICE, "POST", "/user", json={"shared_id": shared_id})
+            if resp.status == 200 or resp.status == 201:
+                _notify(resp.data)
+                return resp.data
+            print(f"[create_user] Error {resp.status}: {resp.data}")
         except aiohttp.ClientError as e:
             print(f"[create_user] ClientError: {e}")
         return None
 
     async def update_user(self, shared_id: str, data: dict) -> Optional[dict]:
         try:
-            async with self.session.patch(f"{BASE_URL}/user/{shared_id}", json=data) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                print(f"[update_user] Error {resp.status}: {await resp.text()}")
+            resp = await http_client.request(SERVICE, "PATCH", f"/user/{shared_id}", json=data)
+            if resp.status == 200:
+                _notify(resp.data)
+                return resp.data
+            print(f"[update_user] Error {resp.status}: {resp.data}")
         except aiohttp.ClientError as e:
             print(f"[update_user] ClientError: {e}")
         return None
+
     async def get_all_user(self) -> Optional[list]:
         try:
-            async with self.session.get(f"{BASE_URL}/user") as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                print(f"[get_all_user] Error {resp.status}: {await resp.text()}")
+            resp = await http_client.request(SERVICE, "GET", "/user")
+            if resp.status == 200:
+                return resp.data
+            print(f"[get_all_user] Error {resp.status}: {resp.data}")
         except aiohttp.ClientError as e:
             print(f"[get_all_user] ClientError: {e}")
         return None
-    async def add_money(self, shared_id: str, amount: int) -> Optional[dict]:
-        user = await self.get_user(shared_id)
-        if user is None:
-            print(f"[add_money] User {shared_id} not found. Creating user.")
-            user = await self.create_user(shared_id)
-            if user is None:
+
+    async def get_link(self, discord_id: int | str) -> Optional[dict]:
+        """Discord ID に連携された経済アカウントを返す"""
+        try:
+            resp = await http_client.request(SERVICE, "GET", "/link", params={"discord_id": str(discord_id)})
+            if resp.status == 200:
+                return resp.data
+            if resp.status != 404:
+                print(f"[get_link] Error {resp.status}: {resp.data}")
+        except aiohttp.ClientError as e:
+            print(f"[get_link] ClientError: {e}")
+        return None
+
+    # ---------- 差分API（サーバー側で原子的に加算する） ----------
+    # 加算系は再送で二重計上しないよう Idempotency-Key を付けて送る
+    # 呼び出し側で後から同じ内容を送り直す場合は、同じキーを渡すこと
+
+    async def _post_delta(self, name: str, path: str, payload: dict, idempotency_key: str | None = None) -> Optional[object]:
+        headers = {"Idempotency-Key": idempotency_key or uuid.uuid4().hex}
+        try:
+            resp = await http_client.request(
+                SERVICE, "POST", path, json=payload, headers=headers, retries=http_client.MAX_RETRIES
+            )
+            if resp.status == 200:
+                return resp.data
+            if resp.status == 409:
+                # 残高不足
                 return None
-        
-        current_money = user.get("money", 0)
-        new_money = current_money + amount
+            print(f"[{name}] Error {resp.status}: {resp.data}")
+        except aiohttp.ClientError as e:
+            print(f"[{name}] ClientError: {e}")
+        return None
+
+    async def increment(self, shared_id: str, delta: dict, set_fields: dict | None = None) -> Optional[dict]:
+        """数値フィールドに delta を加算する（ユーザーがいなければ作成）。
+        set_fields は同じトランザクションで上書きするフィールド。"""
+        user = await self._post_delta("increment", f"/user/{shared_id}/increment", {
+            "delta": delta,
+            "set": set_fields or {},
+        })
+        _notify(user)
+        return user
+
+    async def apply_deltas(self, items: list[dict], idempotency_key: str | None = None) -> Optional[list]:
+        """increment をまとめて1リクエストで行う。items は {"shared_id", "delta", "set"} のリスト"""
+        users = await self._post_delta("apply_deltas", "/user/increment", {"items": items}, idempotency_key)
+        if users:
+            _notify(*users)
+        return users
+
+    async def conditional_debit(self, shared_id: str, amount: int, min_balance: int = 0) -> Optional[dict]:
+        """引き落とし後の残高が min_balance 以上のときだけ balance から amount を引く。
+        残高不足・失敗時は None"""
+        user = await self._post_delta("conditional_debit", f"/user/{shared_id}/debit", {
+            "amount": amount,
+            "min_balance": min_balance,
+        })
+        _notify(user)
+        return user
+
+    async def transfer(self, from_id: str, to_id: str, amount: int) -> Optional[dict]:
+        """from_id から to_id へ送金する。戻り値は {"from": ユーザー, "to": ユーザー}。
+        残高不足・失敗時は None"""
+        result = await self._post_delta("transfer", "/transfer", {
+            "from": from_id,
+            "to": to_id,
+            "amount": amount,
+        })
+        if result:
+            _notify(result["from"], result["to"])
+        return result
+
+    async def add_money(self, shared_id: str, amount: int) -> Optional[dict]:
+        return await self.increment(shared_id, {"money": amount})
+
+
+# モジュール関数としても呼べるようにしておく（economy.py / activity_accrual.py 用）
+_api = EconomyAPI()
+
+
+async def get_user(shared_id: str) -> Optional[dict]:
+    return await _api.get_user(shared_id)
+
+
+async def create_user(shared_id: str) -> Optional[dict]:
+    return await _api.create_user(shared_id)
+
+
+async def update_user(shared_id: str, data: dict) -> Optional[dict]:
+    return await _api.update_user(shared_id, data)
+
+
+async def get_all_users() -> list:
+    return await _api.get_all_user() or []
+
+
+async def get_link(discord_id: int | str) -> Optional[dict]:
+    return await _api.get_link(discord_id)
+
+
+async def increment(shared_id: str, delta: dict, set_fields: dict | None = None) -> Optional[dict]:
+    return await _api.increment(shared_id, delta, set_fields)
+
+
+async def apply_deltas(items: list[dict], idempotency_key: str | None = None) -> Optional[list]:
+    return await _api.apply_deltas(items, idempotency_key)
+
+
+async def conditional_debit(shared_id: str, amount: int, min_balance: int = 0) -> Optional[dict]:
+    return await _api.conditional_debit(shared_id, amount, min_balance)
+
 
-        return await self.update_user(shared_id, {"money": new_money})
+async def transfer(from_id: str, to_id: str, amount: int) -> Optional[dict]:
+    return await _api.transfer(from_id, to_id, amount)
@@ -1,33 +1,117 @@
+import os
 import json
 import random
 import datetime
-import os
 
 FORTUNE_FILE = "data/fortune_effects.json"
+# 旧形式（全ユーザー分を1ファイルに書き戻していた）。起動時に今日の分だけ取り込む
 USER_FORTUNE_FILE = "data/user_fortunes.json"
+# DBに残しておく日数
+RETENTION_DAYS = int(os.getenv("FORTUNE_RETENTION_DAYS", 7))
+
+_fortune_data: list[dict] | None = None
+
+
+async def load_fortune_data() -> list[dict]:
+    """運勢の一覧（初回だけファイルから読み込む）"""
+    global _fortune_data
+    if _fortune_data is None:
+        with open(FORTUNE_FILE, "r", encoding="utf-8") as f:
+            _fortune_data = json.load(f)
+    return _fortune_data
+
+
+class FortuneStore:
+    """(user_id, 日付) ごとの運勢をDBに保存し、今日の分はメモリにも持つ"""
+
+    def __init__(self):
+        self.pool = None
+        self.cache_date: str | None = None
+        self.cache: dict[int, dict] = {}
+
+    async def init(self, pool):
+        self.pool = pool
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_fortunes (
+                    user_id BIGINT,
+                    date DATE,
+                    fortune JSONB NOT NULL,
+                    PRIMARY KEY (user_id, date)
+                );
+            """)
+        await self._import_legacy_file()
+
+    async def _import_legacy_file(self):
+        if not os.path.exists(USER_FORTUNE_FILE):
+            return
+        try:
+            with open(USER_FORTUNE_FILE, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            today = datetime.date.today()
+            rows = [
+                (int(user_id), today, json.dumps(v["fortune"], ensure_ascii=False))
+                for user_id, v in legacy.items() if v.get("date") == today.isoformat()
+            ]
+            async with self.pool.acquire() as conn:
+                await conn.executemany(
+                    "INSERT INTO user_fortunes (user_id, date, fortune) VALUES ($1, $2, $3::jsonb) ON CONFLICT DO NOTHING",
+                    rows
+                )
+            os.rename(USER_FORTUNE_FILE, USER_FORTUNE_FILE + ".bak")
+            print(f"[Fortune] {USER_FORTUNE_FILE} から今日の {len(rows)} 件を取り込みました。")
+        except Exception as e:
+            print(f"[Fortune] 旧ファイルの取り込みに失敗: {e}")
+
+    async def _roll_over(self, today: datetime.date):
+        # 日付が変わったらキャッシュを捨て、古い日の行を消す
+        self.cache_date = today.isoformat()
+        self.cache.clear()
+        if self.pool is None:
+            return
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute(
+                    "DELETE FROM user_fortunes WHERE date < $1", today - datetime.timedelta(days=RETENTION_DAYS)
+                )
+        except Exception as e:
+            print(f"[Fortune] 古い運勢の削除に失敗: {e}")
+
+    async def get(self, user_id: int) -> dict:
+        today = datetime.date.today()
+        today_str = today.isoformat()
+        if self.cache_date != today_str:
+            await self._roll_over(today)
+
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            return cached
+
+        chosen = random.choice(await load_fortune_data())
+        if self.pool is not None:
+            # 既に引いていればその運勢が、なければ今引いたものが返る（1往復）
+            async with self.pool.acquire() as conn:
+                stored = await conn.fetchval(
+                    """
+                    INSERT INTO user_fortunes (user_id, date, fortune) VALUES ($1, $2, $3::jsonb)
+                    ON CONFLICT (user_id, date) DO UPDATE SET fortune = user_fortunes.fortune
+                    RETURNING fortune
+                    """,
+                    user_id, today, json.dumps(chosen, ensure_ascii=False)
+                )
+            chosen = json.loads(stored)
+
+        entry = {"date": today_str, "fortune": chosen}
+        self.cache[user_id] = entry
+        return entry
+
+
+store = FortuneStore()
 
-async def load_fortune_data():
-    with open(FORTUNE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
 
 async def get_today_fortune(user_id: int) -> dict:
-    today_str = datetime.date.today().isoformat()
-    if os.path.exists(USER_FORTUNE_FILE):
-        with open(USER_FORTUNE_FILE, "r", encoding="utf-8") as f:
-            user_fortunes = json.load(f)
-    else:
-        user_fortunes = {}
-
-    key = str(user_id)
-    if key in user_fortunes and user_fortunes[key]["date"] == today_str:
-        return user_fortunes[key]
-
-    all_fortunes = await load_fortune_data()
-    chosen = random.choice(all_fortunes)
-    user_fortunes[key] = {"date": today_str, "fortune": chosen}
-    with open(USER_FORTUNE_FILE, "w", encoding="utf-8") as f:
-        json.dump(user_fortunes, f, ensure_ascii=False, indent=2)
-    return user_fortunes[key]
+    return await store.get(user_id)
+
 
 async def get_today_fortune_effects(user_id: int) -> dict:
     data = await get_today_fortune(user_id)
@@ -0,0 +1,160 @@
+import os
+import random
+import asyncio
+import aiohttp
+
+# 外部サービスごとの接続設定（.env / 環境変数で上書き可能）
+SERVICES = {
+    # 経済・アイテム・連携API
+    "economy": {
+        "base_url": os.getenv("ECONOMY_API_URL", "http://localhost:8000"),
+        "timeout": float(os.getenv("ECONOMY_API_TIMEOUT", 5.0)),
+        "limit_per_host": int(os.getenv("ECONOMY_API_MAX_CONNECTIONS", 20)),
+    },
+    # ショップAPI
+    "shop": {
+        "base_url": os.getenv("SHOP_API_URL", "http://localhost:8000/api/shop"),
+        "timeout": float(os.getenv("SHOP_API_TIMEOUT", 5.0)),
+        "limit_per_host": int(os.getenv("SHOP_API_MAX_CONNECTIONS", 10)),
+    },
+    # VoiceVox（合成は重いので長め）
+    "voicevox": {
+        "base_url": os.getenv("VOICEVOX_API_URL", "http://localhost:50021"),
+        "timeout": float(os.getenv("VOICEVOX_API_TIMEOUT", 30.0)),
+        "limit_per_host": int(os.getenv("VOICEVOX_API_MAX_CONNECTIONS", 4)),
+    },
+}
+
+KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30.0))
+DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+RETRY_BASE_DELAY = float(os.getenv("HTTP_RETRY_BASE_DELAY", 0.2))
+
+# 再送しても副作用が重複しないメソッド
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+RETRY_STATUSES = {502, 503, 504}
+
+
+class HTTPResult:
+    def __init__(self, status: int, data):
+        self.status = status
+        self.data = data
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+
+class ServiceStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def to_dict(self) -> dict:
+        acquired = self.connections_created + self.connections_reused
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": self.connections_reused / acquired if acquired else 0.0,
+        }
+
+
+class HTTPClientRegistry:
+    """Botが持つサービスごとのkeep-alive付きHTTPセッション"""
+
+    def __init__(self, services: dict[str, dict] = SERVICES):
+        self.services = services
+        self.sessions: dict[str, aiohttp.ClientSession] = {}
+        self.stats: dict[str, ServiceStats] = {name: ServiceStats() for name in services}
+
+    def _trace_config(self, stats: ServiceStats) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_create(session, ctx, params):
+            stats.connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            stats.connections_reused += 1
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    def session(self, service: str) -> aiohttp.ClientSession:
+        session = self.sessions.get(service)
+        if session is None or session.closed:
+            config = self.services[service]
+            connector = aiohttp.TCPConnector(
+                limit_per_host=config["limit_per_host"],
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                use_dns_cache=True,
+                ttl_dns_cache=DNS_CACHE_TTL,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=config["timeout"]),
+                trace_configs=[self._trace_config(self.stats[service])],
+            )
+            self.sessions[service] = session
+        return session
+
+    def url(self, service: str, path: str) -> str:
+        return self.services[service]["base_url"].rstrip("/") + path
+
+    async def request(self, service: str, method: str, path: str, *, read: str = "json",
+                      retries: int | None = None, **kwargs) -> HTTPResult:
+        """リクエストを送り、本文を読み込んだ結果を返す。
+        read は "json" / "text" / "bytes"。通信エラーは aiohttp.ClientError で送出する。"""
+        method = method.upper()
+        if retries is None:
+            retries = MAX_RETRIES if method in IDEMPOTENT_METHODS else 0
+        stats = self.stats[service]
+        url = self.url(service, path)
+
+        attempt = 0
+        while True:
+            stats.requests += 1
+            try:
+                async with self.session(service).request(method, url, **kwargs) as resp:
+                    if resp.status in RETRY_STATUSES and attempt < retries:
+                        raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+                    if read == "bytes":
+                        data = await resp.read()
+                    elif read == "text" or resp.content_type != "application/json":
+                        data = await resp.text()
+                    else:
+                        data = await resp.json()
+                    return HTTPResult(resp.status, data)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    stats.failures += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise aiohttp.ServerTimeoutError(f"{service} {method} {path} timed out") from e
+                    raise
+                attempt += 1
+                stats.retries += 1
+                # 指数バックオフ + フルジッター
+                await asyncio.sleep(random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt)))
+
+    async def close(self):
+        for session in self.sessions.values():
+            if not session.closed:
+                await session.close()
+        self.sessions.clear()
+
+    def get_stats(self) -> dict[str, dict]:
+        return {name: s.to_dict() for name, s in self.stats.items()}
+
+
+# Bot全体で共有するインスタンス（bot.http_clients からも参照できる）
+registry = HTTPClientRegistry()
+
+
+async def request(service: str, method: str, path: str, **kwargs) -> HTTPResult:
+    return await registry.request(service, method, path, **kwargs)
@@ -0,0 +1,120 @@
+import os
+import time
+from sortedcontainers import SortedList
+
+# ページのキャッシュを作り直す間隔（秒）
+SNAPSHOT_INTERVAL = float(os.getenv("LEADERBOARD_SNAPSHOT_INTERVAL", 30))
+# 経済APIから全件を取り直して差分の取りこぼしを埋める間隔（秒）
+RESYNC_INTERVAL = float(os.getenv("LEADERBOARD_RESYNC_INTERVAL", 3600))
+# 全件の取得がまだ一度も成功していないときの再試行間隔（秒）
+RESYNC_RETRY_INTERVAL = float(os.getenv("LEADERBOARD_RESYNC_RETRY_INTERVAL", 60))
+
+# ランキングの種類 -> 表示名
+BOARDS = {"level": "レベル", "balance": "所持金"}
+
+
+class Leaderboard:
+    """経済APIのユーザー情報を受け取りながら順位の索引を更新していくランキング"""
+
+    def __init__(self):
+        # shared_id -> (level, balance)
+        self.entries: dict[str, tuple[int, int]] = {}
+        self.boards: dict[str, SortedList] = {name: SortedList() for name in BOARDS}
+        # 何かしらのデータがある（差分だけでも）
+        self.loaded = False
+        # 全件の取得に成功したことがある
+        self.synced = False
+        # (board, page, per_page) -> そのページの行
+        self.page_cache: dict[tuple[str, int, int], list[tuple[int, str, int, int]]] = {}
+        self.cache_built_at = 0.0
+        self.updates = 0
+
+    @staticmethod
+    def _key(board: str, shared_id: str, level: int, balance: int) -> tuple:
+        # 昇順で並ぶので大きい方が先に来るよう符号を反転。同点は shared_id 順
+        if board == "level":
+            return (-level, -balance, shared_id)
+        return (-balance, -level, shared_id)
+
+    def _add(self, shared_id: str, level: int, balance: int):
+        self.entries[shared_id] = (level, balance)
+        for board, sl in self.boards.items():
+            sl.add(self._key(board, shared_id, level, balance))
+
+    def _discard(self, shared_id: str):
+        old = self.entries.pop(shared_id, None)
+        if old is not None:
+            for board, sl in self.boards.items():
+                sl.discard(self._key(board, shared_id, *old))
+
+    def update(self, user: dict):
+        """経済APIから受け取ったユーザー情報で順位を更新する（O(log n)）"""
+        shared_id = user.get("shared_id")
+        if shared_id is None:
+            return
+        shared_id = str(shared_id)
+        level, balance = int(user.get("level", 1)), int(user.get("balance", 0))
+        if self.entries.get(shared_id) == (level, balance):
+            return
+        self._discard(shared_id)
+        self._add(shared_id, level, balance)
+        self.updates += 1
+        self.loaded = True
+
+    def remove(self, shared_id: str):
+        self._discard(str(shared_id))
+
+    def load(self, users: list[dict]):
+        """全件から作り直す"""
+        self.entries = {
+            str(u["shared_id"]): (int(u.get("level", 1)), int(u.get("balance", 0)))
+            for u in users if u.get("shared_id") is not None
+        }
+        self.boards = {
+            board: SortedList(self._key(board, sid, *v) for sid, v in self.entries.items())
+            for board in BOARDS
+        }
+        self.page_cache.clear()
+        self.cache_built_at = time.time()
+        self.loaded = True
+        self.synced = True
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def total_pages(self, per_page: int) -> int:
+        return max(1, (len(self.entries) + per_page - 1) // per_page)
+
+    def page(self, board: str, page: int, per_page: int = 30) -> list[tuple[int, str, int, int]]:
+        """(順位, shared_id, level, balance) のリスト。SNAPSHOT_INTERVAL の間は同じ結果を返す"""
+        now = time.time()
+        if now - self.cache_built_at >= SNAPSHOT_INTERVAL:
+            self.page_cache.clear()
+            self.cache_built_at = now
+
+        cache_key = (board, page, per_page)
+        rows = self.page_cache.get(cache_key)
+        if rows is None:
+            start = (page - 1) * per_page
+            rows = []
+            for rank, key in enumerate(self.boards[board][start:start + per_page], start=start + 1):
+                shared_id = key[2]
+                level, balance = self.entries[shared_id]
+                rows.append((rank, shared_id, level, balance))
+            self.page_cache[cache_key] = rows
+        return rows
+
+    def rank_of(self, board: str, shared_id: str) -> int | None:
+        """現在の順位（1始まり）。O(log n)"""
+        entry = self.entries.get(str(shared_id))
+        if entry is None:
+            return None
+        return self.boards[board].index(self._key(board, str(shared_id), *entry)) + 1
+
+    def get_stats(self) -> dict:
+        return {
+            "users": len(self.entries),
+            "updates": self.updates,
+            "cached_pages": len(self.page_cache),
+            "snapshot_age": time.time() - self.cache_built_at,
+        }
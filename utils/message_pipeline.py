@@ -0,0 +1,142 @@
+import time
+import asyncio
+import discord
+
+# パイプラインのステージ順（小さいほど先に実行）
+STAGE_SPAM = 10
+STAGE_FILTER = 20
+STAGE_ECONOMY = 30
+STAGE_TTS = 40
+STAGE_SGC = 50
+STAGE_CHARACTER = 60
+
+
+class MessageContext:
+    """1メッセージにつき1つ作られ、全ステージで共有されるコンテキスト"""
+
+    def __init__(self, pipeline: "MessagePipeline", message: discord.Message, settings: dict[str, str]):
+        self.pipeline = pipeline
+        self.message = message
+        # ギルド設定のスナップショット（DMなら空）
+        self.settings = settings
+        # ステージ間で共有するフラグ（spam / ngword など）
+        self.flags: dict[str, object] = {
+            "is_dm": message.guild is None,
+            "content_length": len(message.content.strip()),
+        }
+        self.stopped = False
+        self.stop_reason: str | None = None
+        self._loaded: dict[str, object] = {}
+
+    def stop(self, reason: str):
+        """以降のステージを実行しない"""
+        self.stopped = True
+        self.stop_reason = reason
+
+    async def load(self, name: str):
+        """登録済みローダーで値を取得する（1メッセージにつき1回だけ実行）"""
+        if name not in self._loaded:
+            loader = self.pipeline.loaders.get(name)
+            self._loaded[name] = await loader(self) if loader else None
+        return self._loaded[name]
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.stops = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "avg_ms": self.total / self.calls * 1000 if self.calls else 0.0,
+            "max_ms": self.max * 1000,
+            "errors": self.errors,
+            "stops": self.stops,
+        }
+
+
+class Stage:
+    def __init__(self, name: str, handler, order: int, guild_only: bool, dm_only: bool, background: bool):
+        self.name = name
+        self.handler = handler
+        self.order = order
+        self.guild_only = guild_only
+        self.dm_only = dm_only
+        # True なら別タスクで実行し、後ろのステージを待たせない（ctx.stop はできない）
+        self.background = background
+        self.stats = StageStats()
+
+
+class MessagePipeline:
+    """on_messageを1か所で受け、各Cogのステージを順番に実行する"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.stages: list[Stage] = []
+        self.loaders: dict[str, object] = {}
+        # 実行中のバックグラウンドステージ
+        self.running: set[asyncio.Task] = set()
+
+    def add_stage(self, name: str, handler, order: int, *, guild_only: bool = True, dm_only: bool = False,
+                  background: bool = False):
+        """background=True は外部APIを待つなど遅くなりうるステージ用。
+        それより前のステージ（スパム・NGワード判定）を通ったメッセージだけで起動し、完了は待たない"""
+        self.remove_stage(name)
+        self.stages.append(Stage(name, handler, order, guild_only, dm_only, background))
+        self.stages.sort(key=lambda s: s.order)
+
+    def remove_stage(self, name: str):
+        self.stages = [s for s in self.stages if s.name != name]
+
+    def add_loader(self, name: str, loader):
+        self.loaders[name] = loader
+
+    def remove_loader(self, name: str):
+        self.loaders.pop(name, None)
+
+    async def build_context(self, message: discord.Message) -> MessageContext:
+        settings = {}
+        if message.guild:
+            db = self.bot.get_cog("DBHandler")
+            if db:
+                settings = await db.get_guild_settings(message.guild.id)
+        return MessageContext(self, message, settings)
+
+    async def dispatch(self, message: discord.Message):
+        if message.author.bot or not self.stages:
+            return
+
+        ctx = await self.build_context(message)
+        is_dm = ctx.flags["is_dm"]
+        for stage in self.stages:
+            if (stage.guild_only and is_dm) or (stage.dm_only and not is_dm):
+                continue
+            if stage.background:
+                task = asyncio.create_task(self._run_stage(stage, ctx))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+                continue
+            await self._run_stage(stage, ctx)
+            if ctx.stopped:
+                stage.stats.stops += 1
+                break
+
+    async def _run_stage(self, stage: Stage, ctx: MessageContext):
+        started = time.perf_counter()
+        try:
+            await stage.handler(ctx)
+        except Exception as e:
+            stage.stats.errors += 1
+            print(f"[Pipeline] ステージ {stage.name} でエラー: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            stage.stats.calls += 1
+            stage.stats.total += elapsed
+            stage.stats.max = max(stage.stats.max, elapsed)
+
+    def get_stats(self) -> dict[str, dict]:
+        return {stage.name: stage.stats.to_dict() for stage in self.stages}
@@ -0,0 +1,239 @@
+import os
+import re
+import time
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+# 抽出用のプロセス数（既定のスレッドプールとは別にする）
+WORKERS = int(os.getenv("MUSIC_EXTRACT_WORKERS", 2))
+# プロセスに渡せる同時リクエスト数（超えた分はこちらで待たせる）
+MAX_PENDING = int(os.getenv("MUSIC_EXTRACT_MAX_PENDING", WORKERS * 4))
+# 1回の抽出のタイムアウト（秒）
+TIMEOUT = float(os.getenv("MUSIC_EXTRACT_TIMEOUT", 30))
+# 抽出結果を使い回す時間（秒）。ストリームURLの期限が近ければそちらを優先する
+CACHE_TTL = float(os.getenv("MUSIC_EXTRACT_CACHE_TTL", 1800))
+CACHE_MAX_ENTRIES = int(os.getenv("MUSIC_EXTRACT_CACHE_MAX", 2000))
+# ストリームURLの期限ぎりぎりで再生し始めないための余裕（秒）
+EXPIRY_MARGIN = 300
+
+YTDL_OPTIONS = {
+    "format": "bestaudio/best",
+    "noplaylist": True,
+    "quiet": True,
+    "nocheckcertificate": True,
+    "ignoreerrors": False,
+    "logtostderr": False,
+    "no_warnings": True,
+    "default_search": "auto",
+    "source_address": "0.0.0.0"
+}
+
+# プレイリストは各曲の詳細を引かずに一覧だけ取る
+PLAYLIST_OPTIONS = {
+    **YTDL_OPTIONS,
+    "noplaylist": False,
+    "extract_flat": "in_playlist",
+}
+# プレイリストから読み込む最大曲数
+PLAYLIST_MAX_TRACKS = int(os.getenv("MUSIC_PLAYLIST_MAX_TRACKS", 200))
+
+# 呼び出し側で使う項目だけ返す（プロセス間でやり取りする量を減らす）
+INFO_KEYS = ("id", "title", "webpage_url", "url", "duration", "thumbnail", "uploader", "extractor_key")
+
+_YOUTUBE_ID = re.compile(r"(?:youtube\.com/(?:watch\?.*?v=|shorts/|embed/)|youtu\.be/)([\w-]{11})")
+
+# ---------- 抽出プロセス側 ----------
+
+_worker_ytdl = None
+_worker_playlist_ytdl = None
+
+
+def _extract_in_worker(url: str) -> dict | None:
+    """抽出プロセスで実行される。YoutubeDL はプロセスごとに1つ作って使い回す"""
+    global _worker_ytdl
+    import yt_dlp
+    if _worker_ytdl is None:
+        _worker_ytdl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
+    data = _worker_ytdl.extract_info(url, download=False)
+    if data is None:
+        return None
+    if "entries" in data:
+        entries = [e for e in data["entries"] if e]
+        if not entries:
+            return None
+        data = entries[0]
+    return {key: data.get(key) for key in INFO_KEYS}
+
+
+def _extract_playlist_in_worker(url: str) -> list[dict] | None:
+    """プレイリストの曲一覧（url / title / duration）だけを返す"""
+    global _worker_playlist_ytdl
+    import yt_dlp
+    if _worker_playlist_ytdl is None:
+        _worker_playlist_ytdl = yt_dlp.YoutubeDL({**PLAYLIST_OPTIONS, "playlistend": PLAYLIST_MAX_TRACKS})
+    data = _worker_playlist_ytdl.extract_info(url, download=False)
+    if data is None:
+        return None
+    entries = data.get("entries") or [data]
+    tracks = []
+    for entry in entries:
+        if not entry:
+            continue
+        page = entry.get("webpage_url") or entry.get("url")
+        if entry.get("ie_key") == "Youtube" and entry.get("id"):
+            page = f"https://www.youtube.com/watch?v={entry['id']}"
+        if not page:
+            continue
+        tracks.append({"url": page, "title": entry.get("title"), "duration": entry.get("duration")})
+    return tracks
+
+
+def is_playlist_url(url: str) -> bool:
+    query = parse_qs(urlparse(url).query)
+    return "list" in query or "/playlist" in urlparse(url).path
+
+
+# ---------- Bot側 ----------
+
+
+def cache_key(url: str) -> str:
+    """同じ動画を指すURLの揺れ（youtu.be / watch?v= / 追加パラメータ）をそろえる"""
+    match = _YOUTUBE_ID.search(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    return url.strip()
+
+
+def stream_expires_at(info: dict) -> float | None:
+    """署名付きストリームURLの期限（YouTubeは expire= に入っている）"""
+    stream_url = info.get("url")
+    if not stream_url:
+        return None
+    try:
+        expire = parse_qs(urlparse(stream_url).query).get("expire")
+        return float(expire[0]) if expire else None
+    except (ValueError, IndexError):
+        return None
+
+
+class ExtractError(Exception):
+    pass
+
+
+class MusicExtractor:
+    """yt-dlp の抽出を専用プロセスプールで行い、結果をTTL付きでキャッシュする"""
+
+    def __init__(self):
+        self.pool: ProcessPoolExecutor | None = None
+        self.slots = asyncio.Semaphore(MAX_PENDING)
+        # key -> (期限, info)
+        self.cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        # 同じURLの抽出が同時に走らないようにする
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # Botのスレッドやイベントループを複製しないよう spawn で起動する
+            self.pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    def _cached(self, key: str) -> dict | None:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        return entry[1]
+
+    def _remember(self, key: str, info: dict):
+        expires = time.time() + CACHE_TTL
+        stream_expires = stream_expires_at(info)
+        if stream_expires is not None:
+            expires = min(expires, stream_expires - EXPIRY_MARGIN)
+        self.cache[key] = (expires, info)
+        self.cache.move_to_end(key)
+        while len(self.cache) > CACHE_MAX_ENTRIES:
+            self.cache.popitem(last=False)
+        # 検索語で引いた場合も動画IDで引けるようにしておく
+        if info.get("webpage_url"):
+            alias = cache_key(info["webpage_url"])
+            if alias != key:
+                self.cache[alias] = (expires, info)
+
+    async def extract(self, url: str) -> dict:
+        """URL（または検索語）から曲の情報を返す。失敗したら ExtractError"""
+        key = cache_key(url)
+        info = self._cached(key)
+        if info is not None:
+            self.hits += 1
+            return info
+
+        pending = self.inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            info = await self._run(_extract_in_worker, url)
+            self._remember(key, info)
+            future.set_result(info)
+            return info
+        except BaseException as e:
+            # 待っている側には通常の例外として渡す
+            future.set_exception(e if isinstance(e, ExtractError) else ExtractError(str(e) or type(e).__name__))
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+    async def extract_playlist(self, url: str) -> list[dict]:
+        """YouTubeなどのプレイリストURLから曲の一覧を返す（各曲のストリームは引かない）"""
+        return await self._run(_extract_playlist_in_worker, url)
+
+    async def _run(self, func, url: str):
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            try:
+                info = await asyncio.wait_for(loop.run_in_executor(self._get_pool(), func, url), TIMEOUT)
+            except asyncio.TimeoutError:
+                # プロセス側の処理は止められないが、呼び出し側はもう待たない
+                self.timeouts += 1
+                raise ExtractError("情報の取得がタイムアウトしました。")
+            except Exception as e:
+                self.errors += 1
+                raise ExtractError(f"情報取得に失敗しました: {e}")
+        if info is None:
+            self.errors += 1
+            raise ExtractError("情報取得に失敗しました。")
+        return info
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "cached": len(self.cache),
+            "inflight": len(self.inflight),
+        }
@@ -0,0 +1,56 @@
+import unicodedata
+
+from utils.aho_corasick import Automaton
+
+# カタカナ（ァ〜ヶ）をひらがなにそろえる
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+
+def fold_text(text: str) -> str:
+    """照合用の正規化。全角半角（NFKC）・大文字小文字・カタカナ/ひらがなの違いを無視する"""
+    return unicodedata.normalize("NFKC", text).casefold().translate(_KATAKANA_TO_HIRAGANA)
+
+
+class NGWordMatcher:
+    """NGワードの一覧を1つのオートマトンにまとめ、本文を1回なめるだけで全件を探す"""
+
+    def __init__(self, words):
+        patterns = {}
+        for word in words:
+            folded = fold_text(word)
+            if folded:
+                # 正規化すると同じになる語は最初に登録されたものを表示に使う
+                patterns.setdefault(folded, word)
+        self.automaton = Automaton(patterns)
+
+    def __len__(self) -> int:
+        return len(self.automaton)
+
+    def find_all(self, text: str) -> list[str]:
+        """含まれているNGワード（登録時の表記）を出現順・重複なしで返す"""
+        if not len(self.automaton):
+            return []
+        found = {}
+        for _, _, word in self.automaton.finditer(fold_text(text)):
+            found.setdefault(word, None)
+        return list(found)
+
+
+class GuildNGWords:
+    """1ギルド分のNGワード。ギルド全体の分とチャンネル限定の分を別々にコンパイルしておく"""
+
+    def __init__(self, version: str | None, rows):
+        self.version = version
+        # channel_id（None はギルド全体）-> 単語のリスト
+        scopes: dict[int | None, list[str]] = {}
+        for word, channel_id in rows:
+            scopes.setdefault(channel_id, []).append(word)
+        self.matchers = {channel_id: NGWordMatcher(words) for channel_id, words in scopes.items()}
+
+    def find_all(self, channel_id: int, text: str) -> list[str]:
+        found = []
+        for scope in (None, channel_id):
+            matcher = self.matchers.get(scope)
+            if matcher is not None:
+                found.extend(w for w in matcher.find_all(text) if w not in found)
+        return found
@@ -0,0 +1,72 @@
+"""
+NGワード判定のマイクロベンチマーク。ランダムなNGワードを登録した状態で
+1秒あたり何件のメッセージを判定できるかを、従来の単語ごとの re.search と比べる。
+
+    python -m utils.ngword_bench --words 10000 --messages 2000
+"""
+import re
+import time
+import random
+import argparse
+
+from utils.ngword import NGWordMatcher
+
+_CHARS = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんアイウエオabcdefghijklmnopqrstuvwxyz"
+
+
+def random_word(rng: random.Random, min_len: int, max_len: int) -> str:
+    return "".join(rng.choice(_CHARS) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_messages(rng: random.Random, words: list[str], count: int, length: int, hit_rate: float) -> list[str]:
+    messages = []
+    for _ in range(count):
+        text = random_word(rng, length, length)
+        if rng.random() < hit_rate:
+            pos = rng.randint(0, len(text))
+            text = text[:pos] + rng.choice(words) + text[pos:]
+        messages.append(text)
+    return messages
+
+
+def measure(check, messages: list[str]) -> tuple[float, int]:
+    hits = 0
+    start = time.perf_counter()
+    for text in messages:
+        if check(text):
+            hits += 1
+    return len(messages) / (time.perf_counter() - start), hits
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    words = list({random_word(rng, 3, 8) for _ in range(args.words)})
+    messages = make_messages(rng, words, args.messages, args.length, args.hit_rate)
+
+    start = time.perf_counter()
+    matcher = NGWordMatcher(words)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"NGワード {len(words)}件 / メッセージ {len(messages)}件（{args.length}文字, 含有率 {args.hit_rate:.0%}）")
+    print(f"コンパイル: {build_ms:.1f}ms")
+
+    rate, hits = measure(matcher.find_all, messages)
+    print(f"Aho-Corasick : {rate:>10.0f} msg/s  hit={hits}")
+
+    if not args.skip_regex:
+        # 以前の実装：単語ごとに re.search（一致したらそこで打ち切り）
+        def regex_check(text):
+            return any(re.search(re.escape(w), text, re.IGNORECASE) for w in words)
+        baseline = messages[:max(1, args.messages // 20)]
+        rate_re, hits_re = measure(regex_check, baseline)
+        print(f"re.search    : {rate_re:>10.0f} msg/s  hit={hits_re}/{len(baseline)}（{len(baseline)}件で計測）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NGワード判定のベンチマーク")
+    parser.add_argument("--words", type=int, default=10_000, help="NGワード数")
+    parser.add_argument("--messages", type=int, default=2_000, help="判定するメッセージ数")
+    parser.add_argument("--length", type=int, default=80, help="メッセージの文字数")
+    parser.add_argument("--hit-rate", type=float, default=0.05, help="NGワードを含むメッセージの割合")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-regex", action="store_true", help="従来方式との比較を省く")
+    main(parser.parse_args())
@@ -0,0 +1,133 @@
+import array
+import struct
+import sys
+import warnings
+
+import discord
+
+# audioop は 3.13 で削除されるので、無ければ array で変換する
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+# Discordに渡すPCM（48kHz / ステレオ / 16bit）
+SAMPLE_RATE = 48000
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE  # 20ms分のバイト数（3840）
+
+
+class WavFormatError(ValueError):
+    pass
+
+
+def parse_wav(data: bytes) -> tuple[memoryview, int, int, int]:
+    """WAVのヘッダだけ読み、(PCM部分のmemoryview, チャンネル数, サンプリング周波数, サンプル幅) を返す"""
+    view = memoryview(data)
+    if len(data) < 12 or data[0:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise WavFormatError("not a RIFF/WAVE file")
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        chunk_size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, rate = struct.unpack_from("<HHI", data, body)
+            bits = struct.unpack_from("<H", data, body + 14)[0]
+            if audio_format != 1:
+                raise WavFormatError(f"unsupported wav format {audio_format}")
+            fmt = (channels, rate, bits // 8)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WavFormatError("data chunk before fmt chunk")
+            end = min(body + chunk_size, len(data))
+            return (view[body:end], *fmt)
+        # チャンクは2バイト境界にそろえられている
+        pos = body + chunk_size + (chunk_size & 1)
+    raise WavFormatError("no data chunk")
+
+
+def _convert_array(pcm: memoryview, channels: int, rate: int) -> bytes:
+    """audioop が無い環境用（16bitのみ）。最近傍で周波数を合わせる"""
+    samples = array.array("h")
+    samples.frombytes(pcm)
+    if sys.byteorder != "little":
+        samples.byteswap()
+    if channels == 2:
+        left, right = samples[0::2], samples[1::2]
+    else:
+        left = right = samples[0::channels]
+
+    frames = len(left)
+    out_frames = frames * SAMPLE_RATE // rate
+    out = array.array("h", bytes(out_frames * CHANNELS * SAMPLE_WIDTH))
+    for i in range(out_frames):
+        j = i * rate // SAMPLE_RATE
+        out[2 * i] = left[j]
+        out[2 * i + 1] = right[j]
+    if sys.byteorder != "little":
+        out.byteswap()
+    return out.tobytes()
+
+
+def to_discord_pcm(pcm: memoryview, channels: int, rate: int, width: int) -> bytes | memoryview:
+    """48kHz / ステレオ / 16bit にそろえる。既にそうならコピーせずそのまま返す"""
+    if (channels, rate, width) == (CHANNELS, SAMPLE_RATE, SAMPLE_WIDTH):
+        return pcm
+    if channels not in (1, 2):
+        raise WavFormatError(f"unsupported channel count {channels}")
+
+    if audioop is None:
+        if width != 2:
+            raise WavFormatError("only 16bit wav is supported without audioop")
+        return _convert_array(pcm, channels, rate)
+
+    data = bytes(pcm)
+    if width != SAMPLE_WIDTH:
+        if width == 1:
+            # 8bit WAVは符号なし
+            data = audioop.bias(data, 1, -128)
+        data = audioop.lin2lin(data, width, SAMPLE_WIDTH)
+    if rate != SAMPLE_RATE:
+        data, _ = audioop.ratecv(data, SAMPLE_WIDTH, channels, rate, SAMPLE_RATE, None)
+    if channels == 1:
+        data = audioop.tostereo(data, SAMPLE_WIDTH, 1, 1)
+    return data
+
+
+def needs_conversion(wav: bytes) -> bool:
+    _, channels, rate, width = parse_wav(wav)
+    return (channels, rate, width) != (CHANNELS, SAMPLE_RATE, SAMPLE_WIDTH)
+
+
+def decode_wav(wav: bytes) -> bytes | memoryview:
+    return to_discord_pcm(*parse_wav(wav))
+
+
+class PCMBufferSource(discord.AudioSource):
+    """メモリ上のPCMを20msずつ渡す音声ソース（ffmpegも一時ファイルも使わない）"""
+
+    def __init__(self, pcm: bytes | memoryview):
+        self.pcm = memoryview(pcm)
+        self.pos = 0
+
+    def read(self) -> bytes:
+        chunk = self.pcm[self.pos:self.pos + FRAME_SIZE]
+        if not chunk:
+            return b""
+        self.pos += FRAME_SIZE
+        if len(chunk) < FRAME_SIZE:
+            # 最後のフレームは無音で埋める
+            return bytes(chunk) + bytes(FRAME_SIZE - len(chunk))
+        return bytes(chunk)
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        self.pcm.release()
@@ -0,0 +1,140 @@
+import os
+import random
+import asyncio
+import itertools
+from collections import deque
+
+# 「前の曲」で戻れる曲数
+HISTORY_SIZE = int(os.getenv("MUSIC_HISTORY_SIZE", 20))
+
+
+class PlayQueue:
+    """再生待ちの曲を持つキュー。
+
+    曲そのものは dict（番号 -> 曲）に持ち、並びは番号の deque で表す。
+    base は元の並び（追加・並べ替え・削除を反映したもの）、シャッフル中は shuffle_order がその並べ替えで、
+    再生順は order（シャッフル中なら shuffle_order、そうでなければ base）になる。
+    シャッフル中の取り出し・削除は base からすぐには消さず、解除するときにまとめて除く。
+    先頭の取り出し・末尾への追加・全消去は O(1)。
+    """
+
+    def __init__(self):
+        self.items: dict[int, object] = {}
+        self.base: deque[int] = deque()
+        self.shuffle_order: deque[int] | None = None
+        self.history: deque = deque(maxlen=HISTORY_SIZE)
+        self._seq = itertools.count()
+        self._not_empty = asyncio.Event()
+
+    @property
+    def shuffled(self) -> bool:
+        return self.shuffle_order is not None
+
+    @property
+    def order(self) -> deque[int]:
+        """今の再生順"""
+        return self.base if self.shuffle_order is None else self.shuffle_order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __bool__(self) -> bool:
+        return bool(self.order)
+
+    def __iter__(self):
+        return (self.items[key] for key in self.order)
+
+    def __getitem__(self, index: int):
+        return self.items[self.order[index]]
+
+    def empty(self) -> bool:
+        return not self.order
+
+    # === 追加・取り出し ===
+
+    def append(self, item):
+        key = next(self._seq)
+        self.items[key] = item
+        self.base.append(key)
+        if self.shuffle_order is not None:
+            self.shuffle_order.append(key)
+            if len(self.shuffle_order) > 1:
+                # 残りの曲のどこかに入れる（Fisher-Yates の1ステップ分）
+                j = random.randrange(len(self.shuffle_order))
+                self.shuffle_order[j], self.shuffle_order[-1] = self.shuffle_order[-1], self.shuffle_order[j]
+        self._not_empty.set()
+
+    def appendleft(self, item):
+        """次に再生する曲として先頭に入れる"""
+        key = next(self._seq)
+        self.items[key] = item
+        self.base.appendleft(key)
+        if self.shuffle_order is not None:
+            self.shuffle_order.appendleft(key)
+        self._not_empty.set()
+
+    def popleft(self):
+        return self._discard(self.order.popleft())
+
+    async def get(self):
+        """次の曲を取り出す。空なら追加されるまで待つ"""
+        while not self.order:
+            await self._not_empty.wait()
+        return self.popleft()
+
+    def peek(self, count: int) -> list:
+        return [self.items[key] for key in itertools.islice(self.order, count)]
+
+    def page(self, start: int, count: int) -> list:
+        return [self.items[key] for key in itertools.islice(self.order, start, start + count)]
+
+    # === 編集（index は再生順で0始まり） ===
+
+    def remove(self, index: int):
+        order = self.order
+        key = order[index]
+        del order[index]
+        return self._discard(key)
+
+    def move(self, index: int, to: int):
+        """再生順の中で動かす。シャッフル中なら元の並びはそのまま"""
+        order = self.order
+        key = order[index]
+        del order[index]
+        order.insert(to, key)
+
+    def jump(self, index: int) -> int:
+        """index の曲が次に来るよう、その前の曲を捨てる。捨てた数を返す"""
+        for _ in range(index):
+            self.popleft()
+        return index
+
+    def clear(self):
+        self.items = {}
+        self.base = deque()
+        if self.shuffle_order is not None:
+            self.shuffle_order = deque()
+        self._not_empty.clear()
+
+    def set_shuffle(self, enabled: bool):
+        self._compact()
+        if enabled:
+            keys = list(self.base)
+            random.shuffle(keys)
+            self.shuffle_order = deque(keys)
+        else:
+            # 元の並び（シャッフル前の並べ替えも含む）に戻る
+            self.shuffle_order = None
+
+    def _discard(self, key: int):
+        """再生順から外した曲を消す。シャッフル中は base に残るので、溜まりすぎたら掃除する"""
+        item = self.items.pop(key)
+        if self.shuffle_order is not None and len(self.base) > 2 * len(self.items) + 32:
+            self._compact()
+        if not self.order:
+            self._not_empty.clear()
+        return item
+
+    def _compact(self):
+        if len(self.base) != len(self.items):
+            self.base = deque(key for key in self.base if key in self.items)
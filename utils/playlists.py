@@ -0,0 +1,237 @@
+import os
+import json
+
+# 曲の並び順の間隔。間に挿入する余地を残しておき、詰まったときだけ振り直す
+POSITION_GAP = 1024
+# 一覧表示の1ページあたりの件数
+PAGE_SIZE = int(os.getenv("PLAYLIST_PAGE_SIZE", 20))
+# 1つのプレイリストに入れられる曲数
+MAX_TRACKS = int(os.getenv("PLAYLIST_MAX_TRACKS", 1000))
+
+
+class PlaylistStore:
+    """ユーザーのプレイリストを保存する。
+
+    曲は1行ずつ playlist_tracks に持ち、position の順で並べる。
+    追加・削除・並べ替えは該当する曲の行だけを書き換える（プレイリスト全体を書き直さない）。
+    同じプレイリストへの変更は playlists の行ロックで順番に処理する。
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def init(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlists (
+                    playlist_id BIGSERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    name TEXT NOT NULL,
+                    track_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    UNIQUE (user_id, name)
+                );
+            """)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlist_tracks (
+                    track_id BIGSERIAL PRIMARY KEY,
+                    playlist_id BIGINT NOT NULL REFERENCES playlists(playlist_id) ON DELETE CASCADE,
+                    position BIGINT NOT NULL,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    duration INTEGER
+                );
+            """)
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS playlist_tracks_position ON playlist_tracks (playlist_id, position)"
+            )
+            await self._migrate_legacy(conn)
+
+    async def _migrate_legacy(self, conn):
+        """user_settings の playlist:<名前>（JSON）を新しいテーブルへ移す"""
+        if await conn.fetchval("SELECT to_regclass('user_settings')") is None:
+            return
+        async with conn.transaction():
+            rows = await conn.fetch(
+                "SELECT user_id, key, value FROM user_settings WHERE key LIKE 'playlist:%' FOR UPDATE"
+            )
+            if not rows:
+                return
+            records = []
+            for row in rows:
+                try:
+                    items = json.loads(row["value"] or "[]")
+                except ValueError:
+                    items = []
+                items = [item for item in items if isinstance(item, dict) and item.get("url")]
+                playlist_id = await conn.fetchval("""
+                    INSERT INTO playlists (user_id, name, track_count) VALUES ($1, $2, $3)
+                    ON CONFLICT (user_id, name) DO NOTHING
+                    RETURNING playlist_id
+                """, row["user_id"], row["key"][len("playlist:"):], len(items))
+                if playlist_id is None:
+                    # 移行済み（同名がすでにある）
+                    continue
+                for i, item in enumerate(items, start=1):
+                    records.append((playlist_id, i * POSITION_GAP, item["url"], item.get("title"), None))
+            if records:
+                await conn.copy_records_to_table(
+                    "playlist_tracks", records=records,
+                    columns=("playlist_id", "position", "url", "title", "duration")
+                )
+            await conn.execute("DELETE FROM user_settings WHERE key LIKE 'playlist:%'")
+        print(f"[Playlist] 旧形式のプレイリスト {len(rows)}件（{len(records)}曲）を移行しました。")
+
+    # === プレイリスト ===
+
+    async def create(self, user_id: int, name: str) -> bool:
+        async with self.pool.acquire() as conn:
+            playlist_id = await conn.fetchval("""
+                INSERT INTO playlists (user_id, name) VALUES ($1, $2)
+                ON CONFLICT (user_id, name) DO NOTHING
+                RETURNING playlist_id
+            """, user_id, name)
+        return playlist_id is not None
+
+    async def delete(self, user_id: int, name: str) -> bool:
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("DELETE FROM playlists WHERE user_id = $1 AND name = $2", user_id, name)
+        return result != "DELETE 0"
+
+    async def list_for_user(self, user_id: int, page: int = 1) -> tuple[list, int]:
+        """(そのページのプレイリスト, 全件数) を返す"""
+        async with self.pool.acquire() as conn:
+            total = await conn.fetchval("SELECT count(*) FROM playlists WHERE user_id = $1", user_id)
+            rows = await conn.fetch(
+                "SELECT name, track_count FROM playlists WHERE user_id = $1 ORDER BY name LIMIT $2 OFFSET $3",
+                user_id, PAGE_SIZE, (page - 1) * PAGE_SIZE
+            )
+        return rows, total
+
+    async def get(self, user_id: int, name: str):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(
+                "SELECT playlist_id, track_count FROM playlists WHERE user_id = $1 AND name = $2", user_id, name
+            )
+
+    # === 曲 ===
+
+    async def tracks(self, playlist_id: int, page: int | None = None) -> list:
+        """曲を並び順で返す。page を指定すればその1ページ分だけ"""
+        async with self.pool.acquire() as conn:
+            if page is None:
+                return await conn.fetch(
+                    "SELECT url, title, duration FROM playlist_tracks WHERE playlist_id = $1 ORDER BY position",
+                    playlist_id
+                )
+            return await conn.fetch("""
+                SELECT url, title, duration FROM playlist_tracks WHERE playlist_id = $1
+                ORDER BY position LIMIT $2 OFFSET $3
+            """, playlist_id, PAGE_SIZE, (page - 1) * PAGE_SIZE)
+
+    async def append(self, user_id: int, name: str, items: list[tuple[str, str | None, int | None]]) -> int | None:
+        """(url, title, duration) を末尾に追加して、追加できた数を返す。プレイリストがなければ None"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                playlist = await self._lock(conn, user_id, name)
+                if playlist is None:
+                    return None
+                items = items[:max(0, MAX_TRACKS - playlist["track_count"])]
+                if not items:
+                    return 0
+                playlist_id = playlist["playlist_id"]
+                last = await conn.fetchval(
+                    "SELECT max(position) FROM playlist_tracks WHERE playlist_id = $1", playlist_id
+                ) or 0
+                await conn.executemany(
+                    "INSERT INTO playlist_tracks (playlist_id, position, url, title, duration) VALUES ($1, $2, $3, $4, $5)",
+                    [(playlist_id, last + i * POSITION_GAP, url, title, duration)
+                     for i, (url, title, duration) in enumerate(items, start=1)]
+                )
+                await conn.execute(
+                    "UPDATE playlists SET track_count = track_count + $2 WHERE playlist_id = $1", playlist_id, len(items)
+                )
+        return len(items)
+
+    async def remove(self, user_id: int, name: str, number: int):
+        """number 曲目（1始まり）を削除して、その曲の行を返す。なければ None"""
+        if number < 1:
+            return None
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                playlist = await self._lock(conn, user_id, name)
+                if playlist is None:
+                    return None
+                playlist_id = playlist["playlist_id"]
+                row = await conn.fetchrow("""
+                    DELETE FROM playlist_tracks WHERE track_id = (
+                        SELECT track_id FROM playlist_tracks WHERE playlist_id = $1
+                        ORDER BY position OFFSET $2 LIMIT 1
+                    )
+                    RETURNING url, title
+                """, playlist_id, number - 1)
+                if row is not None:
+                    await conn.execute(
+                        "UPDATE playlists SET track_count = track_count - 1 WHERE playlist_id = $1", playlist_id
+                    )
+        return row
+
+    async def move(self, user_id: int, name: str, number: int, to: int) -> bool:
+        """number 曲目を to 番目へ移す。書き換えるのは移す曲の position だけ"""
+        if number == to:
+            return True
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                playlist = await self._lock(conn, user_id, name)
+                if playlist is None or not (1 <= number <= playlist["track_count"] and 1 <= to <= playlist["track_count"]):
+                    return False
+                playlist_id = playlist["playlist_id"]
+                track_id = await conn.fetchval(
+                    "SELECT track_id FROM playlist_tracks WHERE playlist_id = $1 ORDER BY position OFFSET $2 LIMIT 1",
+                    playlist_id, number - 1
+                )
+                if track_id is None:
+                    return False
+                position = await self._position_for(conn, playlist_id, number, to)
+                if position is None:
+                    # 間が詰まっていたら振り直してからもう一度
+                    await self._renumber(conn, playlist_id)
+                    position = await self._position_for(conn, playlist_id, number, to)
+                await conn.execute("UPDATE playlist_tracks SET position = $2 WHERE track_id = $1", track_id, position)
+        return True
+
+    async def _lock(self, conn, user_id: int, name: str):
+        return await conn.fetchrow(
+            "SELECT playlist_id, track_count FROM playlists WHERE user_id = $1 AND name = $2 FOR UPDATE", user_id, name
+        )
+
+    async def _position_for(self, conn, playlist_id: int, number: int, to: int) -> int | None:
+        """number 曲目を to 番目に置くための position。前後の曲の間に余地がなければ None"""
+        # 下へ移すなら今の to 番目の後ろ、上へ移すなら今の to 番目の前に入れる
+        offset = to - 1 if to > number else to - 2
+        rows = await conn.fetch(
+            "SELECT position FROM playlist_tracks WHERE playlist_id = $1 ORDER BY position OFFSET $2 LIMIT 2",
+            playlist_id, max(offset, 0)
+        )
+        if not rows:
+            return None
+        if offset < 0:
+            # 先頭へ
+            return rows[0]["position"] - POSITION_GAP
+        if len(rows) < 2:
+            # 末尾へ
+            return rows[0]["position"] + POSITION_GAP
+        low, high = rows[0]["position"], rows[1]["position"]
+        if high - low < 2:
+            return None
+        return (low + high) // 2
+
+    async def _renumber(self, conn, playlist_id: int):
+        await conn.execute("""
+            UPDATE playlist_tracks t SET position = r.rn * $2
+            FROM (
+                SELECT track_id, row_number() OVER (ORDER BY position) AS rn
+                FROM playlist_tracks WHERE playlist_id = $1
+            ) r
+            WHERE t.track_id = r.track_id
+        """, playlist_id, POSITION_GAP)
@@ -0,0 +1,180 @@
+import time
+import hashlib
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+# 状態を保持する (guild_id, user_id) の上限（超えたら最後の投稿が古い順に捨てる）
+MAX_TRACKED = 50000
+
+# ルール名 -> (設定キー, 既定値 "件数/秒数", 表示名)。"0" や "off" で無効
+# 既定で有効なのは従来からある連投だけ。ほかは /spam_set_rule で有効にしたサーバーだけで使う
+RULES = {
+    "burst": ("spam_limit", "5/1", "連投"),
+    "sustained": ("spam_sustained", "off", "継続的な連投"),
+    "duplicate": ("spam_duplicate", "off", "同じ内容の連投"),
+    "mentions": ("spam_mentions", "off", "メンション爆撃"),
+}
+# これより短い投稿（「w」「草」など）は同じ内容の連投として数えない
+DUPLICATE_MIN_LENGTH = 4
+
+
+@lru_cache(maxsize=256)
+def parse_rule(value: str | None, default: str) -> tuple[int, float] | None:
+    """ "件数/秒数" を (件数, 秒数) に。"5" だけなら秒数は1。無効なら None"""
+    raw = (value or default).strip().lower()
+    if raw in ("0", "off", "none", ""):
+        return None
+    try:
+        count, _, seconds = raw.partition("/")
+        limit, window = int(count), float(seconds or 1)
+    except ValueError:
+        # 壊れた設定値は既定値で動かす
+        return parse_rule(None, default)
+    if limit <= 0 or window <= 0:
+        return None
+    return limit, window
+
+
+def rules_from_settings(settings: dict[str, str]) -> dict[str, tuple[int, float]]:
+    rules = {}
+    for name, (key, default, _) in RULES.items():
+        rule = parse_rule(settings.get(key), default)
+        if rule is not None:
+            rules[name] = rule
+    return rules
+
+
+class SlidingWindow:
+    """直近 limit 件の時刻だけを持つリングバッファ。古い時刻は押し出されるので掃除はいらない"""
+
+    __slots__ = ("times",)
+
+    def __init__(self, limit: int):
+        self.times: deque[float] = deque(maxlen=limit)
+
+    def hit(self, now: float, limit: int, window: float) -> bool:
+        if self.times.maxlen != limit:
+            self.times = deque(self.times, maxlen=limit)
+        self.times.append(now)
+        # limit 件目を入れた時点で、最古のものが window 秒以内なら超過
+        return len(self.times) == limit and now - self.times[0] <= window
+
+
+class TokenBucket:
+    """重み付きの回数制限（メンション数など）。残量は参照時にまとめて補充する"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: int, now: float):
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, now: float, cost: int, capacity: int, window: float) -> bool:
+        """cost 分を使う。足りなければ True（超過）"""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * capacity / window)
+        self.updated = now
+        self.tokens -= cost
+        return self.tokens < 0
+
+
+class UserState:
+    __slots__ = ("last_seen", "burst", "sustained", "duplicate", "last_digest", "mentions")
+
+    def __init__(self, now: float):
+        self.last_seen = now
+        self.burst: SlidingWindow | None = None
+        self.sustained: SlidingWindow | None = None
+        self.duplicate: SlidingWindow | None = None
+        self.last_digest: bytes | None = None
+        self.mentions: TokenBucket | None = None
+
+
+class RateLimiter:
+    """(guild_id, user_id) ごとのスパム判定。1メッセージあたりO(1)で、定期的な掃除タスクは持たない"""
+
+    def __init__(self, max_tracked: int = MAX_TRACKED):
+        self.max_tracked = max_tracked
+        # 最後に投稿した順に並ぶ（先頭が一番古い）
+        self.states: OrderedDict[tuple[int, int], UserState] = OrderedDict()
+        # 有効なルールの窓の最大（サーバー設定でより長い窓が来たら check で広げる）
+        self.max_window = max(
+            (rule[1] for rule in (parse_rule(None, default) for _, default, _ in RULES.values()) if rule),
+            default=1.0
+        )
+        self.checked = 0
+        self.triggered: dict[str, int] = {name: 0 for name in RULES}
+
+    def _state(self, key: tuple[int, int], now: float) -> UserState:
+        state = self.states.get(key)
+        if state is None:
+            state = UserState(now)
+            self.states[key] = state
+        else:
+            self.states.move_to_end(key)
+        state.last_seen = now
+        self._expire(now)
+        return state
+
+    def _expire(self, now: float):
+        # 先頭から「どのルールの窓にも入らないほど古い」ものだけ捨てる（償却O(1)）
+        states = self.states
+        while states:
+            oldest = next(iter(states.values()))
+            if len(states) <= self.max_tracked and now - oldest.last_seen <= self.max_window:
+                break
+            states.popitem(last=False)
+
+    def check(self, guild_id: int, user_id: int, content: str, mentions: int,
+              rules: dict[str, tuple[int, float]], now: float | None = None) -> str | None:
+        """投稿を1件記録し、超えたルール名を返す（なければ None）"""
+        now = time.monotonic() if now is None else now
+        self.checked += 1
+        for _, window in rules.values():
+            if window > self.max_window:
+                self.max_window = window
+        state = self._state((guild_id, user_id), now)
+        hit = None
+
+        for name in ("burst", "sustained"):
+            rule = rules.get(name)
+            if rule is None:
+                continue
+            window = getattr(state, name)
+            if window is None:
+                window = SlidingWindow(rule[0])
+                setattr(state, name, window)
+            if window.hit(now, *rule) and hit is None:
+                hit = name
+
+        rule = rules.get("duplicate")
+        if rule is not None and len(content.strip()) >= DUPLICATE_MIN_LENGTH:
+            digest = hashlib.blake2b(content.encode("utf-8"), digest_size=8).digest()
+            if state.duplicate is None or digest != state.last_digest:
+                # 内容が変わったら数え直す
+                state.duplicate = SlidingWindow(rule[0])
+                state.last_digest = digest
+            if state.duplicate.hit(now, *rule) and hit is None:
+                hit = "duplicate"
+
+        rule = rules.get("mentions")
+        if rule is not None and mentions:
+            if state.mentions is None:
+                state.mentions = TokenBucket(rule[0], now)
+            if state.mentions.take(now, mentions, *rule) and hit is None:
+                hit = "mentions"
+
+        if hit is not None:
+            self.triggered[hit] += 1
+            # 処罰したら数え直す（タイムアウト明けにすぐ再検知しないように）
+            self.reset(guild_id, user_id)
+        return hit
+
+    def reset(self, guild_id: int, user_id: int):
+        self.states.pop((guild_id, user_id), None)
+
+    def get_stats(self) -> dict:
+        return {
+            "tracked": len(self.states),
+            "checked": self.checked,
+            **{f"triggered_{name}": count for name, count in self.triggered.items()},
+        }
@@ -0,0 +1,134 @@
+import os
+import time
+
+# 1回に取り出して配信する件数
+DELIVERY_BATCH = int(os.getenv("REMINDER_DELIVERY_BATCH", 100))
+# 配信中として確保しておく時間（この間に終わらなければ再配信される）
+LEASE_SECONDS = float(os.getenv("REMINDER_LEASE_SECONDS", 60))
+# 配信失敗時の再試行
+MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", 5))
+RETRY_BASE_DELAY = float(os.getenv("REMINDER_RETRY_BASE_DELAY", 30))
+# 1人あたりの上限
+MAX_PER_USER = int(os.getenv("REMINDER_MAX_PER_USER", 25))
+
+
+class ReminderStore:
+    """リマインダーをDBに保存する。期限の近い順に取り出せるよう due_at に索引を張る"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def init(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS reminders (
+                    reminder_id BIGSERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    guild_id BIGINT,
+                    channel_id BIGINT,
+                    message TEXT NOT NULL,
+                    due_at DOUBLE PRECISION NOT NULL,
+                    scheduled_at DOUBLE PRECISION,
+                    interval_seconds INTEGER,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT NOW()
+                );
+            """)
+            # due_at は次に配信を試す時刻（確保・再試行でずれる）、scheduled_at は本来の予定時刻
+            await conn.execute("ALTER TABLE reminders ADD COLUMN IF NOT EXISTS scheduled_at DOUBLE PRECISION")
+            await conn.execute("UPDATE reminders SET scheduled_at = due_at WHERE scheduled_at IS NULL")
+            await conn.execute("CREATE INDEX IF NOT EXISTS reminders_due_at ON reminders (due_at)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS reminders_user_id ON reminders (user_id)")
+
+    async def add(self, user_id: int, guild_id: int | None, channel_id: int | None, message: str,
+                  due_at: float, interval_seconds: int | None = None) -> int | None:
+        """登録して reminder_id を返す。上限を超えていれば None"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("""
+                INSERT INTO reminders (user_id, guild_id, channel_id, message, due_at, scheduled_at, interval_seconds)
+                SELECT $1, $2, $3, $4, $5, $5, $6
+                WHERE (SELECT count(*) FROM reminders WHERE user_id = $1) < $7
+                RETURNING reminder_id
+            """, user_id, guild_id, channel_id, message, due_at, interval_seconds, MAX_PER_USER)
+
+    async def list_for_user(self, user_id: int) -> list:
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(
+                "SELECT reminder_id, message, due_at, interval_seconds FROM reminders WHERE user_id = $1 ORDER BY due_at",
+                user_id
+            )
+
+    async def cancel(self, user_id: int, reminder_id: int) -> bool:
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("DELETE FROM reminders WHERE reminder_id = $1 AND user_id = $2", reminder_id, user_id)
+        return result != "DELETE 0"
+
+    async def next_due(self) -> float | None:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("SELECT min(due_at) FROM reminders")
+
+    async def claim_due(self, now: float | None = None) -> list:
+        """期限が来たものを最大 DELIVERY_BATCH 件確保する。
+
+        due_at を LEASE_SECONDS 先にずらすことで確保とし、配信前に落ちても後で再配信される。
+        """
+        now = time.time() if now is None else now
+        async with self.pool.acquire() as conn:
+            # 繰り返しの次回は scheduled_at（本来の予定時刻）を基準にする
+            return await conn.fetch("""
+                WITH due AS (
+                    SELECT reminder_id FROM reminders
+                    WHERE due_at <= $1
+                    ORDER BY due_at
+                    LIMIT $3
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE reminders r SET due_at = $2
+                FROM due
+                WHERE r.reminder_id = due.reminder_id
+                RETURNING r.reminder_id, r.user_id, r.guild_id, r.channel_id, r.message,
+                          r.scheduled_at, r.interval_seconds, r.attempts
+            """, now, now + LEASE_SECONDS, DELIVERY_BATCH)
+
+    async def complete(self, delivered: list, failed: list, now: float | None = None):
+        """配信結果をまとめて反映する。delivered / failed は claim_due の行"""
+        now = time.time() if now is None else now
+        done, rescheduled, retry = [], [], []
+
+        def next_occurrence(row) -> float:
+            # 止まっていた間の分は飛ばす
+            interval = row["interval_seconds"]
+            scheduled = row["scheduled_at"]
+            skipped = max(0, int((now - scheduled) // interval))
+            return scheduled + (skipped + 1) * interval
+
+        for row in delivered:
+            if row["interval_seconds"]:
+                rescheduled.append((row["reminder_id"], next_occurrence(row)))
+            else:
+                done.append(row["reminder_id"])
+        for row in failed:
+            attempts = row["attempts"] + 1
+            if attempts < MAX_ATTEMPTS:
+                # 再試行は due_at だけずらす（予定時刻はそのまま）
+                retry.append((row["reminder_id"], now + RETRY_BASE_DELAY * 2 ** (attempts - 1), attempts))
+            elif row["interval_seconds"]:
+                print(f"[Reminder] {row['reminder_id']} は {attempts} 回失敗したので今回分を飛ばします。")
+                rescheduled.append((row["reminder_id"], next_occurrence(row)))
+            else:
+                print(f"[Reminder] {row['reminder_id']} は {attempts} 回失敗したので破棄します。")
+                done.append(row["reminder_id"])
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if done:
+                    await conn.execute("DELETE FROM reminders WHERE reminder_id = ANY($1::BIGINT[])", done)
+                if rescheduled:
+                    await conn.executemany(
+                        "UPDATE reminders SET due_at = $2, scheduled_at = $2, attempts = 0 WHERE reminder_id = $1",
+                        rescheduled
+                    )
+                if retry:
+                    await conn.executemany(
+                        "UPDATE reminders SET due_at = $2, attempts = $3 WHERE reminder_id = $1", retry
+                    )
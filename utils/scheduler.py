@@ -0,0 +1,155 @@
+import time
+import heapq
+import asyncio
+import datetime
+import itertools
+
+# 長い待ちでも時計の変更に追従できるよう、これ以上先の期限でも一度起きて確認する（秒）
+MAX_SLEEP = 300.0
+
+
+class Job:
+    """期限付きの処理1件。cancel されたものはヒープに残ったまま、取り出したときに捨てる"""
+
+    __slots__ = ("key", "when", "callback", "args", "interval", "cancelled")
+
+    def __init__(self, key: str, when: float, callback, args: tuple, interval):
+        self.key = key
+        self.when = when  # UNIX時刻（秒）
+        self.callback = callback
+        self.args = args
+        # 繰り返す場合は 現在の when -> 次の when を返す関数
+        self.interval = interval
+        self.cancelled = False
+
+
+class Scheduler:
+    """プロセス内のタイマー。ヒープで期限順に持ち、一番近い期限にだけタイマーを張る。
+
+    投票の締め切り・リマインダー・日次処理などで共有する（bot.scheduler）。
+    key は "poll:123" のように用途ごとに名前空間を付ける。同じ key で登録し直すと置き換わる。
+    """
+
+    def __init__(self):
+        self.heap: list[tuple[float, int, Job]] = []
+        self.jobs: dict[str, Job] = {}
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_when: float | None = None
+        self.running: set[asyncio.Task] = set()
+        self.fired = 0
+        self.errors = 0
+
+    # === 登録 ===
+
+    def schedule(self, key: str, when: float, callback, *args, interval=None) -> Job:
+        """UNIX時刻 when に await callback(*args) を実行する"""
+        self.cancel(key)
+        job = Job(key, when, callback, args, interval)
+        self.jobs[key] = job
+        heapq.heappush(self.heap, (when, next(self._seq), job))
+        if self._timer_when is None or when < self._timer_when:
+            self._arm()
+        return job
+
+    def call_later(self, key: str, delay: float, callback, *args) -> Job:
+        return self.schedule(key, time.time() + delay, callback, *args)
+
+    def every(self, key: str, seconds: float, callback, *args) -> Job:
+        """seconds ごとに繰り返す（初回は seconds 後）"""
+        return self.schedule(key, time.time() + seconds, callback, *args, interval=lambda when: when + seconds)
+
+    def every_day(self, key: str, at: datetime.time, callback, *args) -> Job:
+        """毎日 at（UTC）に繰り返す"""
+        return self.schedule(key, next_daily(at), callback, *args, interval=lambda when: next_daily(at, when))
+
+    def cancel(self, key: str) -> bool:
+        job = self.jobs.pop(key, None)
+        if job is None:
+            return False
+        job.cancelled = True
+        return True
+
+    def get(self, key: str) -> Job | None:
+        return self.jobs.get(key)
+
+    # === 実行 ===
+
+    def _arm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._timer_when = None
+        # 先頭の取り消し済みを捨てる
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return
+        when = self.heap[0][0]
+        delay = min(max(0.0, when - time.time()), MAX_SLEEP)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._fire)
+        self._timer_when = when
+
+    def _fire(self):
+        self._timer = None
+        self._timer_when = None
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            _, _, job = heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+            if job.interval is not None:
+                # 繰り返しは次回分を先に積む（実行が長引いても遅れない）
+                job.when = job.interval(job.when)
+                while job.when <= now:
+                    job.when = job.interval(job.when)
+                heapq.heappush(self.heap, (job.when, next(self._seq), job))
+            else:
+                self.jobs.pop(job.key, None)
+            self._run(job)
+        self._arm()
+
+    def _run(self, job: Job):
+        self.fired += 1
+        task = asyncio.create_task(job.callback(*job.args))
+        self.running.add(task)
+        task.add_done_callback(lambda t: self._done(job, t))
+
+    def _done(self, job: Job, task: asyncio.Task):
+        self.running.discard(task)
+        if task.cancelled():
+            return
+        e = task.exception()
+        if e is not None:
+            self.errors += 1
+            print(f"[Scheduler] {job.key} の実行に失敗: {e!r}")
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._timer_when = None
+        for task in self.running:
+            task.cancel()
+        self.heap.clear()
+        self.jobs.clear()
+
+    def get_stats(self) -> dict:
+        next_job = min((job.when for job in self.jobs.values()), default=None)
+        return {
+            "scheduled": len(self.jobs),
+            "heap_size": len(self.heap),
+            "running": len(self.running),
+            "fired": self.fired,
+            "errors": self.errors,
+            "next_in": next_job - time.time() if next_job is not None else None,
+        }
+
+
+def next_daily(at: datetime.time, after: float | None = None) -> float:
+    """after（UNIX時刻、省略時は現在）より後で、最初に UTC の at になる時刻"""
+    base = datetime.datetime.fromtimestamp(time.time() if after is None else after, datetime.timezone.utc)
+    candidate = datetime.datetime.combine(base.date(), at, tzinfo=datetime.timezone.utc)
+    if candidate.timestamp() <= base.timestamp():
+        candidate += datetime.timedelta(days=1)
+    return candidate.timestamp()
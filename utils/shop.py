@@ -1,9 +1,11 @@
-import aiohttp
+import uuid
 import logging
 import json
 from pathlib import Path
 
-BASE_URL = "http://localhost:8000/api/shop"  # 仮のAPIエンドポイント
+from utils import http_client
+
+SERVICE = "shop"  # 接続先は SHOP_API_URL（utils/http_client.py）
 logger = logging.getLogger(__name__)
 
 # JSON定義ファイルのパス（Botが販売する公式アイテム定義）
@@ -35,60 +37,60 @@ def get_item_definition(item_id: str) -> dict | None:
 
 async def fetch_shop_items() -> list[dict]:
     """現在販売中のショップアイテムリスト（API + JSON連携）"""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{BASE_URL}/items") as resp:
-            if resp.status == 200:
-                db_items = await resp.json()
-                full_items = []
-                for item in db_items:
-                    item_id = item.get("item_id")
-                    item_def = get_item_definition(item_id)
-                    if not item_def:
-                        continue  # 定義されていないアイテムは除外
-                    # DB + JSONマージ
-                    full_items.append({
-                        "shop_item_id": item["shop_item_id"],
-                        "item_id": item_id,
-                        "name": item_def["name"],
-                        "description": item_def["description"],
-                        "price": item["price"],
-                        "stock": item["stock"],
-                        "daily_reset": item["daily_reset"],
-                        "max_daily_stock": item["max_daily_stock"],
-                        "max_own": item_def["max_own"],
-                        "weekly_limit": item_def["weekly_limit"],
-                        "daily_limit": item_def["daily_limit"],
-                        "active": item["active"]
-                    })
-                return full_items
-            logger.error(f"Failed to fetch shop items. Status: {resp.status}")
-            return []
+    resp = await http_client.request(SERVICE, "GET", "/items")
+    if resp.status == 200:
+        db_items = resp.data
+        full_items = []
+        for item in db_items:
+            item_id = item.get("item_id")
+            item_def = get_item_definition(item_id)
+            if not item_def:
+                continue  # 定義されていないアイテムは除外
+            # DB + JSONマージ
+            full_items.append({
+                "shop_item_id": item["shop_item_id"],
+                "item_id": item_id,
+                "name": item_def["name"],
+                "description": item_def["description"],
+                "price": item["price"],
+                "stock": item["stock"],
+                "daily_reset": item["daily_reset"],
+                "max_daily_stock": item["max_daily_stock"],
+                "max_own": item_def["max_own"],
+                "weekly_limit": item_def["weekly_limit"],
+                "daily_limit": item_def["daily_limit"],
+                "active": item["active"]
+            })
+        return full_items
+    logger.error(f"Failed to fetch shop items. Status: {resp.status}")
+    return []
 
 
 async def fetch_item_stock(item_id: str) -> int:
     """指定アイテムの在庫数を取得（DB依存）"""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{BASE_URL}/items/{item_id}") as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                return data.get("stock", 0)
-            logger.error(f"Failed to fetch stock for {item_id}. Status: {resp.status}")
-            return 0
+    resp = await http_client.request(SERVICE, "GET", f"/items/{item_id}")
+    if resp.status == 200:
+        return resp.data.get("stock", 0)
+    logger.error(f"Failed to fetch stock for {item_id}. Status: {resp.status}")
+    return 0
 
 
 async def purchase_item(gov_id: str, item_id: str, amount: int = 1) -> bool:
-    """購入処理：在庫を減らす + 経済DBと連携"""
+    """購入処理：在庫の引き当て・代金の引き落とし・アイテム付与をサーバー側で1トランザクションで行う"""
     payload = {
         "gov_id": gov_id,
         "item_id": item_id,
         "amount": amount
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{BASE_URL}/buy", json=payload) as resp:
-            if resp.status == 200:
-                return True
-            logger.error(f"Failed to purchase {item_id} x{amount} for {gov_id}. Status: {resp.status}")
-            return False
+    # 再送しても二重購入にならないよう Idempotency-Key を付ける
+    resp = await http_client.request(
+        SERVICE, "POST", "/buy", json=payload,
+        headers={"Idempotency-Key": uuid.uuid4().hex}, retries=http_client.MAX_RETRIES
+    )
+    if resp.status == 200:
+        return True
+    logger.error(f"Failed to purchase {item_id} x{amount} for {gov_id}. Status: {resp.status}")
+    return False
 
 
 async def restock_item(item_id: str, amount: int) -> bool:
@@ -97,19 +99,17 @@ async def restock_item(item_id: str, amount: int) -> bool:
         "item_id": item_id,
         "amount": amount,
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{BASE_URL}/restock", json=payload) as resp:
-            if resp.status == 200:
-                return True
-            logger.error(f"Failed to restock {item_id}. Status: {resp.status}")
-            return False
+    resp = await http_client.request(SERVICE, "POST", "/restock", json=payload)
+    if resp.status == 200:
+        return True
+    logger.error(f"Failed to restock {item_id}. Status: {resp.status}")
+    return False
 
 
 async def reset_daily_stock() -> bool:
     """毎日の在庫リセット"""
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{BASE_URL}/reset") as resp:
-            if resp.status == 200:
-                return True
-            logger.error("Failed to reset daily shop stock.")
-            return False
+    resp = await http_client.request(SERVICE, "POST", "/reset")
+    if resp.status == 200:
+        return True
+    logger.error("Failed to reset daily shop stock.")
+    return False
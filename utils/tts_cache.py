@@ -0,0 +1,208 @@
+import os
+import re
+import asyncio
+import hashlib
+import unicodedata
+from collections import OrderedDict
+
+# メモリ側・ディスク側の上限
+MEMORY_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MEMORY_MB", 32)) * 1024 * 1024)
+DISK_MAX_BYTES = int(float(os.getenv("TTS_CACHE_DISK_MB", 256)) * 1024 * 1024)
+# これより長い文はほぼ繰り返されないのでキャッシュしない
+MAX_CHARS = int(os.getenv("TTS_CACHE_MAX_CHARS", 40))
+# VoiceVoxのバージョンや合成パラメータを変えたときに上げる
+CACHE_VERSION = os.getenv("TTS_CACHE_VERSION", "1")
+CACHE_DIR = os.path.join("data", "tts_cache")
+
+_spaces = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """全角半角・空白の揺れをそろえる（合成にもこの文を使う）"""
+    return _spaces.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class TTSCache:
+    """合成済み音声のキャッシュ。キーは (話者ID, 辞書適用後の文, CACHE_VERSION) のハッシュ"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.memory: OrderedDict[str, bytes] = OrderedDict()
+        self.memory_bytes = 0
+        # key -> ファイルサイズ（古い順）
+        self.disk: OrderedDict[str, int] = OrderedDict()
+        self.disk_bytes = 0
+        # 同じキーの合成が同時に走らないようにする
+        self.inflight: dict[str, asyncio.Future] = {}
+        # 統計
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(voice_id: int, text: str) -> str:
+        raw = f"{CACHE_VERSION}\0{voice_id}\0{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".wav")
+
+    # ---------- ディスク ----------
+
+    def _scan_disk(self) -> list[tuple[float, str, int]]:
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for sub in os.listdir(self.cache_dir):
+            subdir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                if name.endswith(".wav"):
+                    st = os.stat(os.path.join(subdir, name))
+                    entries.append((st.st_mtime, name[:-4], st.st_size))
+        return sorted(entries)
+
+    async def load(self):
+        """起動時にディスク上のキャッシュを索引に読み込む"""
+        for _, key, size in await asyncio.to_thread(self._scan_disk):
+            self.disk[key] = size
+            self.disk_bytes += size
+        await self._evict_disk()
+
+    def _read_file(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # 最近使った順を保つ
+            return data
+        except OSError:
+            return None
+
+    def _write_file(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _remove_files(self, keys: list[str]):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    async def _evict_disk(self):
+        removed = []
+        while self.disk_bytes > DISK_MAX_BYTES and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            removed.append(key)
+        if removed:
+            self.evictions += len(removed)
+            await asyncio.to_thread(self._remove_files, removed)
+
+    # ---------- メモリ ----------
+
+    def _remember(self, key: str, data: bytes):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > MEMORY_MAX_BYTES and self.memory:
+            _, old = self.memory.popitem(last=False)
+            self.memory_bytes -= len(old)
+
+    # ---------- 取得 ----------
+
+    async def get(self, key: str) -> bytes | None:
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+        if key in self.disk:
+            data = await asyncio.to_thread(self._read_file, key)
+            if data is not None:
+                self.disk.move_to_end(key)
+                self._remember(key, data)
+                self.disk_hits += 1
+                return data
+            # ファイルが消えていた
+            self.disk_bytes -= self.disk.pop(key)
+        return None
+
+    async def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        if key in self.disk:
+            return
+        try:
+            await asyncio.to_thread(self._write_file, key, data)
+        except OSError as e:
+            print(f"[TTSCache] 書き込みに失敗: {e}")
+            return
+        self.disk[key] = len(data)
+        self.disk_bytes += len(data)
+        await self._evict_disk()
+
+    async def get_or_synthesize(self, voice_id: int, text: str, synthesize) -> bytes:
+        """キャッシュにあればそれを返し、なければ synthesize() で合成して保存する"""
+        if len(text) > MAX_CHARS:
+            self.skipped += 1
+            return await synthesize()
+
+        key = self.make_key(voice_id, text)
+        data = await self.get(key)
+        if data is not None:
+            return data
+
+        # 同じ文を別のギルドが合成中ならその結果を待つ
+        pending = self.inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            data = await synthesize()
+            future.set_result(data)
+        except Exception as e:
+            future.set_exception(e)
+            # 待っている人がいなくても例外が未回収にならないように
+            future.exception()
+            raise
+        except asyncio.CancelledError:
+            # 待っている側まで止まらないよう、通常の例外として渡す
+            future.set_exception(RuntimeError("synthesis cancelled"))
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+        await self.put(key, data)
+        return data
+
+    def get_stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits + self.coalesced
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": len(self.disk),
+            "disk_bytes": self.disk_bytes,
+            "evictions": self.evictions,
+        }
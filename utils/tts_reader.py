@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+# ギルドごとの未合成キューの上限（超えたら古いものから捨てる）
+QUEUE_MAX = int(os.getenv("TTS_QUEUE_MAX", 20))
+# 再生待ちとして先に合成しておく件数
+PREFETCH = int(os.getenv("TTS_PREFETCH", 2))
+# 同じ人の連続投稿をまとめるときの最大文字数
+MERGE_MAX_CHARS = int(os.getenv("TTS_MERGE_MAX_CHARS", 120))
+# これより古い発言は読まずに捨てる（秒）
+MAX_AGE = float(os.getenv("TTS_MAX_AGE", 30))
+
+
+class Utterance:
+    """読み上げ1回分"""
+
+    def __init__(self, author_id: int, voice_channel, text: str, voice_id: int):
+        self.author_id = author_id
+        self.voice_channel = voice_channel
+        self.text = text
+        self.voice_id = voice_id
+        self.enqueued_at = time.perf_counter()
+        self.audio: bytes | None = None
+
+    def can_merge(self, other: "Utterance") -> bool:
+        return (
+            self.author_id == other.author_id
+            and self.voice_id == other.voice_id
+            and self.voice_channel == other.voice_channel
+            and len(self.text) + len(other.text) + 1 <= MERGE_MAX_CHARS
+        )
+
+
+class ReaderStats:
+    def __init__(self):
+        self.enqueued = 0
+        self.merged = 0
+        self.dropped = 0
+        self.stale = 0
+        self.synthesized = 0
+        self.played = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record_latency(self, latency: float):
+        self.played += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def to_dict(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "synthesized": self.synthesized,
+            "played": self.played,
+            "errors": self.errors,
+            "max_depth": self.max_depth,
+            "avg_latency_ms": self.latency_total / self.played * 1000 if self.played else 0.0,
+            "max_latency_ms": self.latency_max * 1000,
+        }
+
+
+class GuildReader:
+    """1ギルド分の読み上げ。合成と再生を別タスクにして、再生中に次の発言を合成しておく"""
+
+    def __init__(self, guild_id: int, synthesize, play):
+        self.guild_id = guild_id
+        # synthesize(utt) -> bytes / play(utt) -> 再生終了まで待つコルーチン
+        self.synthesize = synthesize
+        self.play = play
+        self.pending: deque[Utterance] = deque()
+        self.ready: asyncio.Queue[Utterance] = asyncio.Queue(maxsize=PREFETCH)
+        self.has_pending = asyncio.Event()
+        self.stats = ReaderStats()
+        self.tasks = [
+            asyncio.create_task(self._synth_loop()),
+            asyncio.create_task(self._play_loop()),
+        ]
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending) + self.ready.qsize()
+
+    def submit(self, utt: Utterance) -> str:
+        """キューに積む。戻り値は "queued" / "merged"（古いものを捨てた場合も "queued"）"""
+        self.stats.enqueued += 1
+        # 合成待ちが残っている＝詰まっているので、同じ人の続きなら1回にまとめる
+        if self.pending and self.pending[-1].can_merge(utt):
+            self.pending[-1].text += "、" + utt.text
+            self.stats.merged += 1
+            return "merged"
+
+        if len(self.pending) >= QUEUE_MAX:
+            self.pending.popleft()
+            self.stats.dropped += 1
+        self.pending.append(utt)
+        self.stats.max_depth = max(self.stats.max_depth, self.depth)
+        self.has_pending.set()
+        return "queued"
+
+    async def _synth_loop(self):
+        while True:
+            await self.has_pending.wait()
+            if not self.pending:
+                self.has_pending.clear()
+                continue
+            utt = self.pending.popleft()
+            if time.perf_counter() - utt.enqueued_at > MAX_AGE:
+                self.stats.stale += 1
+                continue
+            try:
+                utt.audio = await self.synthesize(utt)
+                self.stats.synthesized += 1
+            except Exception as e:
+                self.stats.errors += 1
+                print(f"[TTS] guild={self.guild_id} 合成エラー: {e}")
+                continue
+            # 再生待ちが PREFETCH 件たまっていればここで待つ
+            await self.ready.put(utt)
+
+    async def _play_loop(self):
+        while True:
+            utt = await self.ready.get()
+            self.stats.record_latency(time.perf_counter() - utt.enqueued_at)
+            try:
+                await self.play(utt)
+            except Exception as e:
+                self.stats.errors += 1
+                print(f"[TTS] guild={self.guild_id} 再生エラー: {e}")
+
+    def clear(self):
+        self.pending.clear()
+        while not self.ready.empty():
+            self.ready.get_nowait()
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+        self.clear()
+
+    def get_stats(self) -> dict:
+        stats = self.stats.to_dict()
+        stats["depth"] = self.depth
+        return stats